@@ -0,0 +1,85 @@
+"""
+    Builds a synthetic breached-password corpus and reports lookups/sec and
+    resident memory, with and without the Bloom filter in front of the file.
+
+        python benchmarks/breached_passwords.py [--records 2000000] [--lookups 200000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+# the repository, so the package imports from a checkout without installing it
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_simple_accounts import breached_passwords
+
+
+def max_rss_megabytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss / 1024 / 1024
+    return max_rss / 1024
+
+
+def generate_corpus(records, generator):
+    for _ in range(records):
+        yield '{:032x}\n'.format(generator.getrandbits(128))
+
+
+def time_lookups(corpus, passwords):
+    start = time.perf_counter()
+    found = 0
+    for password in passwords:
+        found += corpus.contains(password)
+    elapsed = time.perf_counter() - start
+    return len(passwords) / elapsed, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=2000000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    directory = tempfile.mkdtemp()
+    corpus_path = os.path.join(directory, 'breached.bin')
+
+    start = time.perf_counter()
+    count = breached_passwords.build_corpus(generate_corpus(arguments.records, random.Random(1)), corpus_path)
+    print('built {} records in {:.1f}s ({:.1f} MB file, {:.1f} MB Bloom filter)'.format(
+        count,
+        time.perf_counter() - start,
+        os.path.getsize(corpus_path) / 1024 / 1024,
+        os.path.getsize(breached_passwords.bloom_path_for(corpus_path)) / 1024 / 1024
+    ))
+
+    breached_sample = list(generate_corpus(arguments.lookups, random.Random(1)))
+    breached_sample = [password.rstrip('\n') for password in breached_sample]
+    unseen_sample = ['unseen-{}'.format(generator.getrandbits(64)) for _ in range(arguments.lookups)]
+
+    rss_before = max_rss_megabytes()
+    for use_bloom_filter in (True, False):
+        corpus = breached_passwords.BreachedPasswordCorpus(corpus_path, use_bloom_filter=use_bloom_filter)
+        misses_per_second, _ = time_lookups(corpus, unseen_sample)
+        hits_per_second, found = time_lookups(corpus, breached_sample)
+        print('bloom filter {:<5} unseen: {:>10.0f} lookups/s   breached: {:>10.0f} lookups/s ({} found)'.format(
+            str(use_bloom_filter), misses_per_second, hits_per_second, found
+        ))
+        print('    {}'.format(corpus.stats()))
+        corpus.close()
+
+    print('peak RSS {:.1f} MB ({:.1f} MB while looking up)'.format(max_rss_megabytes(), max_rss_megabytes() - rss_before))
+
+    os.remove(corpus_path)
+    os.remove(breached_passwords.bloom_path_for(corpus_path))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+    Measures how long a fresh worker takes to become useful, with and
+    without LAZY_INITIALIZATION:
+
+        python benchmarks/cold_start.py [--runs 10] [--importtime] [--output results.json]
+
+    Every run is a new interpreter, which times importing the package,
+    creating FlaskSimpleAccounts and serving a first sign_up on an in-memory
+    database, and reports the modules loaded and the peak RSS. Medians are
+    printed per mode.
+
+    --importtime also runs python -X importtime (Python 3.7+) on the import
+    of the package and lists the modules that cost the most.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import datetime
+import platform
+import resource
+import statistics
+import subprocess
+
+
+PASSWORD = 'Benchmark-Password-1234!!abcdEFGH'
+
+MODES = ['eager', 'lazy']
+PHASES = ['import_ms', 'init_ms', 'first_request_ms', 'total_ms']
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def max_rss_kilobytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss // 1024
+    return max_rss
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=REPOSITORY_DIR,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def child_environment():
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [REPOSITORY_DIR, environment.get('PYTHONPATH')]))
+    return environment
+
+
+def measure(mode):
+    """
+        Runs in the child interpreter, and prints its timings as JSON.
+    """
+    started = time.perf_counter()
+    from flask_simple_accounts import FlaskSimpleAccounts, models
+    from flask_simple_accounts.config import Config
+    imported = time.perf_counter()
+    modules_after_import = len(sys.modules)
+
+    from flask import Flask, request, jsonify
+
+    app = Flask(__name__)
+    for key in dir(Config):
+        if key.isupper():
+            app.config[key] = copy.deepcopy(getattr(Config, key))
+    app.config.update(
+        SECRET_KEY='benchmark-secret-key',
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        MAIL_SUPPRESS_SEND=True,
+        SITE_ADDRESS='http://localhost',
+        CUSTOM_PASSWORD_HASHING={'bcrypt_cost': 4},
+        CUSTOM_LAZY_INITIALIZATION={'enabled': mode == 'lazy'},
+    )
+
+    init_started = time.perf_counter()
+    accounts = FlaskSimpleAccounts(models, app)
+    initialized = time.perf_counter()
+
+    app = accounts.app
+    app.add_url_rule('/sign-up', 'sign_up', lambda: jsonify(accounts.sign_up(request)), methods=['POST'])
+    with app.app_context():
+        models.db.create_all()
+
+    request_started = time.perf_counter()
+    response = app.test_client().post('/sign-up', data={'email': 'cold@benchmark.example.com', 'password': PASSWORD})
+    finished = time.perf_counter()
+
+    print(json.dumps({
+        'mode': mode,
+        'succeeded': json.loads(response.get_data(as_text=True))['success'],
+        'import_ms': (imported - started) * 1000,
+        'init_ms': (initialized - init_started) * 1000,
+        'first_request_ms': (finished - request_started) * 1000,
+        'total_ms': (finished - started) * 1000,
+        'modules_after_import': modules_after_import,
+        'modules': len(sys.modules),
+        'max_rss_kb': max_rss_kilobytes(),
+    }))
+
+
+def run_child(mode):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--measure', mode],
+        env=child_environment()
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run_importtime(top):
+    """
+        The modules with the highest cumulative import time, from python -X importtime.
+    """
+    if sys.version_info < (3, 7):
+        return None
+
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import flask_simple_accounts'],
+        env=child_environment(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True
+    )
+    modules = []
+    for line in completed.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+    modules.sort(key=lambda module: module['cumulative_ms'], reverse=True)
+    return modules[:top]
+
+
+def summarize(runs):
+    summary = {'runs': len(runs), 'failures': sum(1 for run in runs if not run['succeeded'])}
+    for key in PHASES + ['modules_after_import', 'modules', 'max_rss_kb']:
+        summary[key] = statistics.median(run[key] for run in runs)
+    return summary
+
+
+def print_results(results):
+    print('{:<6} {:>11} {:>9} {:>17} {:>9} {:>15} {:>8} {:>14}'.format(
+        'mode', 'import ms', 'init ms', 'first request ms', 'total ms', 'import modules', 'modules', 'peak RSS (KB)'
+    ))
+    for mode, summary in results['modes'].items():
+        print('{:<6} {import_ms:>11.1f} {init_ms:>9.1f} {first_request_ms:>17.1f} {total_ms:>9.1f} '
+              '{modules_after_import:>15.0f} {modules:>8.0f} {max_rss_kb:>14.0f}'.format(mode, **summary))
+
+    importtime = results.get('importtime')
+    if importtime is None:
+        return
+    print()
+    print('{:<60} {:>10} {:>14}'.format('module (python -X importtime)', 'self ms', 'cumulative ms'))
+    for module in importtime:
+        print('{module:<60} {self_ms:>10.1f} {cumulative_ms:>14.1f}'.format(**module))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per mode')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--importtime', action='store_true', help='also break the import down with python -X importtime')
+    parser.add_argument('--top', type=int, default=20, help='modules listed by --importtime')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--measure', choices=MODES, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.measure:
+        measure(arguments.measure)
+        return
+
+    results = {
+        'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'git_commit': git_commit(),
+        'options': vars(arguments),
+        'modes': {},
+    }
+
+    # alternate the modes, so a busy machine slows both alike
+    runs = {mode: [] for mode in arguments.modes}
+    for _ in range(arguments.runs):
+        for mode in arguments.modes:
+            runs[mode].append(run_child(mode))
+    for mode in arguments.modes:
+        results['modes'][mode] = summarize(runs[mode])
+
+    if arguments.importtime:
+        results['importtime'] = run_importtime(arguments.top)
+        if results['importtime'] is None:
+            print('python -X importtime needs Python 3.7 or later', file=sys.stderr)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+    Renders verification emails, html and text, the way a campaign that
+    re-verifies every user would, and compares the compiled template cache
+    with compiling the template source again for every message.
+
+        python benchmarks/email_templates.py [--messages 20000] [--repeat 5]
+"""
+import os
+import sys
+import argparse
+import timeit
+
+# the repository, so the package imports from a checkout without installing it
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jinja2
+
+from flask_simple_accounts.email_templates import EmailTemplates
+
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'flask_simple_accounts', 'templates', 'email'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+
+    contexts = [
+        {
+            'subject': 'Email Verification',
+            'email': 'user-{}@benchmark.example.com'.format(number),
+            'verification_link': 'https://example.com/verify-email?verification_code={:032x}'.format(number),
+            'hours_valid': 24,
+        }
+        for number in range(arguments.messages)
+    ]
+
+    email_templates = EmailTemplates([TEMPLATE_DIR])
+
+    def cached():
+        for context in contexts:
+            email_templates.render('basic', 'verification', 'en', 'html', context)
+            email_templates.render('basic', 'verification', 'en', 'txt', context)
+
+    sources = {}
+    for file_format in ('html', 'txt'):
+        with open(os.path.join(TEMPLATE_DIR, 'basic', 'verification.' + file_format), encoding='utf-8') as template_file:
+            sources[file_format] = template_file.read()
+
+    def compiled_per_message():
+        environment = jinja2.Environment(autoescape=True)
+        for context in contexts[:arguments.messages // 100 or 1]:
+            environment.from_string(sources['html']).render(context)
+            environment.from_string(sources['txt']).render(context)
+
+    cases = [
+        ('compiled once, cached', cached, arguments.messages),
+        ('compiled for every message', compiled_per_message, arguments.messages // 100 or 1),
+    ]
+
+    print('{:<30} {:>16} {:>12}'.format('templates', 'messages/s', 'us/message'))
+    for label, run, messages in cases:
+        seconds = min(timeit.repeat(run, number=1, repeat=arguments.repeat))
+        print('{:<30} {:>16.0f} {:>12.1f}'.format(label, messages / seconds, seconds / messages * 1000000))
+
+
+if __name__ == '__main__':
+    main()
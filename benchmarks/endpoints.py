@@ -0,0 +1,353 @@
+"""
+    Drives every account operation through a Flask test app and reports
+    ops/sec, p50/p95/p99 latency, DB queries per op and peak memory.
+
+        python benchmarks/endpoints.py [--databases memory file] [--costs 4 10]
+                                       [--concurrency 1 4 16] [--users 20]
+                                       [--mail-queue] [--output results.json]
+
+    Each virtual user runs the whole account life cycle:
+
+        sign_up, verify_email, log_in, change_password, change_email,
+        verify_email, log_in, log_out, log_in, delete_account
+
+    (verifying a new email ends the session, which is keyed by email)
+
+    against SQLite and a local SMTPSink, from which the verification links
+    are read back. Every database and bcrypt cost runs in a fresh process,
+    so each starts with cold caches and its own query counters. The in-memory
+    database is a single connection shared by all threads, so it only runs
+    at concurrency 1.
+
+    --output writes the results with the Python version, platform and git
+    commit, so runs of two versions can be compared.
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import argparse
+import datetime
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+import concurrent.futures
+
+
+PASSWORD = 'Benchmark-Password-1234!!abcdEFGH'
+NEW_PASSWORD = 'Changed-Password-5678!!wxyzABCD'
+
+OPERATIONS = [
+    'sign_up', 'verify_email', 'log_in', 'change_password',
+    'change_email', 'log_out', 'delete_account',
+]
+
+VERIFICATION_CODE = re.compile(r'verification_code=([A-Za-z0-9_.\-]+)')
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def max_rss_kilobytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss // 1024
+    return max_rss
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=REPOSITORY_DIR,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_app(database_uri, bcrypt_cost, smtp_sink, mail_queue):
+    from flask import Flask, request, jsonify
+    from flask_simple_accounts import FlaskSimpleAccounts, models
+    from flask_simple_accounts.config import Config
+
+    app = Flask(__name__)
+    for key in dir(Config):
+        if key.isupper():
+            app.config[key] = copy.deepcopy(getattr(Config, key))
+
+    app.config.update(
+        SECRET_KEY='benchmark-secret-key',
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        MAIL_SERVER=smtp_sink.host,
+        MAIL_PORT=smtp_sink.port,
+        MAIL_SUPPRESS_SEND=False,
+        SITE_ADDRESS='http://localhost',
+        CUSTOM_PASSWORD_HASHING={'bcrypt_cost': bcrypt_cost},
+        CUSTOM_MAIL_QUEUE={'enabled': mail_queue},
+    )
+
+    accounts = FlaskSimpleAccounts(models, app)
+    app = accounts.app
+    paths = app.config['SIMPLE_ACCOUNTS_APP_PATHS']
+
+    def add_route(operation):
+        def view():
+            result = getattr(accounts, operation)(request)
+            if isinstance(result, dict):
+                return jsonify(result)
+            return result
+
+        app.add_url_rule(paths[operation], operation, view, methods=['GET', 'POST'])
+
+    for operation in OPERATIONS:
+        add_route(operation)
+
+    with app.app_context():
+        accounts.db.create_all()
+
+    return app, accounts
+
+
+class VirtualUser:
+
+    def __init__(self, app, paths, smtp_sink, number):
+        self.client = app.test_client()
+        self.paths = paths
+        self.smtp_sink = smtp_sink
+        self.email = 'user-{}@benchmark.example.com'.format(number)
+        self.new_email = 'changed-{}@benchmark.example.com'.format(number)
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.errors = {}
+
+    def call(self, operation, data=None, query=None):
+        started = time.perf_counter()
+        if operation == 'verify_email':
+            response = self.client.get(self.paths[operation], query_string=query)
+        else:
+            response = self.client.post(self.paths[operation], data=data)
+        self.latencies[operation].append(time.perf_counter() - started)
+
+        if operation == 'verify_email':
+            succeeded = response.status_code == 200
+        else:
+            succeeded = response.status_code == 200 and json.loads(response.data.decode())['success']
+        if not succeeded:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        return succeeded
+
+    def verification_code(self, email):
+        message = self.smtp_sink.wait_for_message(email)
+        for part in message.walk():
+            payload = part.get_payload(decode=True)
+            if payload:
+                match = VERIFICATION_CODE.search(payload.decode('utf-8', 'replace'))
+                if match:
+                    return match.group(1)
+        raise ValueError('No verification code in the email to {}'.format(email))
+
+    def run(self):
+        steps = [
+            lambda: self.call('sign_up', {'email': self.email, 'password': PASSWORD}),
+            lambda: self.call('verify_email', query={'verification_code': self.verification_code(self.email)}),
+            lambda: self.call('log_in', {'email': self.email, 'password': PASSWORD}),
+            lambda: self.call('change_password', {'current_password': PASSWORD, 'new_password': NEW_PASSWORD}),
+            lambda: self.call('change_email', {'new_email': self.new_email}),
+            lambda: self.call('verify_email', query={'verification_code': self.verification_code(self.new_email)}),
+            lambda: self.call('log_in', {'email': self.new_email, 'password': NEW_PASSWORD}),
+            lambda: self.call('log_out'),
+            lambda: self.call('log_in', {'email': self.new_email, 'password': NEW_PASSWORD}),
+            lambda: self.call('delete_account', {'email': self.new_email, 'password': NEW_PASSWORD}),
+        ]
+        # a failed step leaves the account in a state the next steps cannot use
+        for step in steps:
+            if not step():
+                return
+
+
+def summarize_latencies(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_level(app, accounts, smtp_sink, concurrency, users, first_user_number, trace_memory):
+    from flask_simple_accounts.unit_of_work import query_counter
+
+    paths = app.config['SIMPLE_ACCOUNTS_APP_PATHS']
+    virtual_users = [
+        VirtualUser(app, paths, smtp_sink, number)
+        for number in range(first_user_number, first_user_number + users)
+    ]
+
+    query_counter.reset()
+    if trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(virtual_user.run) for virtual_user in virtual_users]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    operation_stats = accounts.get_operation_stats()
+    operations = {}
+    total_calls = 0
+    total_errors = 0
+    for operation in OPERATIONS:
+        latencies = [latency for virtual_user in virtual_users for latency in virtual_user.latencies[operation]]
+        errors = sum(virtual_user.errors.get(operation, 0) for virtual_user in virtual_users)
+        stats = operation_stats.get(operation, {})
+        operations[operation] = dict(
+            summarize_latencies(latencies),
+            errors=errors,
+            queries_per_op=stats.get('queries_per_call'),
+            commits_per_op=stats.get('commits_per_call'),
+        )
+        total_calls += len(latencies)
+        total_errors += errors
+
+    return {
+        'concurrency': concurrency,
+        'users': users,
+        'seconds': elapsed,
+        'operations_total': total_calls,
+        'errors_total': total_errors,
+        'ops_per_second': total_calls / elapsed if elapsed else 0.0,
+        'operations': operations,
+        'peak_rss_kilobytes': max_rss_kilobytes(),
+        'peak_traced_bytes': traced_peak,
+    }
+
+
+def make_package_importable():
+    """
+        Spawned workers start with this process's environment and sys.path,
+        so both get the repository, which holds the package, ahead of the rest.
+    """
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [REPOSITORY_DIR, os.environ.get('PYTHONPATH')]))
+    if REPOSITORY_DIR not in sys.path:
+        sys.path.insert(1, REPOSITORY_DIR)
+
+
+def run_configuration(database, bcrypt_cost, concurrency_levels, users, mail_queue, trace_memory):
+    from smtp_sink import SMTPSink
+
+    with tempfile.TemporaryDirectory() as directory, SMTPSink() as smtp_sink:
+        if database == 'memory':
+            database_uri = 'sqlite://'
+            concurrency_levels = [level for level in concurrency_levels if level == 1] or [1]
+        else:
+            database_uri = 'sqlite:///' + os.path.join(directory, 'benchmark.sqlite3')
+
+        app, accounts = create_app(database_uri, bcrypt_cost, smtp_sink, mail_queue)
+
+        # one throwaway user warms up imports, connections and the verification page cache
+        run_level(app, accounts, smtp_sink, 1, 1, 0, False)
+
+        levels = []
+        first_user_number = 1
+        for concurrency in concurrency_levels:
+            levels.append(run_level(app, accounts, smtp_sink, concurrency, users, first_user_number, trace_memory))
+            first_user_number += users
+
+        if accounts.mail_dispatcher is not None:
+            accounts.mail_dispatcher.stop()
+
+    return {
+        'database': database,
+        'bcrypt_cost': bcrypt_cost,
+        'mail_queue': mail_queue,
+        'levels': levels,
+    }
+
+
+def print_results(results):
+    print('{:<8} {:>5} {:>6} {:>10} {:>7} {:>16} {:>9} {:>9} {:>9} {:>10} {:>14}'.format(
+        'database', 'cost', 'conc', 'ops/sec', 'errors', 'operation',
+        'p50 ms', 'p95 ms', 'p99 ms', 'queries/op', 'peak RSS (KB)'
+    ))
+    for configuration in results['configurations']:
+        for level in configuration['levels']:
+            for operation, stats in level['operations'].items():
+                if not stats['count']:
+                    continue
+                print('{:<8} {:>5} {:>6} {:>10.2f} {:>7} {:>16} {:>9.2f} {:>9.2f} {:>9.2f} {:>10} {:>14}'.format(
+                    configuration['database'],
+                    configuration['bcrypt_cost'],
+                    level['concurrency'],
+                    level['ops_per_second'],
+                    stats['errors'],
+                    operation,
+                    stats['p50_ms'],
+                    stats['p95_ms'],
+                    stats['p99_ms'],
+                    '-' if stats['queries_per_op'] is None else '{:.1f}'.format(stats['queries_per_op']),
+                    level['peak_rss_kilobytes']
+                ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--databases', nargs='+', choices=['memory', 'file'], default=['memory', 'file'])
+    parser.add_argument('--costs', nargs='+', type=int, default=[4, 10], help='bcrypt costs, 4 is the minimum')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16], help='virtual users running at once')
+    parser.add_argument('--users', type=int, default=20, help='virtual users per concurrency level')
+    parser.add_argument('--mail-queue', action='store_true', help='send mail through the MAIL_QUEUE dispatcher')
+    parser.add_argument('--trace-memory', action='store_true', help='also report the tracemalloc peak, which slows every run')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    arguments = parser.parse_args()
+
+    results = {
+        'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'git_commit': git_commit(),
+        'options': vars(arguments),
+        'configurations': [],
+    }
+
+    make_package_importable()
+    context = multiprocessing.get_context('spawn')
+    for database in arguments.databases:
+        for bcrypt_cost in arguments.costs:
+            with context.Pool(1) as pool:
+                results['configurations'].append(pool.apply(run_configuration, (
+                    database, bcrypt_cost, arguments.concurrency,
+                    arguments.users, arguments.mail_queue, arguments.trace_memory
+                )))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
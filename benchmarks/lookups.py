@@ -0,0 +1,108 @@
+"""
+    Compares the cost of one user lookup by email through the plain ORM query
+    that get_user_by_email used to make, through the baked lookups, and as raw
+    SQL through the same connection, so the gap to raw SQL is the ORM overhead.
+
+        python benchmarks/lookups.py [--users 10000] [--lookups 20000] [--repeat 5]
+
+    Runs on an in-memory SQLite database, so the database itself costs as
+    little as it can. The session is emptied after every lookup, as it is
+    between requests.
+"""
+import os
+import sys
+import argparse
+import datetime
+import timeit
+
+# the repository, so the package imports from a checkout without installing it
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from flask_simple_accounts import models, lookups
+
+
+def create_app(users):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    models.db.init_app(app)
+
+    with app.app_context():
+        models.db.create_all()
+        now = datetime.datetime.now()
+        models.db.session.bulk_insert_mappings(models.User, [
+            {
+                'email': 'user-{}@benchmark.example.com'.format(number),
+                'salt': None,
+                'password_hash': '$2b$04$' + 'x' * 53,
+                'registered_on': now,
+                'is_active': True,
+                'session_version': 0,
+                'verification_version': 0,
+            }
+            for number in range(users)
+        ])
+        models.db.session.commit()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+
+    app = create_app(arguments.users)
+    emails = ['user-{}@benchmark.example.com'.format(number % arguments.users) for number in range(arguments.lookups)]
+    User = models.User
+
+    with app.app_context():
+        session = models.db.session
+
+        def orm_query(email):
+            return User.query.filter_by(email=email).first()
+
+        def baked_user(email):
+            return lookups.find_user(session, User, email)
+
+        def baked_identity(email):
+            return lookups.find_user(session, User, email, lookups.IDENTITY_COLUMNS)
+
+        def baked_credentials(email):
+            return lookups.find_credentials(session, User, email)
+
+        raw_connection = session.connection().connection
+
+        def raw_credentials(email):
+            return raw_connection.execute(
+                'SELECT id, salt, password_hash FROM user WHERE email = ? LIMIT 1', (email,)
+            ).fetchone()
+
+        cases = [
+            ('orm filter_by().first(), all columns', orm_query),
+            ('baked, all columns', baked_user),
+            ('baked, identity columns', baked_identity),
+            ('baked, credential columns as a row', baked_credentials),
+            ('raw sqlite3, credential columns', raw_credentials),
+        ]
+
+        print('{:<40} {:>14} {:>16}'.format('lookup', 'us/lookup', 'vs raw sqlite3'))
+        results = []
+        for label, lookup in cases:
+            def run():
+                for email in emails:
+                    lookup(email)
+                    session.expunge_all()
+
+            seconds = min(timeit.repeat(run, number=1, repeat=arguments.repeat))
+            results.append((label, seconds / len(emails) * 1000000))
+
+        raw_microseconds = results[-1][1]
+        for label, microseconds in results:
+            print('{:<40} {:>14.1f} {:>15.1f}x'.format(label, microseconds, microseconds / raw_microseconds))
+
+
+if __name__ == '__main__':
+    main()
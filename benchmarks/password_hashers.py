@@ -0,0 +1,96 @@
+"""
+    Reports hashes/sec and peak memory for each password hasher and parameter set.
+
+        python benchmarks/password_hashers.py [--seconds 3] [--json]
+
+    Each parameter set runs in a fresh process so peak RSS is not inflated
+    by the sets measured before it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import concurrent.futures
+
+# the repository, so the package imports from a checkout without installing it
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_simple_accounts import hashers
+
+
+PARAMETER_SETS = [
+    ('bcrypt', {'cost': 10}),
+    ('bcrypt', {'cost': 12}),
+    ('bcrypt', {'cost': 14}),
+    ('scrypt', {'n': 2 ** 14, 'r': 8, 'p': 1}),
+    ('scrypt', {'n': 2 ** 15, 'r': 8, 'p': 1}),
+    ('scrypt', {'n': 2 ** 17, 'r': 8, 'p': 1}),
+    ('pbkdf2_sha256', {'iterations': 100000}),
+    ('pbkdf2_sha256', {'iterations': 260000}),
+    ('pbkdf2_sha256', {'iterations': 600000}),
+]
+
+PASSWORD = 'Benchmark-Password-1234!!abcdEFGH'
+
+
+def max_rss_kilobytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss // 1024
+    return max_rss
+
+
+def measure(algorithm, parameters, seconds):
+    hasher = hashers.get_hasher(algorithm, **parameters)
+    encoded = hasher.encode(PASSWORD)
+    rss_before = max_rss_kilobytes()
+
+    hashes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        hasher.verify(PASSWORD, encoded)
+        hashes += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'algorithm': algorithm,
+        'parameters': parameters,
+        'hashes': hashes,
+        'hashes_per_second': hashes / elapsed,
+        'seconds_per_hash': elapsed / hashes,
+        'peak_rss_kilobytes': max_rss_kilobytes(),
+        'peak_rss_growth_kilobytes': max_rss_kilobytes() - rss_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=3.0, help='time spent hashing per parameter set')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    arguments = parser.parse_args()
+
+    results = []
+    for algorithm, parameters in PARAMETER_SETS:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(measure, algorithm, parameters, arguments.seconds).result())
+
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{:<15} {:<30} {:>12} {:>12} {:>14}'.format('algorithm', 'parameters', 'hashes/sec', 'ms/hash', 'peak RSS (KB)'))
+    for result in results:
+        print('{:<15} {:<30} {:>12.2f} {:>12.2f} {:>14}'.format(
+            result['algorithm'],
+            json.dumps(result['parameters']),
+            result['hashes_per_second'],
+            result['seconds_per_hash'] * 1000,
+            result['peak_rss_kilobytes']
+        ))
+
+
+if __name__ == '__main__':
+    main()
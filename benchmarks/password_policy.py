@@ -0,0 +1,108 @@
+"""
+    Compares the compiled PasswordPolicy with the per-rule scans it replaced,
+    for long passwords and for bulk validation of typical ones.
+
+        python benchmarks/password_policy.py [--repeat 5]
+"""
+import os
+import sys
+import copy
+import random
+import string
+import argparse
+import timeit
+
+# the repository, so the package imports from a checkout without installing it
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_simple_accounts import constants
+from flask_simple_accounts.config import Config
+from flask_simple_accounts.password_policy import PasswordPolicy
+
+
+def string_has_minimum(string, min_count, comparison_function):
+    count = 0
+    for character in string:
+        if comparison_function(character):
+            count += 1
+
+        if count >= min_count:
+            return True
+
+    return False
+
+
+def legacy_password_is_valid(password, requirements):
+    """
+        The checks password_is_valid made before the policy was compiled,
+        without the print calls.
+    """
+    if requirements['has_length']['default'] and len(password) < requirements['has_length']['min_value']:
+        return False
+    if requirements['has_letter']['default'] and not string_has_minimum(
+            password, requirements['has_letter']['min_value'], lambda character: character.isalpha()):
+        return False
+    if requirements['has_number']['default'] and not string_has_minimum(
+            password, requirements['has_number']['min_value'], lambda character: character.isdigit()):
+        return False
+    if requirements['has_upper_case']['default'] and not string_has_minimum(
+            password, requirements['has_upper_case']['min_value'], lambda character: character.isupper()):
+        return False
+    if requirements['has_lower_case']['default'] and not string_has_minimum(
+            password, requirements['has_lower_case']['min_value'], lambda character: character.islower()):
+        return False
+    if requirements['has_special_character']['default'] and not string_has_minimum(
+            password,
+            requirements['has_special_character']['min_value'],
+            lambda character: character in requirements['has_special_character']['values']):
+        return False
+    return True
+
+
+def generate_password(length, generator):
+    alphabet = string.ascii_letters + string.digits + constants.OWASP_APPROVED_SPECIAL_CHARACTERS
+    return ''.join(generator.choice(alphabet) for _ in range(length))
+
+
+def compare(label, passwords, requirements, policy, repeat):
+    def run_legacy():
+        for password in passwords:
+            legacy_password_is_valid(password, requirements)
+
+    def run_compiled():
+        for password in passwords:
+            policy.is_valid(password)
+
+    legacy_seconds = min(timeit.repeat(run_legacy, number=1, repeat=repeat))
+    compiled_seconds = min(timeit.repeat(run_compiled, number=1, repeat=repeat))
+    print('{:<40} {:>12.2f} {:>12.2f} {:>9.1f}x'.format(
+        label,
+        legacy_seconds * 1000,
+        compiled_seconds * 1000,
+        legacy_seconds / compiled_seconds
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+
+    requirements = copy.deepcopy(Config.PASSWORD_REQUIREMENTS)
+    policy = PasswordPolicy(requirements)
+    generator = random.Random(0)
+
+    # the legacy scans stop early once a rule is met, so the worst case for them is a
+    # long password whose special characters only appear at the end
+    long_tail_password = 'aaaaBBBB1234' * 1000 + '!!'
+
+    print('{:<40} {:>12} {:>12} {:>10}'.format('case', 'legacy ms', 'compiled ms', 'speedup'))
+    compare('1 password, 12k chars, specials at end', [long_tail_password], requirements, policy, arguments.repeat)
+    compare('1,000 random passwords, 1k chars', [generate_password(1000, generator) for _ in range(1000)],
+            requirements, policy, arguments.repeat)
+    compare('100,000 random passwords, 20 chars', [generate_password(20, generator) for _ in range(100000)],
+            requirements, policy, arguments.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+    A local stand-in SMTP server for the benchmarks, which accepts every message
+    and keeps it in memory.
+    Point MAIL_SERVER/MAIL_PORT at it to exercise the mail paths without a real server:
+
+        with SMTPSink() as sink:
+            app.config['MAIL_SERVER'], app.config['MAIL_PORT'] = sink.host, sink.port
+            ...
+            sink.messages
+"""
+import time
+import email
+import threading
+import socketserver
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        sink = self.server.sink
+        sink.record_connection()
+        self.reply('220 simple-accounts smtp sink ready')
+
+        sender = None
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self.reply('250-simple-accounts')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 simple-accounts')
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip()
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                sink.record_message(sender, recipients, self.read_data())
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                sender = None
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            if line.startswith(b'..'):
+                line = line[1:]
+            lines.append(line)
+        return b''.join(lines)
+
+
+class SMTPSinkServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = SMTPSinkServer((host, port), SMTPSinkHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self.thread = None
+
+        self.lock = threading.Lock()
+        self.message_arrived = threading.Condition(self.lock)
+        self.messages = []
+        self.latest_messages = {}
+        self.connections = 0
+
+    def record_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def record_message(self, sender, recipients, data):
+        with self.lock:
+            message = {'sender': sender, 'recipients': recipients, 'data': data}
+            self.messages.append(message)
+            for address in recipients:
+                self.latest_messages[address.strip('<>')] = message
+            self.message_arrived.notify_all()
+
+    def find_message(self, recipient):
+        # the newest one, so a second email to the same address replaces the first
+        return self.latest_messages.get(recipient)
+
+    def wait_for_message(self, recipient, timeout=10):
+        """
+            Returns the newest message sent to recipient as an email.message.Message,
+            waiting for it to arrive when mail is sent in the background.
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            message = self.find_message(recipient)
+            while message is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('No message for {}'.format(recipient))
+                self.message_arrived.wait(remaining)
+                message = self.find_message(recipient)
+        return email.message_from_bytes(message['data'])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='smtp-sink', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
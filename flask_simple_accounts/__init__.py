@@ -1,30 +1,117 @@
 import os
+import json
+import math
+import contextlib
+import hashlib
 import datetime
+import threading
 
-from flask_mail import Mail, Message
+import click
+from flask import g, has_app_context, current_app, session as flask_session, Response
 import flask_login
-
-import flask_beautiful_messages
-import flask_render_specific_template
-import flask_multiple_static_folders
+from sqlalchemy import event, func, true, or_, and_, not_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
 
 from . config import Config
 from . import helper
+from . import constants
+from . import hashers
+from . hashing_executor import HashingExecutor, HashingExecutorSaturated
+from . user_cache import UserCache, user_to_record, user_from_record
+from . mail_dispatcher import MailDispatcher, MailQueueFull
+from . import password_policy
+from . password_policy import PasswordPolicy
+from . import bulk_import
+from . import bulk_export
+from . import lookups
+from . unit_of_work import unit_of_work, in_unit_of_work, after_commit, query_counter
+from . session_store import create_session_store
+from . instrumentation import Instrumentation, InMemoryMetricsSink, instrumented
+from . rate_limiter import create_rate_limiter, HashConcurrencyLimiter
+from . async_accounts import AsyncSimpleAccounts
+from . replica import ReplicaRouter
+from . email_filter import EmailFilter
+from . import sharding
+from . sharding import ShardRouter, sharded
+from . profiler import Profiler, profiled
 
 
 login_manager = flask_login.LoginManager()
 
 
+SESSION_TOKEN_KEY = 'simple_accounts_session'
+VERIFICATION_TOKEN_SALT = 'flask-simple-accounts-email-verification'
+
+CUSTOMIZABLE_CONFIG_KEYS = (
+    'PASSWORD_REQUIREMENTS',
+    'EMAIL_VERIFICATION',
+    'SIMPLE_ACCOUNTS_APP_PATHS',
+    'EMAIL_VERIFICATION_TEMPLATE',
+    'HASHING_EXECUTOR',
+    'PASSWORD_HASHING',
+    'USER_CACHE',
+    'MAIL_QUEUE',
+    'SESSION_STORE',
+    'INSTRUMENTATION',
+    'RATE_LIMITING',
+    'READ_REPLICA',
+    'EMAIL_FILTER',
+    'SHARDING',
+    'LAZY_INITIALIZATION',
+    'PROFILING',
+)
+
+
+EXTENSION_KEY = 'simple_accounts'
+
+
+def get_simple_accounts():
+    """
+        The FlaskSimpleAccounts of the current app, or None outside an app
+        context or for an app without one.
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(EXTENSION_KEY)
+
+
 @login_manager.user_loader
 def user_loader(email):
-    return FlaskSimpleAccounts.models.User.query.filter_by(email=email).first()
+    simple_accounts = get_simple_accounts()
+    if simple_accounts is None:
+        return None
+    return simple_accounts.load_user(email)
+
+
+def get_request_identity_map():
+    if not hasattr(g, 'simple_accounts_users'):
+        g.simple_accounts_users = {}
+    return g.simple_accounts_users
+
+
+@event.listens_for(Session, 'after_flush')
+def forget_flushed_users(session, flush_context):
+    simple_accounts = get_simple_accounts()
+    if simple_accounts is not None:
+        simple_accounts.forget_flushed_users(session)
+
+
+@event.listens_for(Session, 'after_flush')
+def remember_flushed_emails(session, flush_context):
+    simple_accounts = get_simple_accounts()
+    if simple_accounts is not None:
+        simple_accounts.remember_flushed_emails(session)
 
 
 def save_db():
-    FlaskSimpleAccounts.models.db.session.commit()
+    get_simple_accounts().save_db()
+
 
 def delete_db_object(db_object):
-    FlaskSimpleAccounts.db.session.delete(db_object)
+    get_simple_accounts().delete_db_object(db_object)
 
 
 class FlaskSimpleAccounts:
@@ -32,28 +119,462 @@ class FlaskSimpleAccounts:
     app = None
     models = None
     db = None
+    hashing_executor = None
+    password_hasher = None
+    user_cache = None
+    mail = None
+    mail_dispatcher = None
+    password_policy = None
+    session_store = None
+    verification_pages = None
+    instrumentation = None
+    rate_limiter = None
+    hash_concurrency_limiter = None
+    replica_router = None
+    email_filter = None
+    shard_router = None
+    email_templates = None
+    profiler = None
+    static_folders_initialized = False
 
     def __init__(self, models, app):
-        FlaskSimpleAccounts.app = app
-        FlaskSimpleAccounts.models = models
-        FlaskSimpleAccounts.db = self.initialize_db()
+        self.app = app
+        # before anything flushes, as the flush listeners look the instance up
+        self.app.extensions[EXTENSION_KEY] = self
+        self.models = models
+        self.db = self.initialize_db()
         self.customize_app_config()
-        login_manager.init_app(FlaskSimpleAccounts.app)
+        self.lazy_initialization = self.app.config['LAZY_INITIALIZATION']['enabled']
+        self.lazy_lock = threading.Lock()
+        self.replica_router = self.initialize_replica_router()
+        self.shard_router = self.initialize_shard_router()
+        self.instrumentation = self.initialize_instrumentation()
+        self.profiler = self.initialize_profiler()
+        self.initialize_bcrypt_cost()
+        self.password_hasher = self.get_password_hasher()
+        self.hashing_executor = self.initialize_hashing_executor()
+        self.rate_limiter = self.initialize_rate_limiter()
+        self.hash_concurrency_limiter = self.initialize_hash_concurrency_limiter()
+        self.user_cache = self.initialize_user_cache()
+        self.mail = None if self.lazy_initialization else self.initialize_mail()
+        self.email_templates = None if self.lazy_initialization else self.initialize_email_templates()
+        self.mail_dispatcher = self.initialize_mail_dispatcher()
+        self.session_store = self.initialize_session_store()
+        self.email_filter = self.initialize_email_filter()
+        if self.lazy_initialization:
+            # url rules are matched before this runs, and the endpoint keeps its name
+            self.app.before_request(self.ensure_static_folders)
+        else:
+            self.initialize_static_folders()
+        self.register_cli_commands()
+        login_manager.init_app(self.app)
 
-    def hash_matches_user_password_hash(self, hash, user):
-        return hash == user.password_hash
+    def load_user(self, email):
+        """
+            The user only counts as logged in while the session store still
+            accepts the token in this request's session cookie, and while
+            the user is active.
+        """
+        token = flask_session.get(SESSION_TOKEN_KEY)
+        if token is None:
+            return None
 
-    def password_is_correct(self, raw_password, email):
-        user = self.get_user_by_email(email)
+        user = self.get_user_by_email(email, lookups.IDENTITY_COLUMNS, use_replica=True)
+        if user is None or not user.is_active or not self.session_store.is_valid(token, user):
+            return None
 
-        if user is None:
+        user.mark_user_as_authenticated()
+        return user
+
+    def get_user_by_email(self, email, columns=None, use_replica=False):
+        """
+            Looks in the request's identity map, then in the process-wide user
+            cache, and only then queries the database. columns limits the
+            columns queried; the others load on first access. With use_replica,
+            the query goes to the read replica when there is one.
+        """
+        identity_map = get_request_identity_map()
+        user = identity_map.get(email)
+        if user is not None:
+            return user
+
+        with self.use_email_shard(email):
+            user = self.find_user_by_email(email, columns, use_replica)
+
+        if user is not None:
+            identity_map[email] = user
+        return user
+
+    def find_user_by_email(self, email, columns=None, use_replica=False):
+        user_cache = self.user_cache
+        record = user_cache.get(email) if user_cache is not None else None
+
+        replica_router = self.replica_router
+        if record is None and use_replica and replica_router is not None:
+            found, record = replica_router.find_user_record(self.models.User, email, columns)
+            if found and record is None:
+                return None
+            if record is not None and user_cache is not None:
+                user_cache.set(email, record)
+
+        if record is not None:
+            user = user_from_record(self.models.User, record, self.db.session)
+        else:
+            user = lookups.find_user(self.db.session, self.models.User, email, columns)
+            if user is not None and user_cache is not None:
+                user_cache.set(email, user_to_record(user))
+        return user
+
+    def forget_user_email(self, email):
+        get_request_identity_map().pop(email, None)
+        if self.user_cache is not None:
+            self.user_cache.invalidate(email)
+
+    def forget_flushed_users(self, session):
+        """
+            Any flushed change to a user, including a change of email or a delete,
+            drops the old and new emails from the identity map and the user cache.
+        """
+        changed_objects = list(session.new) + list(session.dirty) + list(session.deleted)
+        for changed_object in changed_objects:
+            if not isinstance(changed_object, self.models.User):
+                continue
+
+            added, unchanged, deleted = get_history(changed_object, 'email')
+            for email in set(added or ()) | set(unchanged or ()) | set(deleted or ()):
+                if email is not None:
+                    self.forget_written_email(email)
+
+    def forget_written_email(self, email):
+        self.forget_user_email(email)
+        if self.replica_router is not None:
+            self.replica_router.record_write(email)
+
+    def remember_flushed_emails(self, session):
+        email_filter = self.email_filter
+        if email_filter is None:
+            return
+
+        # emails that are then rolled back stay in the filter, which only costs a query
+        for changed_object in list(session.new) + list(session.dirty):
+            if isinstance(changed_object, self.models.User):
+                email = changed_object.email
+            elif isinstance(changed_object, self.models.EmailVerification):
+                email = changed_object.unverified_email
+            else:
+                continue
+            if email is not None:
+                email_filter.add(email)
+
+    def save_db(self):
+        # inside a unit of work the operation commits once when it finishes
+        session = self.db.session
+        if not in_unit_of_work(session):
+            session.commit()
+
+    def delete_db_object(self, db_object):
+        self.db.session.delete(db_object)
+
+    def password_is_correct(self, raw_password, email, use_replica=False):
+        credentials = self.get_user_credentials(email, use_replica)
+
+        if credentials is None:
+            return False
+
+        try:
+            hashers.parse(credentials.password_hash)
+        except ValueError:
+            # a corrupt or unsupported hash fails like a wrong password instead of an error page
+            self.instrumentation.count('password_hash_unreadable')
+            self.app.logger.warning('Unreadable password hash for user %s', credentials.id)
             return False
 
-        password_hash = helper.hash_password(
-            raw_password,
-            user.salt
+        hasher = self.get_password_hasher(hashers.identify_algorithm(credentials.password_hash))
+        if not self.run_password_hasher(hasher.verify, raw_password, credentials.password_hash):
+            return False
+
+        if self.user_password_needs_rehash(hasher, credentials):
+            self.rehash_user_password(raw_password, self.get_user_by_email(email))
+        return True
+
+    def get_user_credentials(self, email, use_replica=False):
+        """
+            The id, salt and password_hash of the user, or None. A user already
+            loaded in this request is used as it is; otherwise only those
+            columns are read, from the read replica with use_replica.
+        """
+        user = get_request_identity_map().get(email)
+        if user is not None:
+            return user
+
+        if self.user_cache is not None:
+            record = self.user_cache.get(email)
+            credentials = lookups.credentials_from_record(record) if record is not None else None
+            if credentials is not None:
+                return credentials
+
+        if use_replica and self.replica_router is not None:
+            found, credentials = self.replica_router.find_credentials(self.models.User, email)
+            if found:
+                return credentials
+
+        with self.use_email_shard(email):
+            return lookups.find_credentials(self.db.session, self.models.User, email)
+
+    def use_email_shard(self, email):
+        if self.shard_router is None:
+            return self.use_shard(None)
+        return self.shard_router.use_shard(self.shard_router.shard_for_email(email))
+
+    @contextlib.contextmanager
+    def use_shard(self, index):
+        """
+            Queries inside go to that shard. A no-op without sharding, or with index None.
+        """
+        if self.shard_router is None or index is None:
+            yield
+            return
+        with self.shard_router.use_shard(index):
+            yield
+
+    def get_shards(self):
+        # [None] without sharding, so loops over the shards also work unsharded
+        if self.shard_router is None:
+            return [None]
+        return list(range(len(self.shard_router.engines)))
+
+    def group_by_shard(self, items, key):
+        """
+            {shard: items}, where key(item) is the email; {None: items} without sharding.
+        """
+        if self.shard_router is None:
+            return {None: list(items)} if items else {}
+        return self.shard_router.group_by_shard(items, key)
+
+    def get_shard_sessions(self):
+        if self.shard_router is None:
+            return [self.db.session()]
+        return self.shard_router.get_sessions()
+
+    def get_request_shard(self, request, kind):
+        """
+            The shard an operation runs in, see sharding.sharded. None when the
+            request does not say, e.g. nobody is logged in.
+        """
+        router = self.shard_router
+        if kind == 'email':
+            email = request.values.get('email')
+            return router.shard_for_email(email) if email else None
+
+        if kind == 'user':
+            user = self.get_current_user()
+            return sharding.get_object_shard(user) if user is not None else None
+
+        if kind == 'verification_code':
+            verification_code = request.values.get('verification_code')
+            if not verification_code:
+                return None
+            if not self.app.config['EMAIL_VERIFICATION']['stateless_tokens']:
+                return router.shard_for_code(verification_code)
+            loaded_token = self.load_email_verification_token(verification_code)
+            return loaded_token[3] if loaded_token is not None else None
+
+        raise ValueError('Unknown shard kind: {}'.format(kind))
+
+    def move_user_to_email_shard(self, user):
+        """
+            A user whose new email hashes to another shard is copied there,
+            committed, then deleted here with the calling operation. Raises
+            IntegrityError when the email is taken in the other shard.
+        """
+        router = self.shard_router
+        new_shard = router.shard_for_email(user.email)
+        if new_shard == sharding.get_object_shard(user):
+            return
+
+        User = self.models.User
+        row = {column.key: getattr(user, column.key) for column in User.__table__.columns if column.key != 'id'}
+        with router.use_shard(new_shard):
+            session = self.db.session
+            try:
+                session.bulk_insert_mappings(User, [row])
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                raise
+
+        # bulk inserts skip the flush listeners
+        if self.email_filter is not None:
+            self.email_filter.add(user.email)
+        self.delete_db_object(user)
+
+    def create_shard_tables(self):
+        """
+            db.create_all() does not create the sharded tables in the shards.
+        """
+        if self.shard_router is not None:
+            self.shard_router.create_tables()
+
+    def get_shard_stats(self):
+        if self.shard_router is None:
+            return None
+        return self.shard_router.stats()
+
+    def get_bcrypt_cost(self):
+        return self.app.config['PASSWORD_HASHING']['bcrypt_cost']
+
+    def get_password_hasher_parameters(self, algorithm):
+        hashing_config = self.app.config['PASSWORD_HASHING']
+        if algorithm == hashers.BcryptHasher.algorithm:
+            return {'cost': hashing_config['bcrypt_cost']}
+        if algorithm == hashers.ScryptHasher.algorithm:
+            return {'n': hashing_config['scrypt_n'], 'r': hashing_config['scrypt_r'], 'p': hashing_config['scrypt_p']}
+        if algorithm == hashers.PBKDF2Hasher.algorithm:
+            return {'iterations': hashing_config['pbkdf2_iterations']}
+        return {}
+
+    def get_password_hasher(self, algorithm=None):
+        default_algorithm = self.app.config['PASSWORD_HASHING']['algorithm']
+        if algorithm is None:
+            algorithm = default_algorithm
+
+        if algorithm == default_algorithm and self.password_hasher is not None:
+            return self.password_hasher
+        return hashers.get_hasher(algorithm, **self.get_password_hasher_parameters(algorithm))
+
+    def user_password_needs_rehash(self, hasher, user):
+        """
+            Users are migrated lazily: hashes made with another algorithm or
+            with other parameters are replaced on their next log in.
+        """
+        if not self.app.config['PASSWORD_HASHING']['rehash_on_log_in']:
+            return False
+        if hasher.algorithm != self.password_hasher.algorithm:
+            return True
+        return self.password_hasher.needs_update(user.password_hash)
+
+    def rehash_user_password(self, raw_password, user):
+        """
+            The password was just verified, so it can be stored again with the
+            current hasher. A busy hashing executor postpones this to a later log in.
+        """
+        try:
+            new_password_hash = self.encode_password(raw_password)
+        except HashingExecutorSaturated:
+            return
+
+        user.salt = None
+        user.password_hash = new_password_hash
+        self.save_db()
+
+    def encode_password(self, password):
+        return self.run_password_hasher(self.password_hasher.encode, password)
+
+    def run_password_hasher(self, function, *args):
+        """
+            Raises HashingExecutorSaturated when the hashing executor is enabled
+            and has no room left for another hash, or when max_in_flight_hashes
+            hashes are already running.
+        """
+        if self.hashing_executor is not None:
+            function, args = self.hashing_executor.run, (function,) + args
+        if self.hash_concurrency_limiter is not None:
+            function, args = self.hash_concurrency_limiter.run, (function,) + args
+
+        with self.instrumentation.phase('hash'):
+            return function(*args)
+
+    def get_hashing_stats(self):
+        if self.hashing_executor is None:
+            return None
+        return self.hashing_executor.stats()
+
+    def get_client_address(self, request):
+        # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client
+        return request.remote_addr or 'unknown'
+
+    def password_attempt_wait_seconds(self, request, email):
+        """
+            Takes a token from the client IP's and the email's buckets.
+            Returns 0.0 when the attempt may go ahead, otherwise the seconds
+            until it would be admitted.
+        """
+        rate_limiter = self.rate_limiter
+        if rate_limiter is None:
+            return 0.0
+
+        limits_config = self.app.config['RATE_LIMITING']
+        limits = [
+            ('ip', self.get_client_address(request), limits_config['per_ip']),
+            ('email', self.get_password_attempt_email_key(email), limits_config['per_email']),
+        ]
+        for kind, key, limit in limits:
+            wait_seconds = rate_limiter.take(
+                '{}:{}'.format(kind, key),
+                limit['capacity'],
+                limit['refill_per_second']
+            )
+            rate_limiter.record(kind, wait_seconds)
+            if wait_seconds:
+                self.instrumentation.count('rate_limited.{}'.format(kind))
+                return wait_seconds
+        return 0.0
+
+    def get_password_attempt_email_key(self, email):
+        return str(email or '').strip().lower()
+
+    def refund_password_attempt(self, email):
+        """
+            A correct password gives the email's token back, so only failed
+            checks count against the email and a user who logs in often never
+            runs out of attempts. The IP's token is kept.
+        """
+        if self.rate_limiter is None:
+            return
+        self.rate_limiter.refund(
+            'email:{}'.format(self.get_password_attempt_email_key(email)),
+            self.app.config['RATE_LIMITING']['per_email']['capacity']
         )
-        return self.hash_matches_user_password_hash(password_hash, user)
+
+    def purge_idle_rate_limits(self):
+        """
+            Deletes the sqlite buckets that have been idle long enough to be
+            full again, and returns how many.
+        """
+        if self.rate_limiter is None:
+            return 0
+        return self.rate_limiter.purge_idle()
+
+    def get_rate_limit_idle_seconds(self):
+        # past this, every bucket has refilled, whichever limit it belongs to
+        limits_config = self.app.config['RATE_LIMITING']
+        limits = (limits_config['per_ip'], limits_config['per_email'])
+        if any(limit['refill_per_second'] <= 0 for limit in limits):
+            # those buckets never refill, so none can be dropped
+            return None
+        return max(limit['capacity'] / limit['refill_per_second'] for limit in limits)
+
+    def add_too_many_requests_error(self, response, wait_seconds):
+        response['errors'].append('Too many attempts, try again later')
+        response['status_code'] = constants.HTTP_TOO_MANY_REQUESTS
+        # a bucket that never refills has no time to retry after
+        if not math.isinf(wait_seconds):
+            response['retry_after'] = int(math.ceil(wait_seconds))
+        return response
+
+    def get_rate_limit_stats(self):
+        stats = {}
+        if self.rate_limiter is not None:
+            stats['attempts'] = self.rate_limiter.stats()
+        if self.hash_concurrency_limiter is not None:
+            stats['hashes'] = self.hash_concurrency_limiter.stats()
+        return stats
+
+    def add_service_unavailable_error(self, response):
+        self.instrumentation.count('service_unavailable')
+        response['errors'].append('Service is busy, try again later')
+        response['status_code'] = constants.HTTP_SERVICE_UNAVAILABLE
+        return response
 
     def get_package_root_dir(self):
         file_path = os.path.realpath(__file__)
@@ -63,28 +584,76 @@ class FlaskSimpleAccounts:
         package_dir = self.get_package_root_dir()
         return os.path.join(package_dir, 'templates')
 
-    def get_user_by_email(self, email):
-        user = FlaskSimpleAccounts.models.User.query.filter_by(email=email).first()
-        return user
+    def get_email_template_dirs(self):
+        # the app's own template dirs come first, so they can override the package's
+        email_template_dirs = list(self.app.config['EMAIL_VERIFICATION']['email_template_dirs'])
+        return email_template_dirs + [os.path.join(self.get_package_template_dir(), 'email')]
+
+    def initialize_email_templates(self):
+        from . email_templates import EmailTemplates
+        return EmailTemplates(self.get_email_template_dirs())
+
+    def get_email_templates(self):
+        if self.email_templates is None:
+            with self.lazy_lock:
+                if self.email_templates is None:
+                    self.email_templates = self.initialize_email_templates()
+        return self.email_templates
+
+    def get_email_template_stats(self):
+        if self.email_templates is None:
+            return None
+        return self.email_templates.stats()
+
+    def get_user_cache_stats(self):
+        if self.user_cache is None:
+            return None
+        return self.user_cache.stats()
 
     def get_current_user(self):
-        user_id = flask_login.current_user.get_id()
-        return self.get_user_by_email(user_id)
+        # user_loader has already checked the session for this request
+        if not flask_login.current_user.is_authenticated:
+            return None
+        return flask_login.current_user._get_current_object()
 
     def user_email_is_unique(self, user_email):
-        user = self.get_user_by_email(user_email)
+        email_filter = self.email_filter
+        might_contain = True
+        if email_filter is not None:
+            if email_filter.bloom_filter is None:
+                email_filter.build_if_missing(
+                    self.get_shard_sessions(),
+                    self.models.User,
+                    self.models.EmailVerification
+                )
+            might_contain = email_filter.might_contain(user_email)
+            if not might_contain and email_filter.trust_misses:
+                return True
+
+        user = self.get_user_by_email(user_email, ('id',))
+        if email_filter is not None:
+            if user is None and might_contain:
+                email_filter.record_false_positive()
+            elif user is not None and not might_contain:
+                email_filter.record_stale_miss(user_email)
         return user is None
 
     def create_new_user(self, password):
-        new_user = FlaskSimpleAccounts.models.User(password)
-        FlaskSimpleAccounts.models.db.session.add(new_user)
-        save_db()
+        password_hash = self.encode_password(password)
+        new_user = self.models.User(password_hash=password_hash)
+        self.models.db.session.add(new_user)
+        self.save_db()
         return new_user
 
     def create_new_verification(self, code, user, unverified_email):
-        new_verification = FlaskSimpleAccounts.models.EmailVerification(code, user, unverified_email)
-        FlaskSimpleAccounts.models.db.session.add(new_verification)
-        save_db()
+        new_verification = self.models.EmailVerification(
+            code,
+            user,
+            unverified_email,
+            hours_valid=self.app.config['EMAIL_VERIFICATION']['hours_verification_is_valid']
+        )
+        self.models.db.session.add(new_verification)
+        self.save_db()
         return new_verification
 
     def email_is_valid(self, email):
@@ -93,6 +662,18 @@ class FlaskSimpleAccounts:
         match = re.match(email_regex, email)
         return match is not None
 
+    def get_password_failures(self, password):
+        """
+            Returns a PolicyFailure(rule, min_value, value) for every requirement
+            in PASSWORD_REQUIREMENTS that the password does not meet.
+        """
+        return self.password_policy.get_failures(password)
+
+    def password_is_valid(self, password):
+        return self.password_policy.is_valid(password)
+
+    # single rule checks, kept for callers of the API before PasswordPolicy;
+    # password_is_valid no longer uses them
     def string_has_minimum_length(self, string, length):
         return len(string) >= length
 
@@ -107,109 +688,265 @@ class FlaskSimpleAccounts:
 
         return False
 
+    def string_has_minimum_of_class(self, string, min_count, character_class, special_characters=()):
+        return self.string_has_minimum(
+            string,
+            min_count,
+            lambda character: password_policy.classify_character(character, special_characters) & character_class
+        )
+
     def string_has_minimum_letters(self, string, min_count):
-        def is_alpha(string):
-            return string.isalpha()
-        return self.string_has_minimum(string, min_count, is_alpha)
+        return self.string_has_minimum_of_class(string, min_count, password_policy.LETTER)
 
     def string_has_minimum_numbers(self, string, min_count):
-        def is_digit(string):
-            return string.isdigit()
-        return self.string_has_minimum(string, min_count, is_digit)
+        return self.string_has_minimum_of_class(string, min_count, password_policy.NUMBER)
 
     def string_has_minimum_upper_case_characters(self, string, min_count):
-        def is_upper(string):
-            return string.isupper()
-        return self.string_has_minimum(string, min_count, is_upper)
+        return self.string_has_minimum_of_class(string, min_count, password_policy.UPPER_CASE)
 
     def string_has_minimum_lower_case_characters(self, string, min_count):
-        def is_lower(string):
-            return string.islower()
-        return self.string_has_minimum(string, min_count, is_lower)
+        return self.string_has_minimum_of_class(string, min_count, password_policy.LOWER_CASE)
 
     def string_has_minimum_special_characters(self, string, min_count, special_characters):
-        def is_special(string):
-            return string in special_characters
-        return self.string_has_minimum(string, min_count, is_special)
+        return self.string_has_minimum_of_class(string, min_count, password_policy.SPECIAL_CHARACTER, special_characters)
 
-    def password_is_valid(self, password):
-        requirements = FlaskSimpleAccounts.app.config['PASSWORD_REQUIREMENTS']
+    def get_breached_password_stats(self):
+        if self.password_policy.breached_passwords is None:
+            return None
+        return self.password_policy.breached_passwords.stats()
 
-        if requirements['has_length']['default']:
-            if self.string_has_minimum_length(password, requirements['has_length']['min_value']):
-                print("Password has minimum length")
-            else:
-                return False
+    def generate_unique_code(self):
+        import uuid
+        return str(uuid.uuid4())
 
-        if requirements['has_letter']['default']:
-            if self.string_has_minimum_letters(password, requirements['has_letter']['min_value']):
-                print("Password has minimum number of letters")
-            else:
-                return False
+    def generate_email_verification_code(self, shard=None):
+        code = self.generate_unique_code().replace('-','')
+        if shard is not None:
+            # the shard the verification is in, so verify_email knows where to look
+            code = (self.shard_router.code_prefix(shard) + code)[:len(code)]
+        return code
 
-        if requirements['has_number']['default']:
-            if self.string_has_minimum_numbers(password, requirements['has_number']['min_value']):
-                print("Password has minimum number of numbers")
-            else:
-                return False
+    def generate_site_address(self, request):
+        if self.app.config['SITE_ADDRESS']:
+            return self.app.config['SITE_ADDRESS']
+        return request.environ['HTTP_HOST']
 
-        if requirements['has_upper_case']['default']:
-            if self.string_has_minimum_upper_case_characters(password, requirements['has_upper_case']['min_value']):
-                print("Password has minimum number of upper case characters")
-            else:
-                return False
+    def send_email(self, subject, sender, recipients, html=None, body=None):
+        """
+            Sends right away, or hands the message to the mail dispatcher when
+            MAIL_QUEUE is enabled. Raises MailQueueFull when the dispatcher is
+            full and there is no outbox to hold the message.
+        """
+        mail_dispatcher = self.mail_dispatcher
+        if mail_dispatcher is None:
+            from flask_mail import Message
+            message = Message(subject=subject, sender=sender, recipients=recipients, html=html, body=body)
+            with self.instrumentation.phase('mail'):
+                self.get_mail().send(message)
+            return
+
+        payload = mail_dispatcher.create_payload(subject, sender, recipients, html=html, body=body)
+        if mail_dispatcher.outbox_model is None:
+            # a full queue fails the operation, but the message is only queued once the operation commits
+            mail_dispatcher.ensure_room()
+            after_commit(self.db.session, lambda: self.enqueue_committed_email(payload))
+            return
+
+        # the outbox row commits with the operation, and is only queued once it exists
+        outbox_email = mail_dispatcher.create_outbox_email(payload)
+        self.db.session.flush()
+        payload['outbox_id'] = outbox_email.id
+        after_commit(self.db.session, lambda: self.enqueue_committed_email(payload))
+
+    def enqueue_committed_email(self, payload):
+        try:
+            self.mail_dispatcher.enqueue(payload)
+        except MailQueueFull:
+            # an outbox row waits for the dispatcher to have room; without an outbox the message is lost
+            if payload['outbox_id'] is None:
+                self.mail_dispatcher.record_dropped()
+
+    def get_operation_stats(self):
+        """
+            Statements and commits issued per account operation, e.g.
+            {'log_in': {'calls': 10, 'queries': 30, 'commits': 10, 'queries_per_call': 3.0, ...}}
+        """
+        return query_counter.stats()
 
-        if requirements['has_lower_case']['default']:
-            if self.string_has_minimum_lower_case_characters(password, requirements['has_lower_case']['min_value']):
-                print("Password has minimum number of lower case characters")
-            else:
-                return False
-
-        if requirements['has_special_character']['default']:
-            if self.string_has_minimum_special_characters(
-                password,
-                requirements['has_special_character']['min_value'],
-                requirements['has_special_character']['values']
-            ):
-                print("Password has minimum number of special case characters")
-            else:
-                return False
+    def get_metrics(self, request):
+        """
+            Prometheus text by default, JSON with ?format=json
+        """
+        sink = self.instrumentation.sink
+        if request.args.get('format') == 'json':
+            return Response(sink.render_json(), mimetype='application/json')
+        return Response(sink.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    def get_profiles(self, request):
+        """
+            The latest sampled profiles as JSON, newest first, filtered with
+            ?operation=log_in and ?limit=10. Serve it to admins only: reports
+            hold SQL text and source paths.
+        """
+        if self.profiler is None:
+            return Response('{"error": "profiling is disabled"}', status=404, mimetype='application/json')
+        limit = request.args.get('limit', type=int)
+        reports = self.profiler.get_reports(request.args.get('operation'), limit)
+        return Response(json.dumps(reports), mimetype='application/json')
+
+    def get_profiling_stats(self):
+        if self.profiler is None:
+            return None
+        return self.profiler.stats()
+
+    def get_mail_stats(self):
+        if self.mail_dispatcher is None:
+            return None
+        return self.mail_dispatcher.stats()
+
+    def get_verification_token_serializer(self):
+        return URLSafeTimedSerializer(self.app.secret_key, salt=VERIFICATION_TOKEN_SALT)
+
+    def generate_email_verification_token(self, user, unverified_email):
+        """
+            A signed, timestamped [user id, email, verification version, shard].
+            The user needs an id, so a new user is flushed first.
+        """
+        if user.id is None:
+            self.db.session.flush()
+        return self.get_verification_token_serializer().dumps(
+            [user.id, unverified_email, user.verification_version or 0, sharding.get_object_shard(user)]
+        )
+
+    def load_email_verification_token(self, token):
+        hours_valid = self.app.config['EMAIL_VERIFICATION']['hours_verification_is_valid']
+        try:
+            loaded_token = self.get_verification_token_serializer().loads(
+                token,
+                max_age=hours_valid * constants.SECONDS_IN_HOUR
+            )
+        except (BadSignature, SignatureExpired, ValueError):
+            return None
+
+        # tokens signed before sharding have no shard
+        if len(loaded_token) == 3:
+            loaded_token.append(None)
+        user_id, unverified_email, verification_version, shard = loaded_token
+        return user_id, unverified_email, verification_version, shard
+
+    def verify_email_code(self, verification_code):
+        # expired codes never match
+        EmailVerification = self.models.EmailVerification
+        verification = EmailVerification.query.filter(
+            EmailVerification.code == verification_code,
+            self.verification_is_unexpired(datetime.datetime.now())
+        ).first()
+
+        if verification is None:
+            return False
 
+        user = verification.user
+        user.email = verification.unverified_email
+        user.email_verified = True
+        user.is_active = True
+        self.delete_db_object(verification)
+        # the unique email column rejects an email someone else verified meanwhile
+        try:
+            if self.shard_router is not None:
+                self.move_user_to_email_shard(user)
+            self.db.session.flush()
+        except IntegrityError:
+            self.db.session.rollback()
+            return False
+        self.save_db()
         return True
 
-    def generate_unique_code(self):
-        import uuid
-        return str(uuid.uuid4())
+    def verify_email_token(self, token):
+        """
+            No verification row: the signature and the timestamp are checked in
+            memory, then the user is loaded by id and updated once. Bumping
+            verification_version makes every earlier token for the user unusable.
+            The unique email column rejects an email someone else verified meanwhile.
+        """
+        loaded_token = self.load_email_verification_token(token)
+        if loaded_token is None:
+            return False
 
-    def generate_email_verification_code(self):
-        code = self.generate_unique_code()
-        return code.replace('-','')
+        user_id, unverified_email, verification_version, _ = loaded_token
+        user = self.models.User.query.get(user_id)
+        if user is None or (user.verification_version or 0) != verification_version:
+            return False
 
-    def generate_site_address(self, request):
-        if FlaskSimpleAccounts.app.config['SITE_ADDRESS']:
-            return FlaskSimpleAccounts.app.config['SITE_ADDRESS']
-        return request.environ['HTTP_HOST']
+        user.email = unverified_email
+        user.email_verified = True
+        user.is_active = True
+        user.verification_version = verification_version + 1
+        try:
+            if self.shard_router is not None:
+                self.move_user_to_email_shard(user)
+            self.db.session.flush()
+        except IntegrityError:
+            self.db.session.rollback()
+            return False
+        return True
 
     def send_verification_email(self, request, unverified_email, user):
-        print('sending verification email')
-        mail = Mail(FlaskSimpleAccounts.app)
-        msg = Message(
-            subject=FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION']['subject'],
-            sender=FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION']['sender'],
-            recipients=[unverified_email]
-        )
         site_address = self.generate_site_address(request)
-        verification_code = self.generate_email_verification_code()
-        verification_path = FlaskSimpleAccounts.app.config['SIMPLE_ACCOUNTS_APP_PATHS']['verify_email']
-        self.create_new_verification(verification_code, user, unverified_email)
+        verification_path = self.app.config['SIMPLE_ACCOUNTS_APP_PATHS']['verify_email']
 
-        msg.html = 'Your verification link is: {}{}?verification_code={}'.format(
+        if self.app.config['EMAIL_VERIFICATION']['stateless_tokens']:
+            verification_code = self.generate_email_verification_token(user, unverified_email)
+        else:
+            verification_code = self.generate_email_verification_code(sharding.get_object_shard(user))
+            self.create_new_verification(verification_code, user, unverified_email)
+            # the unique constraints are checked before the email goes out
+            self.db.session.flush()
+
+        verification_link = '{}{}?verification_code={}'.format(
             site_address,
             verification_path,
             verification_code
         )
-        mail.send(msg)
+        html, body = self.render_verification_email(verification_link, unverified_email, self.get_email_locale(request))
+        self.send_email(
+            self.app.config['EMAIL_VERIFICATION']['subject'],
+            self.app.config['EMAIL_VERIFICATION']['sender'],
+            [unverified_email],
+            html=html,
+            body=body
+        )
 
+    def get_email_locale(self, request):
+        verification_config = self.app.config['EMAIL_VERIFICATION']
+        locale = request.accept_languages.best_match(verification_config['locales'])
+        return locale or verification_config['default_locale']
+
+    def render_verification_email(self, verification_link, unverified_email, locale=None):
+        """
+            The html and text bodies, from the compiled templates of
+            EMAIL_VERIFICATION['email_template'] for the locale.
+        """
+        verification_config = self.app.config['EMAIL_VERIFICATION']
+        context = {
+            'subject': verification_config['subject'],
+            'email': unverified_email,
+            'verification_link': verification_link,
+            'hours_valid': verification_config['hours_verification_is_valid'],
+        }
+        email_templates = self.get_email_templates()
+        template = verification_config['email_template']
+        with self.instrumentation.phase('render'):
+            html = email_templates.render(template, 'verification', locale, 'html', context)
+            body = email_templates.render(template, 'verification', locale, 'txt', context)
+
+        if html is None and body is None:
+            raise ValueError('No verification email template named {}'.format(template))
+        return html, body
+
+    @profiled
+    @instrumented
+    @sharded('email')
+    @unit_of_work
     def sign_up(self, request):
         response = {
             'success': False,
@@ -220,63 +957,90 @@ class FlaskSimpleAccounts:
         password = request.values['password']
 
         # validate email
-        if self.email_is_valid(email):
-            print("Email is valid")
-        else:
+        if not self.email_is_valid(email):
+            self.instrumentation.count('email_rejected')
             response['errors'].append('Email is not valid')
             return response
 
         # check if user with email is already in system
-        if self.user_email_is_unique(email):
-            print('User email is unique')
-        else:
+        if not self.user_email_is_unique(email):
+            self.instrumentation.count('email_not_unique')
             response['errors'].append('User email is not unique')
             return response
 
         # validate password
-        if self.password_is_valid(password):
-            print("Password is valid")
-        else:
+        if not self.password_is_valid(password):
+            self.instrumentation.count('password_rejected')
             response['errors'].append('Password is not valid')
             return response
 
         # add user to system
-        new_user = self.create_new_user(password)
-        response['success'] = True
+        try:
+            new_user = self.create_new_user(password)
+        except HashingExecutorSaturated:
+            return self.add_service_unavailable_error(response)
 
         # handle verification
-        if FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION']['enabled']:
-            self.send_verification_email(request, email, new_user)
-        else:
-            new_user.email = email
-            new_user.is_active = True
-            save_db()
+        try:
+            if self.app.config['EMAIL_VERIFICATION']['enabled']:
+                self.send_verification_email(request, email, new_user)
+            else:
+                new_user.email = email
+                new_user.is_active = True
+                self.db.session.flush()
+        except MailQueueFull:
+            return self.add_service_unavailable_error(response)
+        except IntegrityError:
+            # the unique check passed, but another request registered the email first
+            self.instrumentation.count('email_not_unique')
+            response['errors'].append('User email is not unique')
+            return response
 
+        response['success'] = True
         return response
 
+    @profiled
+    @instrumented
+    @sharded('verification_code')
+    @unit_of_work
     def verify_email(self, request):
-        email_is_verified = False
-
         # extract verification code
         verification_code = request.values['verification_code']
 
         # use verification code to find user
-        verification = FlaskSimpleAccounts.models.EmailVerification.query.filter_by(code=verification_code).first()
-
-        if verification:
-            time_difference = datetime.datetime.now() - verification.time_created
-            hours_since_verification_creation = self.convert_seconds_to_hours(time_difference.seconds)
-
-            if hours_since_verification_creation < FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION']['hours_verification_is_valid']:
-                user = verification.user
-                user.email = verification.unverified_email
-                user.email_verified = True
-                user.is_active = True
-                save_db()
-                email_is_verified = True
+        if self.app.config['EMAIL_VERIFICATION']['stateless_tokens']:
+            email_is_verified = self.verify_email_token(verification_code)
+        else:
+            email_is_verified = self.verify_email_code(verification_code)
 
-        verification_config = FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION_TEMPLATE']
+        body, etag = self.get_verification_page(email_is_verified)
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.cache_control.max_age = self.app.config['EMAIL_VERIFICATION']['page_max_age_seconds']
+        response.cache_control.must_revalidate = True
+        return response.make_conditional(request)
 
+    def get_verification_page(self, email_is_verified):
+        """
+            The page only depends on EMAIL_VERIFICATION_TEMPLATE and on the outcome,
+            so each outcome is rendered once and kept as bytes with its ETag.
+            The pages are rendered again when the template config changes.
+        """
+        verification_config = self.app.config['EMAIL_VERIFICATION_TEMPLATE']
+        page_cache = self.verification_pages
+        if page_cache is None or page_cache['config'] != verification_config:
+            page_cache = {'config': dict(verification_config), 'pages': {}}
+            self.verification_pages = page_cache
+
+        page = page_cache['pages'].get(email_is_verified)
+        if page is None:
+            with self.instrumentation.phase('render'):
+                body = self.render_verification_page(email_is_verified, verification_config).encode('utf-8')
+            page = (body, hashlib.sha1(body).hexdigest())
+            page_cache['pages'][email_is_verified] = page
+        return page
+
+    def render_verification_page(self, email_is_verified, verification_config):
         if email_is_verified:
             title = verification_config['success_title']
             message = verification_config['success_message']
@@ -292,6 +1056,9 @@ class FlaskSimpleAccounts:
         }
         context.update(verification_config)
 
+        import flask_beautiful_messages
+        import flask_render_specific_template
+
         beautiful_messages_template = flask_beautiful_messages.get_package_template_dir()
         response = flask_render_specific_template.render_template(
             beautiful_messages_template,
@@ -300,6 +1067,13 @@ class FlaskSimpleAccounts:
         )
         return response
 
+    def clear_verification_pages(self):
+        self.verification_pages = None
+
+    @profiled
+    @instrumented
+    @sharded('email')
+    @unit_of_work
     def log_in(self, request):
         """
         Error messages are vague here on purpose
@@ -312,31 +1086,107 @@ class FlaskSimpleAccounts:
         email = request.form['email']
         password = request.form['password']
 
-        if self.password_is_correct(password, email):
-            user = self.get_user_by_email(email)
+        wait_seconds = self.password_attempt_wait_seconds(request, email)
+        if wait_seconds:
+            return self.add_too_many_requests_error(response, wait_seconds)
+
+        try:
+            # nothing is written when the password is wrong, so the replica can answer
+            password_is_correct = self.password_is_correct(password, email, use_replica=True)
+        except HashingExecutorSaturated:
+            return self.add_service_unavailable_error(response)
+        if password_is_correct:
+            self.refund_password_attempt(email)
+
+        user = None
+        if password_is_correct:
+            user = self.get_user_by_email(email, lookups.IDENTITY_COLUMNS, use_replica=True)
+
+        # deactivated users fail like a wrong password
+        if user is not None and user.is_active:
+            flask_session[SESSION_TOKEN_KEY] = self.session_store.create(user)
+            user.mark_user_as_authenticated()
             flask_login.login_user(user)
-            user.mark_user_as_authenticated(callback=save_db)
             response['success'] = True
+            if user.password_reset_required:
+                response['password_reset_required'] = True
         else:
+            self.instrumentation.count('log_in_failed')
             response['errors'].append('Invalid log in')
         return response
 
+    @profiled
+    @instrumented
+    @sharded('user')
+    @unit_of_work
     def log_out(self, request):
         response = {
             'success': False,
             'errors': [],
         }
         user = self.get_current_user()
-        if not user.is_authenticated:
+        if user is None:
             response['errors'].append("User is not logged in")
         else:
-            user.mark_user_as_anonymous(callback=save_db)
+            self.session_store.revoke(flask_session.pop(SESSION_TOKEN_KEY, None))
+            user.mark_user_as_anonymous()
             flask_login.logout_user()
             response['success'] = True
 
         return response
 
+    @profiled
+    @instrumented
+    @sharded('user')
+    @unit_of_work
+    def log_out_everywhere(self, request):
+        """
+        Ends every session of the logged in user, including this one
+        """
+        response = {
+            'success': False,
+            'errors': [],
+        }
+        user = self.get_current_user()
+        if user is None:
+            response['errors'].append("User is not logged in")
+        else:
+            self.session_store.revoke_all(user)
+            flask_session.pop(SESSION_TOKEN_KEY, None)
+            user.mark_user_as_anonymous()
+            flask_login.logout_user()
+            response['success'] = True
 
+        return response
+
+    @profiled
+    @sharded('user')
+    def get_sessions(self, request):
+        """
+        Lists the sessions of the logged in user, when the session store keeps them
+        """
+        response = {
+            'success': False,
+            'errors': [],
+            'sessions': [],
+        }
+        user = self.get_current_user()
+        if user is None:
+            response['errors'].append("User is not logged in")
+            return response
+
+        try:
+            response['sessions'] = self.session_store.list_sessions(user)
+            response['success'] = True
+        except NotImplementedError as error:
+            response['errors'].append(str(error))
+        return response
+
+
+    @profiled
+    @instrumented
+    @sharded('user')
+    @unit_of_work
     def delete_account(self, request):
         """
         User must be logged in
@@ -347,18 +1197,39 @@ class FlaskSimpleAccounts:
             'errors': [],
         }
 
+        # before get_current_user, which loads the user
+        wait_seconds = self.password_attempt_wait_seconds(request, request.form['email'])
+        if wait_seconds:
+            return self.add_too_many_requests_error(response, wait_seconds)
+
         user = self.get_current_user()
         if user is None or not user.is_authenticated:
             response['errors'].append("User is not logged in")
-        elif self.password_is_correct(request.form['password'], request.form['email']):
-            delete_db_object(user)
-            save_db()
+            return response
+
+        try:
+            password_is_correct = self.password_is_correct(request.form['password'], request.form['email'])
+        except HashingExecutorSaturated:
+            return self.add_service_unavailable_error(response)
+        if password_is_correct:
+            self.refund_password_attempt(request.form['email'])
+
+        if password_is_correct:
+            self.session_store.revoke_all(user)
+            flask_session.pop(SESSION_TOKEN_KEY, None)
+            self.delete_db_object(user)
+            self.save_db()
+            response['success'] = True
         else:
             response['errors'].append('Invalid email/password combination')
 
         return response
 
 
+    @profiled
+    @instrumented
+    @sharded('user')
+    @unit_of_work
     def change_email(self, request):
         """
         User must be logged in
@@ -376,11 +1247,20 @@ class FlaskSimpleAccounts:
             response['errors'].append("User is not logged in")
         elif self.email_is_valid(new_email) and self.user_email_is_unique(new_email):
 
-            if FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION']['enabled']:
-                self.send_verification_email(request, new_email, user)
-            else:
-                user.email = new_email
-            save_db()
+            try:
+                if self.app.config['EMAIL_VERIFICATION']['enabled']:
+                    self.send_verification_email(request, new_email, user)
+                else:
+                    user.email = new_email
+                    self.db.session.flush()
+                    # without a verification step, the user moves to the shard of the new email right away
+                    if self.shard_router is not None:
+                        self.move_user_to_email_shard(user)
+            except MailQueueFull:
+                return self.add_service_unavailable_error(response)
+            except IntegrityError:
+                response['errors'].append('New email is invalid')
+                return response
             response['success'] = True
 
         else:
@@ -388,6 +1268,10 @@ class FlaskSimpleAccounts:
 
         return response
 
+    @profiled
+    @instrumented
+    @sharded('user')
+    @unit_of_work
     def change_password(self, request):
         """
         User must be logged in
@@ -399,56 +1283,661 @@ class FlaskSimpleAccounts:
         }
 
         user = self.get_current_user()
-        email = user.email
         current_password = request.form.get('current_password')
         new_password = request.form.get('new_password')
 
         if user is None or not user.is_authenticated:
             response['errors'].append("User is not logged in")
-        elif self.password_is_correct(current_password, email) and new_password:
-
-            if self.password_is_valid(new_password):
-                new_salt = helper.generate_salt()
-                new_password_hash = helper.hash_password(new_password, new_salt)
-                user.salt = new_salt
-                user.password_hash = new_password_hash
-                save_db()
+            return response
+
+        email = user.email
+
+        wait_seconds = self.password_attempt_wait_seconds(request, email)
+        if wait_seconds:
+            return self.add_too_many_requests_error(response, wait_seconds)
+
+        try:
+            password_is_correct = self.password_is_correct(current_password, email)
+            if password_is_correct:
+                self.refund_password_attempt(email)
+
+            if not password_is_correct or not new_password:
+                response['errors'].append('Invalid email/password combination')
+            elif self.password_is_valid(new_password):
+                user.salt = None
+                user.password_hash = self.encode_password(new_password)
+                user.password_reset_required = False
+                self.save_db()
                 response['success'] = True
             else:
+                self.instrumentation.count('password_rejected')
                 response['errors'].append('New password is invalid')
 
-        else:
-            response['errors'].append('Invalid email/password combination')
+        except HashingExecutorSaturated:
+            return self.add_service_unavailable_error(response)
 
         return response
 
 
-    def convert_seconds_to_hours(self, seconds):
-        seconds_per_hour = 3600
-        return seconds / seconds_per_hour
+    def verification_is_unexpired(self, now):
+        """
+            SQL condition for verifications that can still be used.
+            Rows created before expires_at existed fall back to time_created.
+        """
+        EmailVerification = self.models.EmailVerification
+        hours_valid = self.app.config['EMAIL_VERIFICATION']['hours_verification_is_valid']
+        return or_(
+            EmailVerification.expires_at > now,
+            and_(
+                EmailVerification.expires_at.is_(None),
+                EmailVerification.time_created > now - datetime.timedelta(hours=hours_valid)
+            )
+        )
+
+    def purge_expired_sessions(self):
+        """
+            Drops expired sessions from the session store and returns how many.
+            Signed cookie sessions are not stored, so there is nothing to drop.
+        """
+        return self.session_store.purge_expired()
+
+    def purge_expired_verifications(self, batch_size=1000, progress_callback=None):
+        """
+            Deletes expired verifications, and the never activated users they
+            belong to, in transactions of at most batch_size rows each.
+            Returns the number of verifications and users deleted.
+        """
+        now = datetime.datetime.now()
+        verifications_deleted = 0
+        users_deleted = 0
+
+        for shard in self.get_shards():
+            with self.use_shard(shard):
+                verifications_deleted, users_deleted = self.purge_shard_expired_verifications(
+                    now, batch_size, progress_callback, verifications_deleted, users_deleted
+                )
+
+        return verifications_deleted, users_deleted
+
+    def purge_shard_expired_verifications(self, now, batch_size, progress_callback,
+                                          verifications_deleted, users_deleted):
+        EmailVerification = self.models.EmailVerification
+        User = self.models.User
+        session = self.db.session
+
+        while True:
+            expired = session.query(EmailVerification.id, EmailVerification.user_id).filter(
+                not_(self.verification_is_unexpired(now))
+            ).order_by(EmailVerification.id).limit(batch_size).all()
+
+            if not expired:
+                break
+
+            verification_ids = [verification_id for verification_id, _ in expired]
+            user_ids = [user_id for _, user_id in expired if user_id is not None]
+
+            verifications_deleted += EmailVerification.query.filter(
+                EmailVerification.id.in_(verification_ids)
+            ).delete(synchronize_session=False)
+
+            if user_ids:
+                users_deleted += User.query.filter(
+                    User.id.in_(user_ids),
+                    User.email.is_(None),
+                    not_(User.is_active.is_(True)),
+                    not_(User.email_verification.has())
+                ).delete(synchronize_session=False)
+
+            session.commit()
+            if progress_callback:
+                progress_callback(verifications_deleted, users_deleted)
+
+        return verifications_deleted, users_deleted
+
+    def get_user_cohort(self, registered_before=None, registered_after=None, email_domain=None, emails=None):
+        """
+            SQL condition for the users a maintenance operation applies to.
+            Without arguments, every user.
+        """
+        User = self.models.User
+        conditions = []
+        if registered_before is not None:
+            conditions.append(User.registered_on < registered_before)
+        if registered_after is not None:
+            conditions.append(User.registered_on >= registered_after)
+        if email_domain is not None:
+            conditions.append(User.email.like('%@' + email_domain))
+        if emails is not None:
+            conditions.append(User.email.in_(list(emails)))
+        return and_(*conditions) if conditions else true()
+
+    def update_users_in_batches(self, condition, values, batch_size=1000, progress_callback=None):
+        """
+            Applies values to the users matching condition, batch_size users
+            per transaction. Batches walk the primary key, so each one only
+            reads and locks the rows it updates. The condition is checked
+            again by the update, and should exclude users already updated,
+            so an interrupted run can simply be started again.
+            Returns the number of users updated.
+        """
+        User = self.models.User
+        updated = 0
+
+        for shard in self.get_shards():
+            with self.use_shard(shard):
+                session = self.db.session
+                last_id = 0
+                while True:
+                    batch = session.query(User.id, User.email).filter(
+                        condition,
+                        User.id > last_id
+                    ).order_by(User.id).limit(batch_size).all()
+
+                    if not batch:
+                        break
+
+                    last_id = batch[-1][0]
+                    updated += User.query.filter(
+                        User.id.in_([user_id for user_id, _ in batch]),
+                        condition
+                    ).update(values, synchronize_session=False)
+                    session.commit()
+
+                    # bulk updates skip the flush listeners; other processes catch up within USER_CACHE ttl_seconds
+                    for _, email in batch:
+                        if email is not None:
+                            self.forget_written_email(email)
+                    if progress_callback:
+                        progress_callback(updated)
+
+        return updated
+
+    def deactivate_users(self, cohort, batch_size=1000, progress_callback=None):
+        """
+            Deactivated users cannot log in, and their sessions end on their next request.
+        """
+        User = self.models.User
+        return self.update_users_in_batches(
+            and_(cohort, User.is_active.is_(True)),
+            {User.is_active: False, User.session_version: func.coalesce(User.session_version, 0) + 1},
+            batch_size,
+            progress_callback
+        )
+
+    def require_password_reset(self, cohort, batch_size=1000, progress_callback=None):
+        """
+            log_in reports password_reset_required for these users until they
+            change their password. Signed cookie sessions end; sessions kept
+            by the memory or sqlite stores carry on.
+        """
+        User = self.models.User
+        return self.update_users_in_batches(
+            and_(cohort, not_(User.password_reset_required.is_(True))),
+            {User.password_reset_required: True, User.session_version: func.coalesce(User.session_version, 0) + 1},
+            batch_size,
+            progress_callback
+        )
+
+    def delete_unverified_users(self, older_than_days, batch_size=1000, progress_callback=None):
+        """
+            Deletes users who registered over older_than_days ago and never
+            verified an email, with their verifications, batch_size users per
+            transaction. Returns the number of verifications and users deleted.
+        """
+        EmailVerification = self.models.EmailVerification
+        User = self.models.User
+        registered_before = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+        condition = and_(
+            User.email.is_(None),
+            not_(User.is_active.is_(True)),
+            User.registered_on < registered_before
+        )
+        verifications_deleted = 0
+        users_deleted = 0
+
+        for shard in self.get_shards():
+            with self.use_shard(shard):
+                session = self.db.session
+                while True:
+                    user_ids = [user_id for user_id, in session.query(User.id).filter(
+                        condition
+                    ).order_by(User.id).limit(batch_size)]
+
+                    if not user_ids:
+                        break
+
+                    verifications_deleted += EmailVerification.query.filter(
+                        EmailVerification.user_id.in_(user_ids)
+                    ).delete(synchronize_session=False)
+                    users_deleted += User.query.filter(
+                        User.id.in_(user_ids),
+                        condition
+                    ).delete(synchronize_session=False)
+                    session.commit()
+                    if progress_callback:
+                        progress_callback(verifications_deleted, users_deleted)
+
+        return verifications_deleted, users_deleted
+
+    def export_users(self, output_file, output_format, **options):
+        """
+            Writes every user with an email to output_file as CSV or JSONL.
+            See bulk_export.BulkExporter for the options.
+        """
+        return bulk_export.BulkExporter(self, **options).run(output_file, output_format)
 
     def initialize_db(self):
-        db = FlaskSimpleAccounts.models.db
-        db.app = FlaskSimpleAccounts.app
-        db.init_app(FlaskSimpleAccounts.app)
+        db = self.models.db
+        # the first app is the one used outside of an app context
+        if db.app is None:
+            db.app = self.app
+        db.init_app(self.app)
         return db
 
     def set_app_static_folders(self):
+        import flask_beautiful_messages
         beautiful_messages_static_folder = flask_beautiful_messages.get_package_static_dir()
-        FlaskSimpleAccounts.app.static_folders = [FlaskSimpleAccounts.app.static_folder, beautiful_messages_static_folder]
-        return FlaskSimpleAccounts.app
+        self.app.static_folders = [self.app.static_folder, beautiful_messages_static_folder]
+        return self.app
 
     def customize_app_config(self):
-        FlaskSimpleAccounts.app.config['PASSWORD_REQUIREMENTS'].update(FlaskSimpleAccounts.app.config['CUSTOM_PASSWORD_REQUIREMENTS'])
-        FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION'].update(FlaskSimpleAccounts.app.config['CUSTOM_EMAIL_VERIFICATION'])
-        FlaskSimpleAccounts.app.config['SIMPLE_ACCOUNTS_APP_PATHS'].update(FlaskSimpleAccounts.app.config['CUSTOM_SIMPLE_ACCOUNTS_APP_PATHS'])
-        FlaskSimpleAccounts.app.config['EMAIL_VERIFICATION_TEMPLATE'].update(FlaskSimpleAccounts.app.config['CUSTOM_EMAIL_VERIFICATION_TEMPLATE'])
+        for key in CUSTOMIZABLE_CONFIG_KEYS:
+            # a copy, as app.config.from_object(Config) shares the Config class's dicts between apps
+            config = dict(self.app.config[key])
+            config.update(self.app.config['CUSTOM_' + key])
+            self.app.config[key] = config
+
+        self.password_policy = PasswordPolicy(self.app.config['PASSWORD_REQUIREMENTS'])
 
         # delete old keys
-        del FlaskSimpleAccounts.app.config['CUSTOM_EMAIL_VERIFICATION']
-        del FlaskSimpleAccounts.app.config['CUSTOM_EMAIL_VERIFICATION_TEMPLATE']
-        del FlaskSimpleAccounts.app.config['CUSTOM_PASSWORD_REQUIREMENTS']
-        del FlaskSimpleAccounts.app.config['CUSTOM_SIMPLE_ACCOUNTS_APP_PATHS']
+        for key in CUSTOMIZABLE_CONFIG_KEYS:
+            del self.app.config['CUSTOM_' + key]
 
-        FlaskSimpleAccounts.app = flask_multiple_static_folders.transform_app(FlaskSimpleAccounts.app)
+    def initialize_static_folders(self):
+        import flask_multiple_static_folders
+        self.app = flask_multiple_static_folders.transform_app(self.app)
         self.set_app_static_folders()
+        self.static_folders_initialized = True
+
+    def ensure_static_folders(self):
+        """
+            With LAZY_INITIALIZATION, the static folders are set up by the first request.
+        """
+        if not self.static_folders_initialized:
+            with self.lazy_lock:
+                if not self.static_folders_initialized:
+                    self.initialize_static_folders()
+
+    def initialize_mail(self):
+        from flask_mail import Mail
+        return Mail(self.app)
+
+    def get_mail(self):
+        """
+            With LAZY_INITIALIZATION, Flask-Mail is only set up for the first email.
+        """
+        if self.mail is None:
+            with self.lazy_lock:
+                if self.mail is None:
+                    self.mail = self.initialize_mail()
+        return self.mail
+
+    def initialize_hashing_executor(self):
+        executor_config = self.app.config['HASHING_EXECUTOR']
+        if not executor_config['enabled']:
+            return None
+
+        return HashingExecutor(
+            kind=executor_config['kind'],
+            max_workers=executor_config['max_workers'],
+            max_queue_size=executor_config['max_queue_size'],
+            timeout_seconds=executor_config['timeout_seconds']
+        )
+
+    def create_email_filter(self):
+        filter_config = self.app.config['EMAIL_FILTER']
+        return EmailFilter(
+            false_positive_rate=filter_config['false_positive_rate'],
+            capacity_headroom=filter_config['capacity_headroom'],
+            min_capacity=filter_config['min_capacity'],
+            batch_size=filter_config['build_batch_size'],
+            trust_misses=filter_config['trust_misses']
+        )
+
+    def initialize_email_filter(self):
+        if not self.app.config['EMAIL_FILTER']['enabled']:
+            return None
+
+        email_filter = self.create_email_filter()
+        if self.lazy_initialization:
+            # built by the first uniqueness check instead
+            return email_filter
+        try:
+            self.rebuild_email_filter(email_filter)
+        except SQLAlchemyError:
+            # e.g. the tables do not exist yet; the first unique check builds it
+            self.db.session.rollback()
+        return email_filter
+
+    def rebuild_email_filter(self, email_filter=None):
+        """
+            Streams every registered and pending email into a new filter,
+            e.g. to pick up emails written by other processes.
+        """
+        if email_filter is None:
+            email_filter = self.email_filter
+
+        def build():
+            email_filter.build(
+                self.get_shard_sessions(),
+                self.models.User,
+                self.models.EmailVerification
+            )
+
+        if has_app_context():
+            build()
+        else:
+            with self.app.app_context():
+                build()
+        return email_filter.stats()
+
+    def get_email_filter_stats(self):
+        if self.email_filter is None:
+            return None
+        return self.email_filter.stats()
+
+    def initialize_replica_router(self):
+        replica_config = self.app.config['READ_REPLICA']
+        if not replica_config['enabled']:
+            return None
+
+        replica_router = ReplicaRouter(
+            replica_config['database_uri'],
+            sticky_seconds=replica_config['sticky_seconds'],
+            fallback_to_primary=replica_config['fallback_to_primary']
+        )
+        self.app.teardown_appcontext(replica_router.remove_session)
+        return replica_router
+
+    def initialize_shard_router(self):
+        sharding_config = self.app.config['SHARDING']
+        if not sharding_config['enabled']:
+            return None
+        if self.replica_router is not None:
+            raise ValueError('READ_REPLICA and SHARDING cannot both be enabled')
+
+        return ShardRouter(
+            self.db,
+            self.app,
+            sharding_config['binds'],
+            [self.models.User, self.models.EmailVerification]
+        )
+
+    def get_replica_stats(self):
+        if self.replica_router is None:
+            return None
+        return self.replica_router.stats()
+
+    def initialize_rate_limiter(self):
+        limits_config = self.app.config['RATE_LIMITING']
+        if not limits_config['enabled']:
+            return None
+        return create_rate_limiter(
+            limits_config['backend'],
+            sqlite_path=limits_config['sqlite_path'],
+            max_keys=limits_config['max_keys'],
+            idle_seconds=self.get_rate_limit_idle_seconds(),
+            purge_interval_seconds=limits_config['purge_interval_seconds']
+        )
+
+    def initialize_hash_concurrency_limiter(self):
+        max_in_flight_hashes = self.app.config['RATE_LIMITING']['max_in_flight_hashes']
+        if max_in_flight_hashes is None:
+            return None
+        return HashConcurrencyLimiter(max_in_flight_hashes)
+
+    def initialize_user_cache(self):
+        cache_config = self.app.config['USER_CACHE']
+        if not cache_config['enabled']:
+            return None
+        return UserCache(max_size=cache_config['max_size'], ttl_seconds=cache_config['ttl_seconds'])
+
+    def initialize_mail_dispatcher(self):
+        queue_config = self.app.config['MAIL_QUEUE']
+        if not queue_config['enabled']:
+            return None
+
+        outbox_model = None
+        if queue_config['persistent_outbox']:
+            outbox_model = self.models.OutboxEmail
+
+        mail_dispatcher = MailDispatcher(
+            self.app,
+            self.get_mail(),
+            workers=queue_config['workers'],
+            max_queue_size=queue_config['max_queue_size'],
+            batch_size=queue_config['batch_size'],
+            max_retries=queue_config['max_retries'],
+            retry_backoff_seconds=queue_config['retry_backoff_seconds'],
+            idle_seconds=queue_config['idle_seconds'],
+            db=self.db,
+            outbox_model=outbox_model,
+            outbox_recovery_age_seconds=queue_config['outbox_recovery_age_seconds']
+        )
+        mail_dispatcher.start()
+        return mail_dispatcher
+
+    def import_users(self, records, **options):
+        """
+            records is an iterable of dicts with an email and either a password
+            or a password_hash. See bulk_import.BulkImporter for the options.
+        """
+        return bulk_import.BulkImporter(self, **options).run(records)
+
+    def initialize_instrumentation(self):
+        instrumentation_config = self.app.config['INSTRUMENTATION']
+        sink = instrumentation_config['sink']
+        if sink is None:
+            sink = InMemoryMetricsSink(instrumentation_config['buckets'])
+        return Instrumentation(self.app, enabled=instrumentation_config['enabled'], sink=sink)
+
+    def initialize_profiler(self):
+        profiling_config = self.app.config['PROFILING']
+        if not profiling_config['enabled']:
+            return None
+        return Profiler(
+            sample_rate=profiling_config['sample_rate'],
+            operations=profiling_config['operations'],
+            trace_allocations=profiling_config['trace_allocations'],
+            traceback_frames=profiling_config['traceback_frames'],
+            top=profiling_config['top'],
+            max_reports=profiling_config['max_reports'],
+            dump_dir=profiling_config['dump_dir']
+        )
+
+    def initialize_session_store(self):
+        store_config = self.app.config['SESSION_STORE']
+        return create_session_store(
+            store_config['backend'],
+            store_config['ttl_seconds'],
+            secret_key=self.app.secret_key,
+            sqlite_path=store_config['sqlite_path'],
+            purge_interval_seconds=store_config['purge_interval_seconds']
+        )
+
+    def calibrate_bcrypt_cost(self):
+        hashing_config = self.app.config['PASSWORD_HASHING']
+        return helper.calibrate_bcrypt_cost(
+            hashing_config['target_seconds'],
+            min_cost=hashing_config['min_bcrypt_cost'],
+            max_cost=hashing_config['max_bcrypt_cost']
+        )
+
+    def initialize_bcrypt_cost(self):
+        hashing_config = self.app.config['PASSWORD_HASHING']
+        if hashing_config['calibrate_bcrypt_cost']:
+            hashing_config['bcrypt_cost'] = self.calibrate_bcrypt_cost()
+
+    def register_cli_commands(self):
+
+        @self.app.cli.command('calibrate-bcrypt-cost')
+        def calibrate_bcrypt_cost_command():
+            """Find the highest bcrypt cost that meets the target latency."""
+            cost = self.calibrate_bcrypt_cost()
+            seconds = helper.time_bcrypt_hash(cost)
+            click.echo('bcrypt cost {} takes {:.3f}s per hash on this machine'.format(cost, seconds))
+            click.echo("Set CUSTOM_PASSWORD_HASHING = {{'bcrypt_cost': {}}} to use it".format(cost))
+
+        @self.app.cli.command('purge-expired-verifications')
+        @click.option('--batch-size', default=1000, help='Rows deleted per transaction.')
+        def purge_expired_verifications_command(batch_size):
+            """Delete expired email verifications and never activated users."""
+            def report_progress(verifications_deleted, users_deleted):
+                click.echo('{} verifications and {} users deleted'.format(verifications_deleted, users_deleted))
+
+            verifications_deleted, users_deleted = self.purge_expired_verifications(batch_size, report_progress)
+            click.echo('Done: {} verifications and {} users deleted'.format(verifications_deleted, users_deleted))
+
+        @self.app.cli.command('purge-expired-sessions')
+        def purge_expired_sessions_command():
+            """Delete expired log in sessions from the sqlite session store."""
+            click.echo('{} sessions deleted'.format(self.purge_expired_sessions()))
+
+        @self.app.cli.command('purge-idle-rate-limits')
+        def purge_idle_rate_limits_command():
+            """Delete the password attempt buckets of the sqlite rate limiter that are full again."""
+            click.echo('{} buckets deleted'.format(self.purge_idle_rate_limits()))
+
+        @self.app.cli.command('rebuild-email-filter')
+        def rebuild_email_filter_command():
+            """Build the email Bloom filter and report its size and false positive rate."""
+            stats = self.rebuild_email_filter(self.email_filter or self.create_email_filter())
+            click.echo('{count} emails, capacity {capacity}, {memory_bytes} bytes, {num_hashes} hashes, '
+                       'estimated false positive rate {estimated_false_positive_rate:.4%}'.format(**stats))
+
+        @self.app.cli.command('import-users')
+        @click.argument('path')
+        @click.option('--format', 'input_format', type=click.Choice(['csv', 'jsonl']), default=None,
+                      help='Defaults to the file extension.')
+        @click.option('--chunk-size', default=1000, help='Records hashed and inserted per transaction.')
+        @click.option('--workers', default=None, type=int, help='Hashing processes, defaults to the CPU count.')
+        @click.option('--checkpoint', default=None, help='File that records progress, so the import can resume.')
+        @click.option('--skip-password-validation', is_flag=True, help='Accept passwords that fail PASSWORD_REQUIREMENTS.')
+        @click.option('--inactive', is_flag=True, help='Import accounts without an is_active column as not yet active.')
+        def import_users_command(path, input_format, chunk_size, workers, checkpoint, skip_password_validation, inactive):
+            """Import accounts from a CSV or JSONL file."""
+            def report_progress(report):
+                click.echo('{records_done} records, {imported} imported, {rejected} rejected, '
+                           '{records_per_second:.0f} records/s'.format(**report.as_dict()))
+
+            def report_rejection(line_number, email, reason):
+                click.echo('record {} ({}): {}'.format(line_number, email, reason), err=True)
+
+            with open(path, newline='', encoding='utf-8') as input_file:
+                report = self.import_users(
+                    bulk_import.read_records(input_file, input_format or bulk_import.guess_format(path)),
+                    chunk_size=chunk_size,
+                    workers=workers,
+                    validate_passwords=not skip_password_validation,
+                    activate=not inactive,
+                    checkpoint_path=checkpoint,
+                    progress_callback=report_progress,
+                    rejection_callback=report_rejection
+                )
+            click.echo('Done: {imported} imported, {rejected} rejected'.format(**report.as_dict()))
+
+        @self.app.cli.command('export-users')
+        @click.argument('path')
+        @click.option('--format', 'output_format', type=click.Choice(['csv', 'jsonl']), default=None,
+                      help='Defaults to the file extension.')
+        @click.option('--batch-size', default=1000, help='Rows read from the database at a time.')
+        @click.option('--include-password-hashes', is_flag=True,
+                      help='Export password hashes, which import-users needs to import the file again.')
+        def export_users_command(path, output_format, batch_size, include_password_hashes):
+            """Export accounts to a CSV or JSONL file."""
+            def report_progress(report):
+                click.echo('{exported} exported, {records_per_second:.0f} records/s'.format(**report.as_dict()))
+
+            with open(path, 'w', newline='', encoding='utf-8') as output_file:
+                report = self.export_users(
+                    output_file,
+                    output_format or bulk_import.guess_format(path),
+                    batch_size=batch_size,
+                    include_password_hashes=include_password_hashes,
+                    progress_callback=report_progress
+                )
+            click.echo('Done: {exported} exported'.format(**report.as_dict()))
+
+        def parse_date(context, parameter, value):
+            if value is None:
+                return None
+            try:
+                return datetime.datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise click.BadParameter('expected YYYY-MM-DD')
+
+        def cohort_options(command):
+            options = [
+                click.option('--registered-before', default=None, callback=parse_date, help='YYYY-MM-DD'),
+                click.option('--registered-after', default=None, callback=parse_date, help='YYYY-MM-DD'),
+                click.option('--email-domain', default=None, help='e.g. example.com'),
+                click.option('--emails-file', default=None, help='File with one email per line.'),
+                click.option('--all-users', is_flag=True, help='Needed when no other option picks the users.'),
+                click.option('--batch-size', default=1000, help='Users updated per transaction.'),
+            ]
+            for option in reversed(options):
+                command = option(command)
+            return command
+
+        def each_cohort(registered_before, registered_after, email_domain, emails_file, all_users, batch_size):
+            if not (registered_before or registered_after or email_domain or emails_file or all_users):
+                raise click.UsageError('Pick the users with an option, or pass --all-users')
+
+            if emails_file is None:
+                yield self.get_user_cohort(registered_before, registered_after, email_domain)
+                return
+
+            # the file is read batch_size emails at a time, however long it is
+            with open(emails_file, encoding='utf-8') as lines:
+                emails = []
+                for line in lines:
+                    if line.strip():
+                        emails.append(line.strip())
+                    if len(emails) >= batch_size:
+                        yield self.get_user_cohort(registered_before, registered_after, email_domain, emails)
+                        emails = []
+                if emails:
+                    yield self.get_user_cohort(registered_before, registered_after, email_domain, emails)
+
+        def run_for_cohort(operation, cohort_arguments):
+            total = 0
+
+            def report_progress(updated):
+                click.echo('{} users updated'.format(total + updated))
+
+            for cohort in each_cohort(**cohort_arguments):
+                total += operation(cohort, cohort_arguments['batch_size'], report_progress)
+            click.echo('Done: {} users updated'.format(total))
+
+        @self.app.cli.command('deactivate-users')
+        @cohort_options
+        def deactivate_users_command(**cohort_arguments):
+            """Deactivate accounts and end their sessions."""
+            run_for_cohort(self.deactivate_users, cohort_arguments)
+
+        @self.app.cli.command('require-password-reset')
+        @cohort_options
+        def require_password_reset_command(**cohort_arguments):
+            """Make accounts change their password."""
+            run_for_cohort(self.require_password_reset, cohort_arguments)
+
+        @self.app.cli.command('delete-unverified-users')
+        @click.option('--older-than-days', default=30, help='Only users who registered this long ago.')
+        @click.option('--batch-size', default=1000, help='Users deleted per transaction.')
+        def delete_unverified_users_command(older_than_days, batch_size):
+            """Delete accounts that never verified an email."""
+            def report_progress(verifications_deleted, users_deleted):
+                click.echo('{} verifications and {} users deleted'.format(verifications_deleted, users_deleted))
+
+            verifications_deleted, users_deleted = self.delete_unverified_users(older_than_days, batch_size, report_progress)
+            click.echo('Done: {} verifications and {} users deleted'.format(verifications_deleted, users_deleted))
@@ -0,0 +1,125 @@
+"""
+    Coroutine versions of the account operations, for Flask 2.x async views
+    and other event loops serving the app:
+
+        async_accounts = AsyncSimpleAccounts(simple_accounts)
+
+        @app.route('/log-in', methods=['POST'])
+        async def log_in():
+            return jsonify(await async_accounts.log_in(request))
+
+    The operations still hash, query and send mail synchronously; SQLAlchemy
+    1.1 and Flask-SQLAlchemy have no async driver. Each call runs whole on a
+    bounded thread pool, inside a copy of the current request context that
+    shares its session, so the event loop is never blocked by it and what the
+    operation writes to the session, such as a log in, is kept. Size max_workers like the database
+    connection pool; enable MAIL_QUEUE so sending mail does not hold a worker.
+"""
+import functools
+import threading
+
+
+def get_request_context():
+    # imported here, as Flask 2.2 added request_ctx and Flask 3 removed _request_ctx_stack
+    try:
+        from flask.globals import request_ctx
+    except ImportError:
+        from flask import _request_ctx_stack
+        return _request_ctx_stack.top
+    return request_ctx._get_current_object() if request_ctx else None
+
+
+def run_in_request_context(request_context, request_globals, function):
+    from flask import g
+
+    worker_context = request_context.copy()
+    with worker_context:
+        # before Flask 1.0, copies and pushes open a session of their own, whose writes would be lost
+        worker_context.session = request_context.session
+        try:
+            return function()
+        finally:
+            # the user flask_login loaded or logged in, for current_user in the rest of the request;
+            # kept on the request context before Flask-Login 0.6, and on g since
+            if hasattr(worker_context, 'user'):
+                request_context.user = worker_context.user
+            if '_login_user' in g and g._get_current_object() is not request_globals:
+                request_globals._login_user = g._login_user
+
+
+class AsyncSimpleAccounts:
+
+    def __init__(self, accounts, max_workers=None, executor=None):
+        self.accounts = accounts
+        if executor is None:
+            import concurrent.futures
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='simple-accounts'
+            )
+        self.executor = executor
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+
+    async def run(self, operation, *args, **kwargs):
+        """
+            Runs operation(*args, **kwargs) on the thread pool and waits for it
+            without blocking the loop. Needs a request context.
+        """
+        import asyncio
+        from flask import g
+
+        request_context = get_request_context()
+        if request_context is None:
+            raise RuntimeError('AsyncSimpleAccounts operations need a request context')
+        function = functools.partial(
+            run_in_request_context,
+            request_context,
+            g._get_current_object(),
+            functools.partial(operation, *args, **kwargs)
+        )
+
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, function)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    async def sign_up(self, request):
+        return await self.run(self.accounts.sign_up, request)
+
+    async def verify_email(self, request):
+        return await self.run(self.accounts.verify_email, request)
+
+    async def log_in(self, request):
+        return await self.run(self.accounts.log_in, request)
+
+    async def log_out(self, request):
+        return await self.run(self.accounts.log_out, request)
+
+    async def log_out_everywhere(self, request):
+        return await self.run(self.accounts.log_out_everywhere, request)
+
+    async def get_sessions(self, request):
+        return await self.run(self.accounts.get_sessions, request)
+
+    async def delete_account(self, request):
+        return await self.run(self.accounts.delete_account, request)
+
+    async def change_email(self, request):
+        return await self.run(self.accounts.change_email, request)
+
+    async def change_password(self, request):
+        return await self.run(self.accounts.change_password, request)
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': self.in_flight, 'completed': self.completed}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
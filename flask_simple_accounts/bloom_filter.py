@@ -0,0 +1,74 @@
+import math
+import struct
+import hashlib
+
+
+MAGIC = b'FSABLOOM'
+HEADER = struct.Struct('<8sQQQ')
+
+
+class BloomFilter:
+    """
+        Bit-array Bloom filter over bytes keys. Bit positions come from one
+        blake2b digest split into two 64-bit halves (double hashing).
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=0.01):
+        capacity = max(1, capacity)
+        num_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + number * second) % self.num_bits for number in range(self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def estimated_false_positive_rate(self):
+        if not self.count:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'num_bits': self.num_bits,
+            'num_hashes': self.num_hashes,
+            'memory_bytes': len(self.bits),
+            'estimated_false_positive_rate': self.estimated_false_positive_rate(),
+        }
+
+    def save(self, path):
+        with open(path, 'wb') as bloom_file:
+            bloom_file.write(HEADER.pack(MAGIC, self.num_bits, self.num_hashes, self.count))
+            bloom_file.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as bloom_file:
+            magic, num_bits, num_hashes, count = HEADER.unpack(bloom_file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a bloom filter file'.format(path))
+            bits = bytearray(bloom_file.read())
+        return cls(num_bits, num_hashes, bits=bits, count=count)
@@ -0,0 +1,248 @@
+"""
+    Offline breached-password lookups.
+
+    The corpus is a header followed by sorted, de-duplicated 20 byte SHA-1
+    digests. It is memory-mapped and binary-searched, with a Bloom filter
+    (stored next to it as <corpus>.bloom) in front so most lookups for
+    passwords that are not in the corpus never touch the file.
+
+    Build one from a plain-text corpus, one password or one hex SHA-1 per line
+    (a trailing ':count' is ignored):
+
+        python -m flask_simple_accounts.breached_passwords build pwned-passwords.txt breached.bin
+"""
+import os
+import sys
+import mmap
+import heapq
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+
+from . bloom_filter import BloomFilter
+
+
+MAGIC = b'FSABPW01'
+HEADER = struct.Struct('<8sQ')
+RECORD_SIZE = 20
+HEX_DIGEST_LENGTH = RECORD_SIZE * 2
+
+
+def password_digest(password):
+    return hashlib.sha1(password.encode('utf-8')).digest()
+
+
+def parse_corpus_line(line, corpus_format='auto'):
+    line = line.rstrip('\r\n')
+    if not line:
+        return None
+
+    if corpus_format != 'passwords':
+        candidate = line.split(':', 1)[0]
+        if len(candidate) == HEX_DIGEST_LENGTH:
+            try:
+                return bytes.fromhex(candidate)
+            except ValueError:
+                pass
+        if corpus_format == 'hashes':
+            return None
+
+    return password_digest(line)
+
+
+def bloom_path_for(corpus_path):
+    return corpus_path + '.bloom'
+
+
+def write_run(digests, directory):
+    digests.sort()
+    run_file = tempfile.NamedTemporaryFile(dir=directory, suffix='.run', delete=False)
+    with run_file:
+        run_file.write(b''.join(digests))
+    return run_file.name
+
+
+def read_run(path, records_per_read=65536):
+    with open(path, 'rb') as run_file:
+        while True:
+            block = run_file.read(RECORD_SIZE * records_per_read)
+            if not block:
+                return
+            for offset in range(0, len(block), RECORD_SIZE):
+                yield block[offset:offset + RECORD_SIZE]
+
+
+def build_corpus(lines, output_path, corpus_format='auto', records_per_run=5000000,
+                 false_positive_rate=0.01, progress_callback=None):
+    """
+        Streams lines into sorted runs of at most records_per_run digests,
+        then merges the runs into output_path while building the Bloom filter.
+        Memory use is bounded by records_per_run, not by the corpus size.
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    run_paths = []
+    digests = []
+    total = 0
+
+    try:
+        for line in lines:
+            digest = parse_corpus_line(line, corpus_format)
+            if digest is None:
+                continue
+
+            digests.append(digest)
+            total += 1
+            if len(digests) >= records_per_run:
+                run_paths.append(write_run(digests, directory))
+                digests = []
+                if progress_callback:
+                    progress_callback('read', total)
+
+        if digests:
+            run_paths.append(write_run(digests, directory))
+        digests = None
+
+        bloom_filter = BloomFilter.for_capacity(total, false_positive_rate)
+        count = 0
+        previous = None
+
+        with open(output_path, 'wb') as output_file:
+            output_file.write(HEADER.pack(MAGIC, 0))
+            for digest in heapq.merge(*[read_run(path) for path in run_paths]):
+                if digest == previous:
+                    continue
+                output_file.write(digest)
+                bloom_filter.add(digest)
+                previous = digest
+                count += 1
+                if progress_callback and count % records_per_run == 0:
+                    progress_callback('written', count)
+
+            output_file.seek(0)
+            output_file.write(HEADER.pack(MAGIC, count))
+
+        bloom_filter.save(bloom_path_for(output_path))
+        return count
+
+    finally:
+        for path in run_paths:
+            os.remove(path)
+
+
+class BreachedPasswordCorpus:
+
+    def __init__(self, path, use_bloom_filter=True):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack(self.map[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError('{} is not a breached password corpus'.format(path))
+
+        self.bloom_filter = None
+        if use_bloom_filter and os.path.exists(bloom_path_for(path)):
+            self.bloom_filter = BloomFilter.load(bloom_path_for(path))
+
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.bloom_rejections = 0
+        self.file_searches = 0
+
+    def record_at(self, index):
+        offset = HEADER.size + index * RECORD_SIZE
+        return self.map[offset:offset + RECORD_SIZE]
+
+    def search(self, digest):
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record_at(middle) < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self.count and self.record_at(low) == digest
+
+    def contains_digest(self, digest):
+        if self.bloom_filter is not None and digest not in self.bloom_filter:
+            with self.lock:
+                self.lookups += 1
+                self.bloom_rejections += 1
+            return False
+
+        with self.lock:
+            self.lookups += 1
+            self.file_searches += 1
+        return self.search(digest)
+
+    def contains(self, password):
+        return self.contains_digest(password_digest(password))
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'count': self.count,
+                'file_bytes': len(self.map),
+                'lookups': self.lookups,
+                'bloom_rejections': self.bloom_rejections,
+                'file_searches': self.file_searches,
+            }
+        if self.bloom_filter is not None:
+            stats['bloom_filter'] = self.bloom_filter.stats()
+        return stats
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    build_parser = subparsers.add_parser('build', help='build a corpus file from a plain-text corpus')
+    build_parser.add_argument('input', help="plain-text corpus, or '-' for stdin")
+    build_parser.add_argument('output', help='corpus file to write, the Bloom filter goes to <output>.bloom')
+    build_parser.add_argument('--format', choices=['auto', 'passwords', 'hashes'], default='auto')
+    build_parser.add_argument('--records-per-run', type=int, default=5000000)
+    build_parser.add_argument('--false-positive-rate', type=float, default=0.01)
+
+    check_parser = subparsers.add_parser('check', help='look a password up in a corpus file')
+    check_parser.add_argument('corpus')
+    check_parser.add_argument('password')
+
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == 'build':
+        def report_progress(stage, records):
+            print('{} {} records'.format(stage, records), file=sys.stderr)
+
+        if arguments.input == '-':
+            lines = sys.stdin
+        else:
+            lines = open(arguments.input, encoding='utf-8', errors='replace')
+        with lines:
+            count = build_corpus(
+                lines,
+                arguments.output,
+                corpus_format=arguments.format,
+                records_per_run=arguments.records_per_run,
+                false_positive_rate=arguments.false_positive_rate,
+                progress_callback=report_progress
+            )
+        print('{} unique digests written to {}'.format(count, arguments.output))
+
+    elif arguments.command == 'check':
+        corpus = BreachedPasswordCorpus(arguments.corpus)
+        print('breached' if corpus.contains(arguments.password) else 'not found')
+        corpus.close()
+
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
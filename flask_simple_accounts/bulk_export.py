@@ -0,0 +1,95 @@
+"""
+    Streaming export of accounts to CSV or JSONL, in the format bulk_import
+    reads back. Importing needs a password or a hash for every account, so
+    only an export with include_password_hashes can be imported again.
+
+    Users are read in primary key order as plain column tuples, batch_size
+    rows at a time, so memory stays flat however many there are and nothing
+    is added to the session. Drivers that support it, such as psycopg2, read
+    through a server-side cursor.
+"""
+import csv
+import json
+import time
+import datetime
+
+
+EXPORT_COLUMNS = ('email', 'registered_on', 'is_active', 'password_reset_required')
+
+
+def export_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_users(session, user_model, columns, condition=None, batch_size=1000):
+    query = session.query(*[getattr(user_model, column) for column in columns]).filter(user_model.email.isnot(None))
+    if condition is not None:
+        query = query.filter(condition)
+    # yield_per also sets stream_results, which asks the driver for a server-side cursor
+    for row in query.order_by(user_model.id).yield_per(batch_size):
+        yield dict(zip(columns, [export_value(value) for value in row]))
+
+
+class RecordWriter:
+
+    def __init__(self, output_file, output_format, columns):
+        self.output_file = output_file
+        self.output_format = output_format
+        self.csv_writer = None
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(output_file, fieldnames=columns)
+            self.csv_writer.writeheader()
+        elif output_format != 'jsonl':
+            raise ValueError('Unknown export format: {}'.format(output_format))
+
+    def write(self, record):
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(record)
+        else:
+            self.output_file.write(json.dumps(record) + '\n')
+
+
+class ExportReport:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.exported = 0
+
+    def records_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.exported / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'exported': self.exported,
+            'records_per_second': self.records_per_second(),
+        }
+
+
+class BulkExporter:
+
+    def __init__(self, accounts, batch_size=1000, include_password_hashes=False, condition=None,
+                 progress_callback=None, progress_every=10000):
+        self.accounts = accounts
+        self.batch_size = batch_size
+        self.columns = EXPORT_COLUMNS + (('password_hash',) if include_password_hashes else ())
+        self.condition = condition
+        self.progress_callback = progress_callback
+        self.progress_every = progress_every
+
+    def run(self, output_file, output_format):
+        report = ExportReport()
+        writer = RecordWriter(output_file, output_format, self.columns)
+        User = self.accounts.models.User
+
+        for shard in self.accounts.get_shards():
+            with self.accounts.use_shard(shard):
+                for record in stream_users(self.accounts.db.session, User, self.columns, self.condition, self.batch_size):
+                    writer.write(record)
+                    report.exported += 1
+                    if self.progress_callback and report.exported % self.progress_every == 0:
+                        self.progress_callback(report)
+
+        return report
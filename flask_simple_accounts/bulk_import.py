@@ -0,0 +1,247 @@
+"""
+    Bulk import of accounts from CSV or JSONL.
+
+    Each record needs an email and either a plain-text password, which is
+    validated and hashed across a process pool, or a password_hash already in
+    a format the hashers understand (including plain bcrypt hashes), which is
+    stored as it is. registered_on, is_active and password_reset_required
+    are kept when a record has them, as in a bulk_export file, which can only
+    be imported again when it was exported with the password hashes.
+    Records are written with chunked bulk inserts, and a checkpoint file lets
+    an interrupted import resume after its last chunk.
+"""
+import os
+import csv
+import json
+import time
+import datetime
+
+from . import hashers
+
+
+def read_records(lines, input_format):
+    if input_format == 'csv':
+        for record in csv.DictReader(lines):
+            yield record
+    elif input_format == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            yield json.loads(line) if line else {}
+    else:
+        raise ValueError('Unknown import format: {}'.format(input_format))
+
+
+def guess_format(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+def read_checkpoint(checkpoint_path):
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as checkpoint_file:
+        return json.load(checkpoint_file)['records_done']
+
+
+def write_checkpoint(checkpoint_path, records_done):
+    if checkpoint_path is None:
+        return
+    temporary_path = checkpoint_path + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump({'records_done': records_done}, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def read_flag(value, default):
+    # true in JSONL, True in CSV
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError('Not a boolean: {}'.format(value))
+
+
+def read_datetime(value, default):
+    # datetime.isoformat(), as bulk_export writes it
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        for datetime_format in DATETIME_FORMATS:
+            try:
+                return datetime.datetime.strptime(value, datetime_format)
+            except ValueError:
+                pass
+    raise ValueError('Not a date and time: {}'.format(value))
+
+
+def password_hash_is_supported(password_hash):
+    # parsed, not only matched by prefix, so a hash that log in cannot verify is never stored
+    try:
+        hashers.parse(password_hash)
+    except (ValueError, AttributeError, TypeError):
+        return False
+    return True
+
+
+class ImportReport:
+
+    def __init__(self, records_done=0):
+        self.started = time.perf_counter()
+        self.records_done = records_done
+        self.resumed_from = records_done
+        self.imported = 0
+        self.rejected = 0
+
+    def records_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return (self.records_done - self.resumed_from) / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'records_done': self.records_done,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'records_per_second': self.records_per_second(),
+        }
+
+
+class BulkImporter:
+
+    def __init__(self, accounts, chunk_size=1000, workers=None, validate_passwords=True, activate=True,
+                 checkpoint_path=None, progress_callback=None, rejection_callback=None):
+        self.accounts = accounts
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.validate_passwords = validate_passwords
+        self.activate = activate
+        self.checkpoint_path = checkpoint_path
+        self.progress_callback = progress_callback
+        self.rejection_callback = rejection_callback
+
+    def reject(self, report, line_number, email, reason):
+        report.rejected += 1
+        if self.rejection_callback:
+            self.rejection_callback(line_number, email, reason)
+
+    def run(self, records):
+        import concurrent.futures
+        report = ImportReport(read_checkpoint(self.checkpoint_path))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            chunk = []
+            for line_number, record in enumerate(records, 1):
+                if line_number <= report.resumed_from:
+                    continue
+
+                chunk.append((line_number, record))
+                if len(chunk) >= self.chunk_size:
+                    self.import_chunk(chunk, executor, report)
+                    chunk = []
+
+            if chunk:
+                self.import_chunk(chunk, executor, report)
+
+        return report
+
+    def import_chunk(self, chunk, executor, report):
+        rows, passwords_to_hash = self.validate_chunk(chunk, report)
+
+        hashed_rows = [row for row, _ in passwords_to_hash]
+        passwords = [password for _, password in passwords_to_hash]
+        encode = self.accounts.password_hasher.encode
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        for row, password_hash in zip(hashed_rows, executor.map(encode, passwords, chunksize=chunksize)):
+            row['password_hash'] = password_hash
+
+        # one transaction per shard, so a chunk is only written whole without sharding
+        email_filter = self.accounts.email_filter
+        for shard, shard_rows in self.accounts.group_by_shard(rows, lambda row: row['email']).items():
+            with self.accounts.use_shard(shard):
+                session = self.accounts.db.session
+                session.bulk_insert_mappings(self.accounts.models.User, shard_rows)
+                session.commit()
+
+            # bulk inserts skip the flush listeners
+            if email_filter is not None:
+                for row in shard_rows:
+                    email_filter.add(row['email'])
+
+        report.imported += len(rows)
+        report.records_done = chunk[-1][0]
+        write_checkpoint(self.checkpoint_path, report.records_done)
+        if self.progress_callback:
+            self.progress_callback(report)
+
+    def validate_chunk(self, chunk, report):
+        User = self.accounts.models.User
+        emails = [str(record.get('email') or '').strip() for _, record in chunk]
+        existing_emails = set()
+        for shard, shard_emails in self.accounts.group_by_shard(set(emails), lambda email: email).items():
+            with self.accounts.use_shard(shard):
+                existing_emails.update(
+                    email for email, in self.accounts.db.session.query(User.email).filter(User.email.in_(shard_emails))
+                )
+
+        now = datetime.datetime.now()
+        rows = []
+        passwords_to_hash = []
+        seen_emails = set()
+
+        for (line_number, record), email in zip(chunk, emails):
+            if not email or not self.accounts.email_is_valid(email):
+                self.reject(report, line_number, email, 'Email is not valid')
+                continue
+            if email in existing_emails or email in seen_emails:
+                self.reject(report, line_number, email, 'User email is not unique')
+                continue
+
+            try:
+                registered_on = read_datetime(record.get('registered_on'), now)
+                is_active = read_flag(record.get('is_active'), self.activate)
+                password_reset_required = read_flag(record.get('password_reset_required'), False)
+            except ValueError as error:
+                self.reject(report, line_number, email, str(error))
+                continue
+
+            password_hash = record.get('password_hash')
+            password = record.get('password')
+            row = {
+                'email': email,
+                'salt': None,
+                'password_hash': None,
+                'registered_on': registered_on,
+                'is_active': is_active,
+                'session_version': 0,
+                'verification_version': 0,
+                'password_reset_required': password_reset_required,
+            }
+
+            if password_hash:
+                if not password_hash_is_supported(password_hash):
+                    self.reject(report, line_number, email, 'Password hash format is not supported')
+                    continue
+                row['password_hash'] = password_hash
+            elif password:
+                if self.validate_passwords and not self.accounts.password_is_valid(password):
+                    self.reject(report, line_number, email, 'Password is not valid')
+                    continue
+                passwords_to_hash.append((row, password))
+            else:
+                self.reject(report, line_number, email, 'Password is missing')
+                continue
+
+            seen_emails.add(email)
+            rows.append(row)
+
+        return rows, passwords_to_hash
@@ -6,6 +6,18 @@ class Config(object):
     CUSTOM_EMAIL_VERIFICATION = {}
     CUSTOM_SIMPLE_ACCOUNTS_APP_PATHS = {}
     CUSTOM_EMAIL_VERIFICATION_TEMPLATE = {}
+    CUSTOM_HASHING_EXECUTOR = {}
+    CUSTOM_PASSWORD_HASHING = {}
+    CUSTOM_USER_CACHE = {}
+    CUSTOM_MAIL_QUEUE = {}
+    CUSTOM_SESSION_STORE = {}
+    CUSTOM_INSTRUMENTATION = {}
+    CUSTOM_RATE_LIMITING = {}
+    CUSTOM_READ_REPLICA = {}
+    CUSTOM_EMAIL_FILTER = {}
+    CUSTOM_SHARDING = {}
+    CUSTOM_LAZY_INITIALIZATION = {}
+    CUSTOM_PROFILING = {}
 
     PASSWORD_REQUIREMENTS = {
         'has_length':           {'default': True, 'min_value': 16},
@@ -16,12 +28,24 @@ class Config(object):
 
         'has_special_character':
             {'default': True, 'min_value': 2, 'values': constants.OWASP_APPROVED_SPECIAL_CHARACTERS},
+
+        # corpus_path is a file made by: python -m flask_simple_accounts.breached_passwords build
+        'not_breached':         {'default': False, 'corpus_path': None},
     }
 
     EMAIL_VERIFICATION = {
         'enabled': True,
+        # a dir of templates/email, or of one of email_template_dirs, see email_templates
         'email_template': 'basic',
+        'email_template_dirs': [],
+        # picked from the request's Accept-Language; templates without a locale are the fallback
+        'locales': ['en'],
+        'default_locale': 'en',
         'hours_verification_is_valid': 24,
+        # signed links instead of EmailVerification rows, needs app.secret_key
+        'stateless_tokens': False,
+        # browsers revalidate the verification page with its ETag once this has passed
+        'page_max_age_seconds': 0,
         'subject': 'Email Verification',
         'sender': 'admin@myapp.com'
     }
@@ -49,4 +73,129 @@ class Config(object):
         'change_email': '/change_email',
         'change_password': '/change_password',
         'delete_account': '/delete-account',
+        'metrics': '/simple-accounts/metrics',
+    }
+
+    HASHING_EXECUTOR = {
+        'enabled': False,
+        'kind': 'thread',
+        'max_workers': None,
+        'max_queue_size': 64,
+        'timeout_seconds': 30,
+    }
+
+    PASSWORD_HASHING = {
+        'algorithm': 'bcrypt',
+        'scrypt_n': 2 ** 14,
+        'scrypt_r': 8,
+        'scrypt_p': 1,
+        'pbkdf2_iterations': 260000,
+
+        'bcrypt_cost': 14,
+        'calibrate_bcrypt_cost': False,
+        'target_seconds': 0.25,
+        'min_bcrypt_cost': 10,
+        'max_bcrypt_cost': 16,
+        'rehash_on_log_in': True,
+    }
+
+    USER_CACHE = {
+        'enabled': False,
+        'max_size': 10000,
+        'ttl_seconds': 60,
+    }
+
+    MAIL_QUEUE = {
+        'enabled': False,
+        'workers': 2,
+        'max_queue_size': 1000,
+        'batch_size': 20,
+        'max_retries': 5,
+        'retry_backoff_seconds': 2,
+        'idle_seconds': 30,
+        'persistent_outbox': False,
+        'outbox_recovery_age_seconds': 300,
+    }
+
+    SESSION_STORE = {
+        'backend': 'signed_cookie',
+        'ttl_seconds': constants.SECONDS_IN_DAY * 30,
+        'sqlite_path': 'simple_accounts_sessions.sqlite3',
+        # expired memory and sqlite sessions are dropped while logging in, at most this often;
+        # None leaves it to the purge-expired-sessions command
+        'purge_interval_seconds': constants.SECONDS_IN_HOUR,
+    }
+
+    INSTRUMENTATION = {
+        'enabled': False,
+        'buckets': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+        # any instrumentation.MetricsSink, defaults to an in-memory sink served by get_metrics
+        'sink': None,
+    }
+
+    RATE_LIMITING = {
+        'enabled': False,
+        # memory, or sqlite to share the limits between workers on one machine
+        'backend': 'memory',
+        'sqlite_path': 'simple_accounts_rate_limits.sqlite3',
+        'max_keys': 100000,
+        # idle sqlite buckets are deleted while taking tokens, at most this often;
+        # None leaves it to the purge-idle-rate-limits command
+        'purge_interval_seconds': constants.SECONDS_IN_HOUR,
+        # password attempts allowed in a burst, then one more every 1 / refill_per_second seconds
+        'per_ip': {'capacity': 20, 'refill_per_second': 20 / constants.SECONDS_IN_MINUTE},
+        'per_email': {'capacity': 5, 'refill_per_second': 5 / (constants.SECONDS_IN_MINUTE * 15)},
+        # hashes running at once in this process, None for no cap; applies even when not enabled
+        'max_in_flight_hashes': None,
+    }
+
+    READ_REPLICA = {
+        'enabled': False,
+        'database_uri': None,
+        # after a user is written, its lookups stay on the primary this long
+        'sticky_seconds': 5,
+        # look on the primary when the replica has no such user, e.g. one who just signed up
+        'fallback_to_primary': True,
+    }
+
+    # a Bloom filter of registered and pending emails, see email_filter
+    EMAIL_FILTER = {
+        'enabled': False,
+        'false_positive_rate': 0.01,
+        # room for this many times the emails there are when the filter is built
+        'capacity_headroom': 2.0,
+        'min_capacity': 10000,
+        'build_batch_size': 10000,
+        # a miss skips the query only when every process writing accounts adds to this filter,
+        # e.g. a single process; otherwise the database still decides
+        'trust_misses': False,
+    }
+
+    # User and EmailVerification spread over SQLALCHEMY_BINDS by email, see sharding
+    SHARDING = {
+        'enabled': False,
+        # SQLALCHEMY_BINDS keys, one per shard; the order decides which shard an email hashes to
+        'binds': [],
+    }
+
+    # for workers that start often: Flask-Mail, the email templates, the static folders
+    # and the email filter are set up on first use instead of when FlaskSimpleAccounts is created
+    LAZY_INITIALIZATION = {
+        'enabled': False,
+    }
+
+    # cProfile, tracemalloc and SQL reports of a sample of the account operations, see profiler
+    PROFILING = {
+        'enabled': False,
+        # fraction of the calls profiled, low enough to leave on in production
+        'sample_rate': 0.01,
+        # names of the operations to sample, None for all of them
+        'operations': None,
+        'trace_allocations': True,
+        'traceback_frames': 1,
+        # functions, statements and allocations listed per report
+        'top': 25,
+        'max_reports': 100,
+        # also write each report there, as JSON and as a .pstats file for pstats or snakeviz
+        'dump_dir': None,
     }
@@ -3,3 +3,6 @@ OWASP_APPROVED_SPECIAL_CHARACTERS = """ !"#$%&'()*+,-./:;<=>?@[\]^_`{|}~"""
 SECONDS_IN_MINUTE = 60
 SECONDS_IN_HOUR = SECONDS_IN_MINUTE * 60
 SECONDS_IN_DAY = SECONDS_IN_HOUR * 24
+
+HTTP_TOO_MANY_REQUESTS = 429
+HTTP_SERVICE_UNAVAILABLE = 503
@@ -0,0 +1,144 @@
+"""
+    A Bloom filter of every registered and pending email, so checking that a
+    new email is unique only needs a query when the filter might contain it.
+
+    The filter is built by streaming User.email and
+    EmailVerification.unverified_email, and emails written by this process are
+    added as they are flushed or bulk inserted. Emails written by other
+    processes are only seen after a rebuild, so a miss is only trusted, and
+    the query skipped, with trust_misses, for deployments where every writer
+    adds to the filter. Otherwise the database still decides, and a user found
+    after a miss is added to the filter and counted as a stale miss.
+"""
+import threading
+
+from . bloom_filter import BloomFilter
+
+
+class EmailFilter:
+
+    def __init__(self, false_positive_rate=0.01, capacity_headroom=2.0, min_capacity=10000, batch_size=10000,
+                 trust_misses=False):
+        self.false_positive_rate = false_positive_rate
+        self.capacity_headroom = capacity_headroom
+        self.min_capacity = min_capacity
+        self.batch_size = batch_size
+        self.trust_misses = trust_misses
+
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.bloom_filter = None
+        self.capacity = 0
+        self.emails_added_while_building = None
+
+        self.checks = 0
+        self.definitely_absent = 0
+        self.false_positives = 0
+        self.stale_misses = 0
+        self.builds = 0
+
+    def count_rows(self, sessions, user_model, verification_model):
+        return sum(
+            session.query(user_model.id).filter(user_model.email.isnot(None)).count() +
+            session.query(verification_model.id).filter(verification_model.unverified_email.isnot(None)).count()
+            for session in sessions
+        )
+
+    def stream_emails(self, sessions, user_model, verification_model):
+        for session in sessions:
+            for column in (user_model.email, verification_model.unverified_email):
+                for email, in session.query(column).filter(column.isnot(None)).yield_per(self.batch_size):
+                    yield email
+
+    def build(self, sessions, user_model, verification_model):
+        """
+            Builds a new filter from sessions, one per shard, and swaps it in.
+            Emails added while it is being built are added to it too, so none
+            are missed.
+        """
+        with self.build_lock:
+            self.build_filter(sessions, user_model, verification_model)
+
+    def build_if_missing(self, sessions, user_model, verification_model):
+        # requests do not wait for a build another thread has started
+        if self.bloom_filter is not None or not self.build_lock.acquire(blocking=False):
+            return
+        try:
+            if self.bloom_filter is None:
+                self.build_filter(sessions, user_model, verification_model)
+        finally:
+            self.build_lock.release()
+
+    def build_filter(self, sessions, user_model, verification_model):
+        with self.lock:
+            self.emails_added_while_building = []
+
+        try:
+            rows = self.count_rows(sessions, user_model, verification_model)
+            capacity = max(self.min_capacity, int(rows * self.capacity_headroom))
+            bloom_filter = BloomFilter.for_capacity(capacity, self.false_positive_rate)
+            for email in self.stream_emails(sessions, user_model, verification_model):
+                bloom_filter.add(email.encode('utf-8'))
+        except Exception:
+            with self.lock:
+                self.emails_added_while_building = None
+            raise
+
+        with self.lock:
+            for email in self.emails_added_while_building:
+                bloom_filter.add(email.encode('utf-8'))
+            self.emails_added_while_building = None
+            self.bloom_filter = bloom_filter
+            self.capacity = capacity
+            self.builds += 1
+
+    def add(self, email):
+        key = email.encode('utf-8')
+        with self.lock:
+            if self.emails_added_while_building is not None:
+                self.emails_added_while_building.append(email)
+            if self.bloom_filter is not None:
+                self.bloom_filter.add(key)
+
+    def might_contain(self, email):
+        """
+            False means the email is definitely not registered or pending.
+            An unbuilt filter might contain anything.
+        """
+        key = email.encode('utf-8')
+        with self.lock:
+            self.checks += 1
+            if self.bloom_filter is None or key in self.bloom_filter:
+                return True
+            self.definitely_absent += 1
+            return False
+
+    def record_false_positive(self):
+        # the filter might have contained the email but no user has it,
+        # which includes emails that are only pending verification
+        with self.lock:
+            self.false_positives += 1
+
+    def record_stale_miss(self, email):
+        # written by a writer that does not add to the filter, e.g. another process
+        self.add(email)
+        with self.lock:
+            self.stale_misses += 1
+
+    def stats(self):
+        with self.lock:
+            negatives = self.definitely_absent + self.false_positives
+            stats = {
+                'built': self.bloom_filter is not None,
+                'builds': self.builds,
+                'capacity': self.capacity,
+                'checks': self.checks,
+                'definitely_absent': self.definitely_absent,
+                'false_positives': self.false_positives,
+                'stale_misses': self.stale_misses,
+                'observed_false_positive_rate': self.false_positives / negatives if negatives else 0.0,
+            }
+            if self.bloom_filter is not None:
+                stats.update(self.bloom_filter.stats())
+                stats['over_capacity'] = self.bloom_filter.count > self.capacity
+            return stats
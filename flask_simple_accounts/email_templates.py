@@ -0,0 +1,73 @@
+"""
+    Jinja templates for the emails sent to users, e.g. for template 'basic':
+
+        <template dir>/basic/verification.html
+        <template dir>/basic/verification.txt
+        <template dir>/basic/<locale>/verification.html     optional, per locale
+
+    Each template is read and compiled the first time it is asked for, by
+    name, message, locale and format, and kept for the life of the process.
+    Rendering a message only fills in its context. Templates are not
+    reloaded when the files change.
+"""
+import threading
+
+
+MISSING = object()
+
+
+class EmailTemplates:
+
+    def __init__(self, template_dirs):
+        import jinja2
+        self.template_not_found = jinja2.TemplateNotFound
+        self.environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(template_dirs),
+            autoescape=lambda template_name: template_name is not None and template_name.endswith('.html'),
+            # compiled templates are kept in self.templates, so the files are never checked again
+            auto_reload=False
+        )
+
+        self.lock = threading.Lock()
+        self.templates = {}
+        self.compiled = 0
+        self.renders = 0
+
+    def get_template(self, name, message, locale, file_format):
+        """
+            The compiled template for the locale, falling back to the one
+            without a locale. None when neither exists.
+        """
+        key = (name, message, locale, file_format)
+        template = self.templates.get(key, MISSING)
+        if template is not MISSING:
+            return template
+
+        candidates = ['{}/{}.{}'.format(name, message, file_format)]
+        if locale:
+            candidates.insert(0, '{}/{}/{}.{}'.format(name, locale, message, file_format))
+        try:
+            template = self.environment.select_template(candidates)
+        except self.template_not_found:
+            template = None
+
+        with self.lock:
+            self.templates[key] = template
+            self.compiled += 1
+        return template
+
+    def render(self, name, message, locale, file_format, context):
+        template = self.get_template(name, message, locale, file_format)
+        if template is None:
+            return None
+        with self.lock:
+            self.renders += 1
+        return template.render(context)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'templates': len(self.templates),
+                'compiled': self.compiled,
+                'renders': self.renders,
+            }
@@ -0,0 +1,186 @@
+"""
+    Password hashers keyed by the algorithm prefix stored in User.password_hash:
+
+        bcrypt$<bcrypt hash>
+        scrypt$<n>$<r>$<p>$<salt>$<hash>
+        pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+    Hashes written before the prefix existed are plain bcrypt hashes
+    ($2b$...) and are handled by the bcrypt hasher as well.
+"""
+import os
+import re
+import hmac
+import base64
+import hashlib
+
+from . import helper
+
+
+SEPARATOR = '$'
+LEGACY_BCRYPT_PREFIX = '$2'
+BCRYPT_HASH = re.compile(r'\$2[abxy]?\$\d\d\$[./A-Za-z0-9]{53}\Z')
+
+HASHERS = {}
+
+
+def register_hasher(hasher_class):
+    HASHERS[hasher_class.algorithm] = hasher_class
+    return hasher_class
+
+
+def get_hasher(algorithm, **parameters):
+    if algorithm not in HASHERS:
+        raise ValueError('Unknown password hasher: {}'.format(algorithm))
+    return HASHERS[algorithm](**parameters)
+
+
+def to_text(value):
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+def identify_algorithm(encoded):
+    encoded = to_text(encoded)
+    if encoded.startswith(LEGACY_BCRYPT_PREFIX):
+        return BcryptHasher.algorithm
+    return encoded.split(SEPARATOR, 1)[0]
+
+
+def parse(encoded, **parameters):
+    """
+        The hasher for encoded, after checking that it can read encoded.
+        Raises ValueError for an unknown algorithm or a malformed hash.
+    """
+    if not isinstance(to_text(encoded), str):
+        raise ValueError('Password hash is not text')
+    hasher = get_hasher(identify_algorithm(encoded), **parameters)
+    try:
+        hasher.split(encoded)
+    except (ValueError, TypeError) as error:
+        raise ValueError('Malformed {} password hash'.format(hasher.algorithm)) from error
+    return hasher
+
+
+def b64encode(raw_bytes):
+    return base64.b64encode(raw_bytes).decode('ascii')
+
+
+def b64decode(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+class PasswordHasher:
+    algorithm = None
+
+    def encode(self, password):
+        raise NotImplementedError
+
+    def verify(self, password, encoded):
+        raise NotImplementedError
+
+    def needs_update(self, encoded):
+        """
+            True when encoded was produced with different parameters than
+            the ones this hasher was configured with.
+        """
+        raise NotImplementedError
+
+
+@register_hasher
+class BcryptHasher(PasswordHasher):
+    algorithm = 'bcrypt'
+
+    def __init__(self, cost=helper.DEFAULT_BCRYPT_COST):
+        self.cost = cost
+
+    def split(self, encoded):
+        encoded = to_text(encoded)
+        if not encoded.startswith(LEGACY_BCRYPT_PREFIX):
+            encoded = encoded[len(self.algorithm) + 1:]
+        if not BCRYPT_HASH.match(encoded):
+            raise ValueError('Malformed bcrypt hash')
+        return encoded
+
+    def encode(self, password):
+        salt = helper.generate_salt(self.cost)
+        bcrypt_hash = to_text(helper.hash_password(password, salt))
+        return self.algorithm + SEPARATOR + bcrypt_hash
+
+    def verify(self, password, encoded):
+        # a bcrypt hash starts with its own salt, so it can be passed back as the salt
+        bcrypt_hash = self.split(encoded)
+        candidate = to_text(helper.hash_password(password, bcrypt_hash.encode()))
+        return hmac.compare_digest(candidate, bcrypt_hash)
+
+    def needs_update(self, encoded):
+        encoded = to_text(encoded)
+        if encoded.startswith(LEGACY_BCRYPT_PREFIX):
+            return True
+        return helper.get_bcrypt_cost(self.split(encoded)) != self.cost
+
+
+@register_hasher
+class ScryptHasher(PasswordHasher):
+    algorithm = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1, salt_bytes=16, key_bytes=64):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt_bytes = salt_bytes
+        self.key_bytes = key_bytes
+
+    def derive(self, password, salt, n, r, p, key_bytes):
+        # scrypt needs roughly 128 * r * (n + p) bytes, which is above hashlib's 32MB default for larger n
+        maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=key_bytes)
+
+    def encode(self, password):
+        salt = os.urandom(self.salt_bytes)
+        key = self.derive(password, salt, self.n, self.r, self.p, self.key_bytes)
+        return SEPARATOR.join([self.algorithm, str(self.n), str(self.r), str(self.p), b64encode(salt), b64encode(key)])
+
+    def split(self, encoded):
+        _, n, r, p, salt, key = to_text(encoded).split(SEPARATOR)
+        return int(n), int(r), int(p), b64decode(salt), b64decode(key)
+
+    def verify(self, password, encoded):
+        n, r, p, salt, key = self.split(encoded)
+        candidate = self.derive(password, salt, n, r, p, len(key))
+        return hmac.compare_digest(candidate, key)
+
+    def needs_update(self, encoded):
+        n, r, p, _, key = self.split(encoded)
+        return (n, r, p, len(key)) != (self.n, self.r, self.p, self.key_bytes)
+
+
+@register_hasher
+class PBKDF2Hasher(PasswordHasher):
+    algorithm = 'pbkdf2_sha256'
+    digest = 'sha256'
+
+    def __init__(self, iterations=260000, salt_bytes=16):
+        self.iterations = iterations
+        self.salt_bytes = salt_bytes
+
+    def derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac(self.digest, password.encode(), salt, iterations)
+
+    def encode(self, password):
+        salt = os.urandom(self.salt_bytes)
+        key = self.derive(password, salt, self.iterations)
+        return SEPARATOR.join([self.algorithm, str(self.iterations), b64encode(salt), b64encode(key)])
+
+    def split(self, encoded):
+        _, iterations, salt, key = to_text(encoded).split(SEPARATOR)
+        return int(iterations), b64decode(salt), b64decode(key)
+
+    def verify(self, password, encoded):
+        iterations, salt, key = self.split(encoded)
+        return hmac.compare_digest(self.derive(password, salt, iterations), key)
+
+    def needs_update(self, encoded):
+        iterations, _, _ = self.split(encoded)
+        return iterations != self.iterations
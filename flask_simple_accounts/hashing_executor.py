@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+
+
+class HashingExecutorSaturated(Exception):
+    pass
+
+
+def run_timed(function, *args):
+    # runs inside the worker, so the start time marks the end of the queue wait
+    started = time.time()
+    return started, function(*args)
+
+
+class HashingExecutor:
+    """
+        Runs password hashing on a bounded pool of workers.
+        bcrypt releases the GIL, so a thread pool scales with cores.
+        Once every worker is busy and the queue is full, new work is rejected
+        instead of piling up behind the request threads.
+        max_workers defaults to the number of CPUs.
+    """
+
+    def __init__(self, kind='thread', max_workers=None, max_queue_size=64, timeout_seconds=None):
+        import concurrent.futures
+        self.timeout_error = concurrent.futures.TimeoutError
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        if kind == 'process':
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        elif kind == 'thread':
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError('Unknown hashing executor kind: {}'.format(kind))
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.timeout_seconds = timeout_seconds
+        self.slots = threading.BoundedSemaphore(self.max_workers + max_queue_size)
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def run(self, function, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HashingExecutorSaturated()
+
+        submitted_at = time.time()
+        with self.lock:
+            self.in_flight += 1
+            self.submitted += 1
+
+        try:
+            future = self.executor.submit(run_timed, function, *args)
+        except Exception:
+            self.release_slot()
+            raise
+        future.add_done_callback(lambda finished: self.record_finished(finished, submitted_at))
+
+        try:
+            started_at, result = future.result(timeout=self.timeout_seconds)
+        except self.timeout_error:
+            with self.lock:
+                self.timed_out += 1
+            raise HashingExecutorSaturated()
+        return result
+
+    def release_slot(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def record_finished(self, future, submitted_at):
+        if not future.cancelled() and future.exception() is None:
+            started_at, _ = future.result()
+            wait_seconds = max(0.0, started_at - submitted_at)
+            with self.lock:
+                self.completed += 1
+                self.total_wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.release_slot()
+
+    def stats(self):
+        with self.lock:
+            finished = self.completed
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue_size': self.max_queue_size,
+                'in_flight': self.in_flight,
+                'queue_depth': max(0, self.in_flight - self.max_workers),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'mean_wait_seconds': self.total_wait_seconds / finished if finished else 0.0,
+                'max_wait_seconds': self.max_wait_seconds,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -1,13 +1,55 @@
+import time
 import base64
+import hashlib
 
 
-def generate_salt():
-    import bcrypt
-    return bcrypt.gensalt(14)
+DEFAULT_BCRYPT_COST = 14
+
+bcrypt = None
+
+
+def load_bcrypt():
+    # imported on first use instead of with the package, then kept
+    global bcrypt
+    if bcrypt is None:
+        import bcrypt as bcrypt_module
+        bcrypt = bcrypt_module
+    return bcrypt
+
+
+def generate_salt(cost=DEFAULT_BCRYPT_COST):
+    return load_bcrypt().gensalt(cost)
+
+
+def get_bcrypt_cost(bcrypt_hash):
+    """
+        bcrypt salts and hashes carry their cost, e.g. $2b$14$<salt><checksum>
+    """
+    if isinstance(bcrypt_hash, bytes):
+        bcrypt_hash = bcrypt_hash.decode()
+    return int(bcrypt_hash.split('$')[2])
+
+
+def time_bcrypt_hash(cost, password='calibration-password'):
+    salt = generate_salt(cost)
+    start = time.perf_counter()
+    hash_password(password, salt)
+    return time.perf_counter() - start
+
+
+def calibrate_bcrypt_cost(target_seconds, min_cost=4, max_cost=31):
+    """
+        Returns the highest cost whose hash time stays within target_seconds
+        on this machine. Each extra cost unit doubles the work, so the search
+        stops at the first cost that misses the target.
+    """
+    cost = min_cost
+    while cost < max_cost and time_bcrypt_hash(cost + 1) <= target_seconds:
+        cost += 1
+    return cost
 
 
 def make_hash_length_less_than_72(string):
-    import hashlib
     return base64.b64encode(hashlib.sha256(string.encode()).digest())
 
 
@@ -16,7 +58,6 @@ def remove_null_bytes(string):
 
 
 def hash_password(password, salt):
-    import bcrypt
     """
         This implementation of bcrypt ignores strings over 72 characters.
         Therefore, the string is shortened by pre-hashing it.
@@ -24,4 +65,4 @@ def hash_password(password, salt):
     """
     shorten_password = make_hash_length_less_than_72(password)
     shorten_password_without_null_bytes = remove_null_bytes(shorten_password)
-    return bcrypt.hashpw(shorten_password_without_null_bytes, salt)
+    return load_bcrypt().hashpw(shorten_password_without_null_bytes, salt)
@@ -0,0 +1,223 @@
+"""
+    Timing and outcome metrics for the account operations.
+
+    Every operation records its total latency and the time spent in each
+    phase (hash, db, mail, render) into a metrics sink, and sends the
+    operation_finished signal. Outcomes such as rejected passwords or failed
+    log ins are counted and sent as outcome_recorded. When instrumentation is
+    disabled, the wrappers make a single attribute check and nothing else.
+"""
+import json
+import time
+import bisect
+import functools
+import threading
+
+from flask.signals import Namespace
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+signals = Namespace()
+operation_finished = signals.signal('simple-accounts-operation-finished')
+outcome_recorded = signals.signal('simple-accounts-outcome-recorded')
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the Instrumentation running an operation in this thread, which the query listeners report to
+active = threading.local()
+listeners_lock = threading.Lock()
+listening_for_queries = False
+
+
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    if getattr(active, 'instrumentation', None) is not None:
+        active.query_started = time.perf_counter()
+
+
+def stop_query_timer(connection, cursor, statement, parameters, context, executemany):
+    instrumentation = getattr(active, 'instrumentation', None)
+    if instrumentation is not None:
+        instrumentation.add_phase_time('db', time.perf_counter() - active.query_started)
+
+
+def listen_for_queries():
+    # once per process, so the listeners neither hold on to instances nor pile up with them
+    global listening_for_queries
+    with listeners_lock:
+        if not listening_for_queries:
+            event.listen(Engine, 'before_cursor_execute', start_query_timer)
+            event.listen(Engine, 'after_cursor_execute', stop_query_timer)
+            listening_for_queries = True
+
+
+class MetricsSink:
+
+    def observe(self, operation, phase, seconds):
+        raise NotImplementedError
+
+    def increment(self, outcome, amount=1):
+        raise NotImplementedError
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class InMemoryMetricsSink(MetricsSink):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, operation, phase, seconds):
+        with self.lock:
+            histogram = self.histograms.get((operation, phase))
+            if histogram is None:
+                histogram = self.histograms[(operation, phase)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, outcome, amount=1):
+        with self.lock:
+            self.counters[outcome] = self.counters.get(outcome, 0) + amount
+
+    def as_dict(self):
+        with self.lock:
+            operations = {}
+            for (operation, phase), histogram in sorted(self.histograms.items()):
+                operations.setdefault(operation, {})[phase] = {
+                    'count': histogram.count,
+                    'sum_seconds': histogram.sum,
+                    'mean_seconds': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'buckets': dict(zip([str(bucket) for bucket in self.buckets] + ['+Inf'], histogram.cumulative_counts())),
+                }
+            return {'operations': operations, 'outcomes': dict(self.counters)}
+
+    def render_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def render_prometheus(self):
+        lines = [
+            '# HELP simple_accounts_operation_seconds Account operation latency by phase.',
+            '# TYPE simple_accounts_operation_seconds histogram',
+        ]
+        with self.lock:
+            for (operation, phase), histogram in sorted(self.histograms.items()):
+                labels = 'operation="{}",phase="{}"'.format(operation, phase)
+                bounds = [repr(bucket) for bucket in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    lines.append('simple_accounts_operation_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+                lines.append('simple_accounts_operation_seconds_sum{{{}}} {}'.format(labels, histogram.sum))
+                lines.append('simple_accounts_operation_seconds_count{{{}}} {}'.format(labels, histogram.count))
+
+            lines.append('# HELP simple_accounts_outcomes_total Account operation outcomes.')
+            lines.append('# TYPE simple_accounts_outcomes_total counter')
+            for outcome, count in sorted(self.counters.items()):
+                lines.append('simple_accounts_outcomes_total{{outcome="{}"}} {}'.format(outcome, count))
+        return '\n'.join(lines) + '\n'
+
+
+class NullPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase:
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.add_phase_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Instrumentation:
+
+    def __init__(self, app, enabled=False, sink=None):
+        self.app = app
+        self.enabled = enabled
+        self.sink = sink if sink is not None else InMemoryMetricsSink()
+        self.local = threading.local()
+        if enabled:
+            listen_for_queries()
+
+    def add_phase_time(self, name, seconds):
+        phases = getattr(self.local, 'phases', None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def count(self, outcome):
+        if not self.enabled:
+            return
+        self.sink.increment(outcome)
+        outcome_recorded.send(self.app, outcome=outcome)
+
+    def run_operation(self, name, operation, *args, **kwargs):
+        outer_phases = getattr(self.local, 'phases', None)
+        outer_instrumentation = getattr(active, 'instrumentation', None)
+        self.local.phases = {}
+        active.instrumentation = self
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            result = operation(*args, **kwargs)
+            succeeded = not isinstance(result, dict) or result.get('success', False)
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            phases = self.local.phases
+            self.local.phases = outer_phases
+            active.instrumentation = outer_instrumentation
+
+            self.sink.observe(name, 'total', seconds)
+            for phase_name, phase_seconds in phases.items():
+                self.sink.observe(name, phase_name, phase_seconds)
+            self.count('{}.{}'.format(name, 'success' if succeeded else 'failure'))
+            operation_finished.send(self.app, operation=name, seconds=seconds, phases=phases, success=succeeded)
+
+
+def instrumented(operation):
+    @functools.wraps(operation)
+    def run_operation(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None or not instrumentation.enabled:
+            return operation(self, *args, **kwargs)
+        return instrumentation.run_operation(operation.__name__, operation, self, *args, **kwargs)
+
+    return run_operation
@@ -0,0 +1,56 @@
+"""
+    User lookups by email through baked queries, so the ORM builds and
+    compiles each statement once per process instead of on every call.
+
+    Password checks only read CREDENTIAL_COLUMNS, as plain rows without an
+    entity. The flask_login user_loader only loads IDENTITY_COLUMNS; any
+    other column of that user loads on first access.
+"""
+import collections
+
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import load_only, scoped_session
+
+
+CREDENTIAL_COLUMNS = ('id', 'salt', 'password_hash')
+IDENTITY_COLUMNS = ('id', 'email', 'is_active', 'session_version', 'password_reset_required')
+
+Credentials = collections.namedtuple('Credentials', CREDENTIAL_COLUMNS)
+
+bakery = baked.bakery()
+
+
+def get_session(session):
+    # baked queries run on a Session, not on the scoped_session proxy
+    if isinstance(session, scoped_session):
+        return session()
+    return session
+
+
+def find_user(session, user_model, email, columns=None):
+    # the cache key is each step's code plus the values passed next to it,
+    # so every model and column set gets its own statement
+    query = bakery(lambda session: session.query(user_model), user_model)
+    if columns is not None:
+        query.add_criteria(lambda query: query.options(load_only(*columns)), tuple(columns))
+    query.add_criteria(lambda query: query.filter(user_model.email == bindparam('email')), user_model)
+    return query(get_session(session)).params(email=email).first()
+
+
+def find_credentials(session, user_model, email):
+    query = bakery(
+        lambda session: session.query(*[getattr(user_model, column) for column in CREDENTIAL_COLUMNS]),
+        user_model
+    )
+    query.add_criteria(lambda query: query.filter(user_model.email == bindparam('email')), user_model)
+    row = query(get_session(session)).params(email=email).first()
+    if row is None:
+        return None
+    return Credentials(*row)
+
+
+def credentials_from_record(record):
+    if not all(column in record for column in CREDENTIAL_COLUMNS):
+        return None
+    return Credentials(*[record[column] for column in CREDENTIAL_COLUMNS])
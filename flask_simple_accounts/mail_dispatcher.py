@@ -0,0 +1,322 @@
+import time
+import queue
+import datetime
+import threading
+
+from flask import has_app_context, current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+
+STOP = object()
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class MailDispatcher:
+    """
+        Sends email from background worker threads.
+
+        Each worker keeps one SMTP connection open and sends whatever is queued
+        in batches over it. Failed messages are retried with exponential backoff.
+        With an outbox model, every message is also stored as a row that is
+        marked as sent, so messages queued before a restart are sent later.
+    """
+
+    def __init__(self, app, mail, workers=2, max_queue_size=1000, batch_size=20, max_retries=5,
+                 retry_backoff_seconds=2, idle_seconds=30, db=None, outbox_model=None,
+                 outbox_recovery_age_seconds=300):
+        self.app = app
+        self.mail = mail
+        self.worker_count = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.idle_seconds = idle_seconds
+        self.db = db
+        self.outbox_model = outbox_model
+        self.outbox_recovery_age_seconds = outbox_recovery_age_seconds
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.workers = []
+        self.retry_timers = set()
+        self.queued_outbox_ids = set()
+        self.recovery_lock = threading.Lock()
+
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.connections_opened = 0
+        self.total_delivery_seconds = 0.0
+
+    def start(self):
+        if self.outbox_model is not None:
+            self.recover_outbox()
+
+        for number in range(self.worker_count):
+            worker = threading.Thread(target=self.work, name='simple-accounts-mail-{}'.format(number), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=None):
+        for timer in list(self.retry_timers):
+            timer.cancel()
+        for _ in self.workers:
+            self.queue.put(STOP)
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def create_payload(self, subject, sender, recipients, html=None, body=None, outbox_id=None):
+        return {
+            'subject': subject,
+            'sender': sender,
+            'recipients': list(recipients),
+            'html': html,
+            'body': body,
+            'outbox_id': outbox_id,
+            'attempts': 0,
+            'enqueued_at': time.time(),
+        }
+
+    def ensure_room(self):
+        """
+            Raises MailQueueFull when the queue has no room for another message.
+        """
+        if self.queue.full():
+            raise MailQueueFull()
+
+    def record_dropped(self):
+        with self.lock:
+            self.failed += 1
+
+    def enqueue(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            raise MailQueueFull()
+
+        with self.lock:
+            self.enqueued += 1
+            if payload['outbox_id'] is not None:
+                self.queued_outbox_ids.add(payload['outbox_id'])
+
+    def create_outbox_email(self, payload):
+        # added to the caller's session, so the row commits with the caller's own writes
+        outbox_email = self.outbox_model(
+            payload['subject'],
+            payload['sender'],
+            payload['recipients'],
+            html=payload['html'],
+            body=payload['body']
+        )
+        self.db.session.add(outbox_email)
+        return outbox_email
+
+    def recover_outbox(self):
+        """
+            Queues outbox rows that were never sent. Only rows older than
+            outbox_recovery_age_seconds are picked up, which leaves rows that
+            another running process has just queued to that process.
+        """
+        if not self.recovery_lock.acquire(blocking=False):
+            return
+
+        try:
+            self.queue_pending_outbox_emails()
+        except SQLAlchemyError:
+            # e.g. the outbox table is not created yet; idle workers try again later
+            pass
+        finally:
+            self.recovery_lock.release()
+
+    def queue_pending_outbox_emails(self):
+        if not has_app_context() or current_app._get_current_object() is not self.app:
+            with self.app.app_context():
+                return self.queue_pending_outbox_emails()
+
+        # a session of its own, and no app context pushed over the caller's, as popping
+        # one removes the thread's db.session: recovering never touches the caller's session
+        oldest_allowed = datetime.datetime.now() - datetime.timedelta(seconds=self.outbox_recovery_age_seconds)
+        session = self.db.create_session({})()
+        try:
+            self.queue_outbox_emails(session, oldest_allowed)
+        finally:
+            session.close()
+
+    def queue_outbox_emails(self, session, oldest_allowed):
+        pending = session.query(self.outbox_model).filter(
+            self.outbox_model.time_sent.is_(None),
+            self.outbox_model.attempts <= self.max_retries,
+            self.outbox_model.time_created < oldest_allowed
+        ).order_by(self.outbox_model.id).limit(self.queue.maxsize or None).all()
+
+        for outbox_email in pending:
+            if outbox_email.id in self.queued_outbox_ids:
+                continue
+
+            payload = self.create_payload(
+                outbox_email.subject,
+                outbox_email.sender,
+                outbox_email.get_recipients(),
+                html=outbox_email.html,
+                body=outbox_email.body,
+                outbox_id=outbox_email.id
+            )
+            payload['attempts'] = outbox_email.attempts
+            try:
+                self.enqueue(payload)
+            except MailQueueFull:
+                break
+
+    def next_batch(self):
+        try:
+            first = self.queue.get(timeout=self.idle_seconds)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        while first is not STOP and len(batch) < self.batch_size:
+            try:
+                payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(payload)
+            if payload is STOP:
+                break
+        return batch
+
+    def open_connection(self):
+        connection = self.mail.connect()
+        connection.__enter__()
+        with self.lock:
+            self.connections_opened += 1
+        return connection
+
+    def close_connection(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def build_message(self, payload):
+        from flask_mail import Message
+        return Message(
+            subject=payload['subject'],
+            sender=payload['sender'],
+            recipients=payload['recipients'],
+            html=payload['html'],
+            body=payload['body']
+        )
+
+    def work(self):
+        connection = None
+        with self.app.app_context():
+            while True:
+                batch = self.next_batch()
+                if not batch:
+                    # idle, so give the SMTP server its connection back and look for stranded outbox rows
+                    connection = self.close_connection(connection)
+                    if self.outbox_model is not None:
+                        self.recover_outbox()
+                    continue
+
+                stopping = batch[-1] is STOP
+                if stopping:
+                    batch = batch[:-1]
+
+                sent = []
+                for payload in batch:
+                    try:
+                        if connection is None:
+                            connection = self.open_connection()
+                        connection.send(self.build_message(payload))
+                        sent.append(payload)
+                    except Exception as error:
+                        connection = self.close_connection(connection)
+                        self.retry_later(payload, error)
+
+                self.record_batch(sent)
+
+                if stopping:
+                    self.close_connection(connection)
+                    return
+
+    def record_batch(self, sent):
+        now = time.time()
+        with self.lock:
+            self.batches += 1
+            self.sent += len(sent)
+            for payload in sent:
+                self.total_delivery_seconds += now - payload['enqueued_at']
+                self.queued_outbox_ids.discard(payload['outbox_id'])
+
+        outbox_ids = [payload['outbox_id'] for payload in sent if payload['outbox_id'] is not None]
+        if outbox_ids:
+            self.update_outbox(outbox_ids, {'time_sent': datetime.datetime.now()})
+
+    def update_outbox(self, outbox_ids, values):
+        # a database error must not end the worker; unmarked rows are picked up by recover_outbox
+        try:
+            self.outbox_model.query.filter(self.outbox_model.id.in_(outbox_ids)).update(
+                values,
+                synchronize_session=False
+            )
+            self.db.session.commit()
+        except SQLAlchemyError:
+            self.app.logger.exception('Could not update outbox emails %s', outbox_ids)
+            self.db.session.rollback()
+        finally:
+            self.db.session.remove()
+
+    def retry_later(self, payload, error):
+        payload['attempts'] += 1
+        if payload['outbox_id'] is not None:
+            self.update_outbox([payload['outbox_id']], {'attempts': payload['attempts'], 'last_error': str(error)})
+
+        if payload['attempts'] > self.max_retries:
+            with self.lock:
+                self.failed += 1
+                self.queued_outbox_ids.discard(payload['outbox_id'])
+            return
+
+        with self.lock:
+            self.retried += 1
+
+        delay = self.retry_backoff_seconds * 2 ** (payload['attempts'] - 1)
+        timer = threading.Timer(delay, self.requeue, args=(payload,))
+        timer.daemon = True
+        self.retry_timers.add(timer)
+        timer.start()
+
+    def requeue(self, payload):
+        self.retry_timers.discard(threading.current_thread())
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            # still stored in the outbox when one is configured, and recovered from there
+            with self.lock:
+                self.failed += 1
+                self.queued_outbox_ids.discard(payload['outbox_id'])
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue_size': self.queue.maxsize,
+                'workers': len(self.workers),
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'pending_retries': len(self.retry_timers),
+                'batches': self.batches,
+                'connections_opened': self.connections_opened,
+                'mean_delivery_seconds': self.total_delivery_seconds / self.sent if self.sent else 0.0,
+            }
@@ -1,6 +1,6 @@
 import datetime
 
-from . import helper
+from . import hashers
 from flask_sqlalchemy import SQLAlchemy
 
 
@@ -17,21 +17,33 @@ class User(db.Model):
     email_verification = db.relationship("EmailVerification", uselist=False, back_populates="user")
     registered_on = db.Column(db.DateTime)
 
-    is_authenticated = db.Column(db.Boolean)
     is_active = db.Column(db.Boolean)
-    is_anonymous = db.Column(db.Boolean)
-
-    def __init__(self, password):
+    # bumped to sign out every session at once, see session_store
+    session_version = db.Column(db.Integer, default=0)
+    # bumped whenever a stateless verification token is used, so each token works once
+    verification_version = db.Column(db.Integer, default=0)
+    # set for a cohort by require_password_reset, cleared by change_password
+    password_reset_required = db.Column(db.Boolean, default=False)
+
+    # log in state belongs to the request's session, not to the row
+    is_authenticated = False
+    is_anonymous = True
+
+    def __init__(self, password=None, password_hash=None):
         self.email = None
-        self.salt = helper.generate_salt()
-        self.password_hash = helper.hash_password(password, self.salt)
+        if password_hash is None:
+            password_hash = hashers.get_hasher(hashers.BcryptHasher.algorithm).encode(password)
+        # the salt is part of password_hash, the column only matters for rows written before hashers
+        self.salt = None
+        self.password_hash = password_hash
         self.email_verified = False
         self.registered_on = datetime.datetime.now()
+        self.session_version = 0
+        self.verification_version = 0
+        self.password_reset_required = False
 
         # fields required for flask_login
-        self.is_authenticated = False
         self.is_active = False
-        self.is_anonymous = True
 
     def get_id(self):
         # function required for flask_login
@@ -58,14 +70,43 @@ class EmailVerification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
     time_created = db.Column(db.DateTime())
-    code = db.Column(db.String)
+    expires_at = db.Column(db.DateTime(), index=True)
+    code = db.Column(db.String(32), unique=True, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship('User', back_populates='email_verification')
     unverified_email = db.Column(db.String(120), unique=True, index=True)
 
-    def __init__(self, code, user, unverified_email):
+    def __init__(self, code, user, unverified_email, hours_valid=24):
         self.code = code
         self.user = user
         self.unverified_email = unverified_email
         self.time_created = datetime.datetime.now()
+        self.expires_at = self.time_created + datetime.timedelta(hours=hours_valid)
+
+
+class OutboxEmail(db.Model):
+    #__tablename__ = 'outbox_email'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    time_created = db.Column(db.DateTime(), index=True)
+    time_sent = db.Column(db.DateTime(), index=True)
+    subject = db.Column(db.String)
+    sender = db.Column(db.String(120))
+    recipients = db.Column(db.Text)
+    html = db.Column(db.Text)
+    body = db.Column(db.Text)
+    attempts = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+
+    def __init__(self, subject, sender, recipients, html=None, body=None):
+        self.subject = subject
+        self.sender = sender
+        self.recipients = ','.join(recipients)
+        self.html = html
+        self.body = body
+        self.attempts = 0
+        self.time_created = datetime.datetime.now()
 
+    def get_recipients(self):
+        return self.recipients.split(',')
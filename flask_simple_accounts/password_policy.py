@@ -0,0 +1,122 @@
+import collections
+
+from . breached_passwords import BreachedPasswordCorpus
+
+
+LETTER = 1
+NUMBER = 2
+UPPER_CASE = 4
+LOWER_CASE = 8
+SPECIAL_CHARACTER = 16
+
+# checked in this order, so failures are reported in this order
+CHARACTER_RULES = (
+    ('has_letter', LETTER),
+    ('has_number', NUMBER),
+    ('has_upper_case', UPPER_CASE),
+    ('has_lower_case', LOWER_CASE),
+    ('has_special_character', SPECIAL_CHARACTER),
+)
+
+PolicyFailure = collections.namedtuple('PolicyFailure', ['rule', 'min_value', 'value'])
+
+# every combination of the classes fits in one byte
+CHARACTER_CLASS_VALUES = range(32)
+
+# most passwords meet every rule within their first characters, so these are checked first
+PREFIX_LENGTH = 64
+
+
+def classify_character(character, special_characters):
+    character_class = 0
+    if character.isalpha():
+        character_class |= LETTER
+    if character.isdigit():
+        character_class |= NUMBER
+    if character.isupper():
+        character_class |= UPPER_CASE
+    if character.islower():
+        character_class |= LOWER_CASE
+    if character in special_characters:
+        character_class |= SPECIAL_CHARACTER
+    return character_class
+
+
+class PasswordPolicy:
+    """
+        PASSWORD_REQUIREMENTS compiled once into an immutable policy.
+        A password is classified in one pass: an ASCII password is translated
+        into one class byte per character through a table built up front, and
+        each rule counts the class bytes that have its bit. is_valid stops at
+        the first unmet rule, and looks at the first characters before the rest.
+    """
+
+    __slots__ = ('min_length', 'character_rules', 'special_characters', 'class_table', 'breached_passwords')
+
+    def __init__(self, requirements):
+        set_attribute = super().__setattr__
+
+        length_requirement = requirements['has_length']
+        set_attribute('min_length', length_requirement['min_value'] if length_requirement['default'] else None)
+
+        # each rule keeps the class bytes to delete, so what is left are the characters it counts
+        set_attribute('character_rules', tuple(
+            (rule, requirements[rule]['min_value'], bytes(
+                value for value in CHARACTER_CLASS_VALUES if not value & character_class
+            ))
+            for rule, character_class in CHARACTER_RULES
+            if requirements[rule]['default']
+        ))
+
+        special_characters = frozenset(requirements['has_special_character'].get('values', ''))
+        set_attribute('special_characters', special_characters)
+        set_attribute('class_table', bytes(
+            classify_character(chr(code), special_characters) for code in range(128)
+        ) + bytes(128))
+
+        breached_requirement = requirements['not_breached']
+        breached_passwords = None
+        if breached_requirement['default']:
+            breached_passwords = BreachedPasswordCorpus(breached_requirement['corpus_path'])
+        set_attribute('breached_passwords', breached_passwords)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PasswordPolicy is immutable')
+
+    def classify(self, password):
+        try:
+            return password.encode('ascii').translate(self.class_table)
+        except UnicodeEncodeError:
+            return bytes(classify_character(character, self.special_characters) for character in password)
+
+    def get_failures(self, password):
+        failures = []
+
+        if self.min_length is not None and len(password) < self.min_length:
+            failures.append(PolicyFailure('has_length', self.min_length, len(password)))
+
+        if self.character_rules:
+            character_classes = self.classify(password)
+            for rule, min_value, other_classes in self.character_rules:
+                count = len(character_classes.translate(None, other_classes))
+                if count < min_value:
+                    failures.append(PolicyFailure(rule, min_value, count))
+
+        if self.breached_passwords is not None and self.breached_passwords.contains(password):
+            failures.append(PolicyFailure('not_breached', None, None))
+
+        return failures
+
+    def is_valid(self, password):
+        if self.min_length is not None and len(password) < self.min_length:
+            return False
+
+        if self.character_rules:
+            character_classes = self.classify(password)
+            prefix = character_classes[:PREFIX_LENGTH]
+            for _, min_value, other_classes in self.character_rules:
+                if (len(prefix.translate(None, other_classes)) < min_value and
+                        len(character_classes.translate(None, other_classes)) < min_value):
+                    return False
+
+        return self.breached_passwords is None or not self.breached_passwords.contains(password)
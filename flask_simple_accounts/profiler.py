@@ -0,0 +1,275 @@
+"""
+    Sampled profiles of the account operations, to tell whether a slow call
+    spent its time hashing, querying, sending mail or rendering.
+
+    A sampled call runs under cProfile and, with trace_allocations, under
+    tracemalloc, and every SQL statement it executes is recorded with its
+    duration. Statements are kept without their parameters. Each report
+    lists the top functions by cumulative time, the statements by time and
+    the lines that allocated the most. Reports are kept in memory for
+    FlaskSimpleAccounts.get_profiles, and written to dump_dir when it is set.
+
+    Calls that are not sampled cost one random() call. tracemalloc traces the
+    whole process, so while a sampled call runs, allocations made by other
+    threads show up in its report too. Only one call in the process is
+    profiled at a time, as Python 3.12 allows only one active cProfile: a call
+    sampled while another runs, or while another profiler is active, runs
+    unprofiled and is counted as skipped.
+"""
+import os
+import json
+import time
+import random
+import datetime
+import functools
+import threading
+import collections
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# the statements of the sampled call running in this thread, whichever Profiler sampled it
+recording = threading.local()
+# held by the sampled call being profiled, whichever Profiler sampled it
+profiling_lock = threading.Lock()
+listeners_lock = threading.Lock()
+listening_for_queries = False
+
+
+def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    if getattr(recording, 'statements', None) is not None:
+        recording.statement_started = time.perf_counter()
+
+
+def stop_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    statements = getattr(recording, 'statements', None)
+    if statements is not None:
+        statements.append((statement, time.perf_counter() - recording.statement_started))
+
+
+def listen_for_queries():
+    # once per process, so the listeners neither hold on to profilers nor pile up with them
+    global listening_for_queries
+    with listeners_lock:
+        if not listening_for_queries:
+            event.listen(Engine, 'before_cursor_execute', start_statement_timer)
+            event.listen(Engine, 'after_cursor_execute', stop_statement_timer)
+            listening_for_queries = True
+
+
+class Profiler:
+
+    def __init__(self, sample_rate=0.01, operations=None, trace_allocations=True, traceback_frames=1,
+                 top=25, max_reports=100, dump_dir=None):
+        self.sample_rate = sample_rate
+        self.operations = set(operations) if operations is not None else None
+        self.trace_allocations = trace_allocations
+        self.traceback_frames = traceback_frames
+        self.top = top
+        self.dump_dir = dump_dir
+        if dump_dir is not None:
+            os.makedirs(dump_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.reports = collections.deque(maxlen=max_reports)
+        self.sampled = 0
+        self.skipped = 0
+        self.dumped = 0
+        self.dump_failures = 0
+        self.allocation_tracers = 0
+        self.started_tracemalloc = False
+        listen_for_queries()
+
+    def should_sample(self, name):
+        if self.operations is not None and name not in self.operations:
+            return False
+        # an operation called by a sampled one is part of its report
+        if getattr(recording, 'statements', None) is not None:
+            return False
+        return random.random() < self.sample_rate
+
+    def run_operation(self, name, operation, *args, **kwargs):
+        if not self.should_sample(name):
+            return operation(*args, **kwargs)
+
+        if not profiling_lock.acquire(blocking=False):
+            self.record_skipped()
+            return operation(*args, **kwargs)
+        try:
+            return self.profile_operation(name, operation, *args, **kwargs)
+        finally:
+            profiling_lock.release()
+
+    def record_skipped(self):
+        with self.lock:
+            self.skipped += 1
+
+    def profile_operation(self, name, operation, *args, **kwargs):
+        import cProfile
+
+        recording.statements = []
+        snapshot = self.start_tracing_allocations()
+        profile = cProfile.Profile()
+        started_at = datetime.datetime.utcnow()
+        started = time.perf_counter()
+        succeeded = False
+
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler, e.g. a debugger's, is active
+            recording.statements = None
+            self.stop_tracing_allocations(snapshot)
+            self.record_skipped()
+            return operation(*args, **kwargs)
+
+        try:
+            result = operation(*args, **kwargs)
+            succeeded = not isinstance(result, dict) or result.get('success', False)
+            return result
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - started
+            statements = recording.statements
+            recording.statements = None
+            allocations = self.stop_tracing_allocations(snapshot)
+
+            report = {
+                'operation': name,
+                'started_at': started_at.isoformat() + 'Z',
+                'seconds': seconds,
+                'success': succeeded,
+                'functions': self.top_functions(profile),
+                'queries': self.summarize_statements(statements),
+                'allocations': allocations,
+            }
+            self.record(report, profile)
+
+    def start_tracing_allocations(self):
+        if not self.trace_allocations:
+            return None
+
+        import tracemalloc
+        with self.lock:
+            # tracemalloc is process-wide: the first sampled call starts it, the last one stops it
+            if self.allocation_tracers == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.traceback_frames)
+                self.started_tracemalloc = True
+            self.allocation_tracers += 1
+        return tracemalloc.take_snapshot()
+
+    def stop_tracing_allocations(self, snapshot):
+        if snapshot is None:
+            return None
+
+        import tracemalloc
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, __file__),
+        ]
+        differences = tracemalloc.take_snapshot().filter_traces(filters).compare_to(
+            snapshot.filter_traces(filters),
+            'lineno'
+        )
+
+        with self.lock:
+            self.allocation_tracers -= 1
+            if self.allocation_tracers == 0 and self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+        return [
+            {
+                'location': '{}:{}'.format(difference.traceback[0].filename, difference.traceback[0].lineno),
+                'size_bytes': difference.size_diff,
+                'count': difference.count_diff,
+            }
+            for difference in differences[:self.top]
+            if difference.size_diff > 0
+        ]
+
+    def top_functions(self, profile):
+        import pstats
+        stats = pstats.Stats(profile).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        return [
+            {
+                'function': '{}:{}({})'.format(*function),
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'own_seconds': own_seconds,
+                'cumulative_seconds': cumulative_seconds,
+            }
+            for function, (primitive_calls, calls, own_seconds, cumulative_seconds, _) in functions
+        ]
+
+    def summarize_statements(self, statements):
+        by_statement = {}
+        for statement, seconds in statements:
+            summary = by_statement.setdefault(statement, {'statement': statement, 'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            summary['count'] += 1
+            summary['seconds'] += seconds
+            summary['max_seconds'] = max(summary['max_seconds'], seconds)
+
+        return {
+            'count': len(statements),
+            'seconds': sum(seconds for _, seconds in statements),
+            'statements': sorted(by_statement.values(), key=lambda summary: summary['seconds'], reverse=True)[:self.top],
+        }
+
+    def record(self, report, profile):
+        with self.lock:
+            self.sampled += 1
+            report['sequence'] = self.sampled
+            self.reports.append(report)
+
+        if self.dump_dir is None:
+            return
+
+        # written by the sampled call itself, so only sampled calls pay for it
+        path = os.path.join(self.dump_dir, '{}-{}-{}'.format(
+            report['started_at'].replace(':', '').replace('-', ''),
+            report['operation'],
+            report['sequence']
+        ))
+        try:
+            with open(path + '.json', 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            profile.dump_stats(path + '.pstats')
+        except OSError:
+            # e.g. a full disk; the report is still kept in memory, and the call's own outcome stands
+            with self.lock:
+                self.dump_failures += 1
+            return
+        with self.lock:
+            self.dumped += 1
+
+    def get_reports(self, operation=None, limit=None):
+        # newest first
+        with self.lock:
+            reports = [report for report in reversed(self.reports) if operation is None or report['operation'] == operation]
+        return reports[:limit] if limit is not None else reports
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'sampled': self.sampled,
+                'skipped': self.skipped,
+                'reports': len(self.reports),
+                'dumped': self.dumped,
+                'dump_failures': self.dump_failures,
+            }
+
+
+def profiled(operation):
+    @functools.wraps(operation)
+    def run_operation(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None:
+            return operation(self, *args, **kwargs)
+        return profiler.run_operation(operation.__name__, operation, self, *args, **kwargs)
+
+    return run_operation
@@ -0,0 +1,227 @@
+"""
+    Throttling for the operations that check a password, so a burst of
+    guesses is turned away before it costs a database lookup or a hash.
+
+    Attempts are counted in token buckets keyed by client IP and by email.
+    A correct password refunds its email token, so only failed checks count
+    against an email. Backends:
+
+        memory      buckets kept in this process
+        sqlite      buckets kept in a local SQLite file shared by every
+                    worker on the machine
+
+    HashConcurrencyLimiter caps the hashes running at once in this process;
+    past the cap, new hashes are refused instead of queued.
+"""
+import time
+import threading
+import collections
+
+from . hashing_executor import HashingExecutorSaturated
+from . session_store import PurgeSchedule
+
+
+def refill(tokens, updated_at, now, capacity, refill_per_second):
+    return min(capacity, tokens + (now - updated_at) * refill_per_second)
+
+
+def seconds_until_token(tokens, refill_per_second):
+    if refill_per_second <= 0:
+        return float('inf')
+    return (1 - tokens) / refill_per_second
+
+
+class RateLimiter:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = {}
+
+    def take(self, key, capacity, refill_per_second):
+        """
+            Takes a token from the bucket for key. Returns 0.0 when the attempt
+            is admitted, otherwise the seconds until the bucket has a token again.
+        """
+        raise NotImplementedError
+
+    def refund(self, key, capacity):
+        """
+            Gives back a token taken from the bucket for key.
+        """
+        raise NotImplementedError
+
+    def purge_idle(self):
+        return 0
+
+    def record(self, kind, wait_seconds):
+        with self.lock:
+            if wait_seconds:
+                self.rejected[kind] = self.rejected.get(kind, 0) + 1
+            else:
+                self.admitted += 1
+
+    def stats(self):
+        with self.lock:
+            return {'admitted': self.admitted, 'rejected': dict(self.rejected)}
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+        The least recently used buckets are dropped past max_keys, which
+        only ever hands the dropped keys a full bucket again.
+    """
+
+    def __init__(self, max_keys=100000):
+        super().__init__()
+        self.max_keys = max_keys
+        self.buckets = collections.OrderedDict()
+        self.buckets_lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second):
+        now = time.monotonic()
+        with self.buckets_lock:
+            bucket = self.buckets.pop(key, None)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = refill(bucket[0], bucket[1], now, capacity, refill_per_second)
+
+            wait_seconds = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait_seconds = seconds_until_token(tokens, refill_per_second)
+
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait_seconds
+
+    def refund(self, key, capacity):
+        with self.buckets_lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                self.buckets[key] = (min(capacity, bucket[0] + 1), bucket[1])
+
+    def stats(self):
+        stats = super().stats()
+        with self.buckets_lock:
+            stats['keys'] = len(self.buckets)
+        return stats
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+        Buckets idle for idle_seconds are deleted from take(), at most once
+        every purge_interval_seconds.
+    """
+
+    def __init__(self, path, idle_seconds=None, purge_interval_seconds=None):
+        super().__init__()
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.purge_schedule = PurgeSchedule(purge_interval_seconds if idle_seconds is not None else None)
+        self.local = threading.local()
+
+        connection = self.connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    def take(self, key, capacity, refill_per_second):
+        if self.purge_schedule.is_due():
+            self.purge_idle()
+        # wall clock time, since the buckets are shared with other processes
+        now = time.time()
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                tokens = capacity
+            else:
+                tokens = refill(row[0], row[1], now, capacity, refill_per_second)
+
+            wait_seconds = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait_seconds = seconds_until_token(tokens, refill_per_second)
+
+            connection.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return wait_seconds
+
+    def refund(self, key, capacity):
+        self.connection().execute('UPDATE buckets SET tokens = MIN(?, tokens + 1) WHERE key = ?', (capacity, key))
+
+    def purge_idle(self):
+        # a bucket left alone this long has refilled, so dropping it changes nothing
+        if self.idle_seconds is None:
+            return 0
+        return self.connection().execute(
+            'DELETE FROM buckets WHERE updated_at < ?', (time.time() - self.idle_seconds,)
+        ).rowcount
+
+    def stats(self):
+        stats = super().stats()
+        stats['keys'] = self.connection().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+        return stats
+
+
+def create_rate_limiter(backend, sqlite_path=None, max_keys=100000, idle_seconds=None, purge_interval_seconds=None):
+    if backend == 'memory':
+        return MemoryRateLimiter(max_keys=max_keys)
+    if backend == 'sqlite':
+        return SQLiteRateLimiter(sqlite_path, idle_seconds, purge_interval_seconds)
+    raise ValueError('Unknown rate limiter backend: {}'.format(backend))
+
+
+class HashConcurrencyLimiter:
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def run(self, function, *args):
+        """
+            Raises HashingExecutorSaturated when max_in_flight hashes are already running.
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HashingExecutorSaturated()
+
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return function(*args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {'max_in_flight': self.max_in_flight, 'in_flight': self.in_flight, 'rejected': self.rejected}
@@ -0,0 +1,118 @@
+"""
+    Sends read-only user lookups to a read replica.
+
+    Only lookups that nothing is written after go to the replica: the user
+    loaded by user_loader and the password check and user of log_in. Anything
+    an operation writes after reading, such as the uniqueness check of
+    sign_up or the verification lookup, stays on the primary.
+
+    Replicas lag, so a lookup also stays on the primary when:
+
+        the email was written by this process in the last sticky_seconds
+        the client's own request wrote a user in the last sticky_seconds
+        the replica does not have the user, when fallback_to_primary is on
+
+    Locally, two SQLite files will do: point READ_REPLICA['database_uri'] at
+    a copy of the primary's file.
+"""
+import time
+import threading
+import collections
+
+from flask import has_request_context, session as flask_session
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from . import lookups
+from . user_cache import user_to_record
+
+
+PRIMARY_UNTIL_KEY = 'simple_accounts_primary_until'
+
+
+class ReplicaRouter:
+
+    def __init__(self, database_uri, sticky_seconds=5, fallback_to_primary=True, max_recent_writes=10000):
+        self.engine = create_engine(database_uri)
+        self.session = scoped_session(sessionmaker(bind=self.engine, autoflush=False))
+        self.sticky_seconds = sticky_seconds
+        self.fallback_to_primary = fallback_to_primary
+        self.max_recent_writes = max_recent_writes
+
+        self.lock = threading.Lock()
+        self.recent_writes = collections.OrderedDict()
+        self.replica_reads = 0
+        self.replica_misses = 0
+        self.sticky_reads = 0
+
+    def record_write(self, email):
+        now = time.monotonic()
+        with self.lock:
+            self.recent_writes.pop(email, None)
+            self.recent_writes[email] = now + self.sticky_seconds
+            while len(self.recent_writes) > self.max_recent_writes:
+                self.recent_writes.popitem(last=False)
+
+        if has_request_context():
+            flask_session[PRIMARY_UNTIL_KEY] = time.time() + self.sticky_seconds
+
+    def must_read_primary(self, email):
+        if has_request_context() and flask_session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            return True
+
+        with self.lock:
+            written_until = self.recent_writes.get(email)
+            if written_until is None:
+                return False
+            if written_until < time.monotonic():
+                del self.recent_writes[email]
+                return False
+            return True
+
+    def read(self, email, lookup):
+        """
+            Runs lookup(session) on the replica. Returns (found, result);
+            found is False when the lookup has to be made on the primary.
+        """
+        if self.must_read_primary(email):
+            with self.lock:
+                self.sticky_reads += 1
+            return False, None
+
+        session = self.session()
+        try:
+            result = lookup(session)
+        finally:
+            # a new transaction for the next lookup, so it sees replicated rows
+            session.close()
+
+        with self.lock:
+            self.replica_reads += 1
+            if result is None:
+                self.replica_misses += 1
+
+        if result is None and self.fallback_to_primary:
+            return False, None
+        return True, result
+
+    def find_user_record(self, user_model, email, columns=None):
+        def lookup(session):
+            user = lookups.find_user(session, user_model, email, columns)
+            return user_to_record(user) if user is not None else None
+
+        return self.read(email, lookup)
+
+    def find_credentials(self, user_model, email):
+        return self.read(email, lambda session: lookups.find_credentials(session, user_model, email))
+
+    def remove_session(self, exception=None):
+        self.session.remove()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'replica_reads': self.replica_reads,
+                'replica_misses': self.replica_misses,
+                'sticky_reads': self.sticky_reads,
+                'recent_writes': len(self.recent_writes),
+            }
@@ -0,0 +1,248 @@
+"""
+    Where log in sessions live, so logging in and out does not write to the User table.
+
+    The session token is kept in the Flask session cookie. Backends:
+
+        signed_cookie   the token itself is signed and carries the user id and
+                        User.session_version; nothing is stored server side
+        memory          tokens kept in this process, with a TTL
+        sqlite          tokens kept in a local SQLite file shared by every
+                        worker on the machine
+
+    The memory and sqlite stores drop expired tokens from create(), at most once
+    every purge_interval_seconds, and purge_expired() can also be run on its own.
+"""
+import time
+import secrets
+import threading
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+from . sharding import user_key
+
+
+class SessionStore:
+
+    def create(self, user):
+        raise NotImplementedError
+
+    def is_valid(self, token, user):
+        raise NotImplementedError
+
+    def revoke(self, token):
+        raise NotImplementedError
+
+    def list_sessions(self, user):
+        raise NotImplementedError
+
+    def revoke_all(self, user):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        return 0
+
+    def stats(self):
+        return {}
+
+
+class PurgeSchedule:
+    """
+        Tells create() when it is time to purge again, so the cost of a purge
+        is spread over the sessions created in between.
+    """
+
+    def __init__(self, interval_seconds):
+        # None never purges from create(), which leaves it to the purge commands
+        self.interval_seconds = interval_seconds
+        self.next_purge_at = time.time() + interval_seconds if interval_seconds is not None else None
+        self.lock = threading.Lock()
+
+    def is_due(self):
+        if self.interval_seconds is None:
+            return False
+        now = time.time()
+        with self.lock:
+            if now < self.next_purge_at:
+                return False
+            self.next_purge_at = now + self.interval_seconds
+            return True
+
+
+class SignedCookieSessionStore(SessionStore):
+    """
+        Stateless: revoke_all bumps User.session_version, which invalidates every
+        token signed with the old version. That one write is committed by the
+        calling operation. Sessions cannot be listed.
+    """
+
+    salt = 'flask-simple-accounts-session'
+
+    def __init__(self, secret_key, ttl_seconds):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt=self.salt)
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, user):
+        return self.serializer.dumps([user_key(user), user.session_version or 0])
+
+    def is_valid(self, token, user):
+        try:
+            user_id, session_version = self.serializer.loads(token, max_age=self.ttl_seconds)
+        except (BadSignature, SignatureExpired, ValueError):
+            return False
+        return user_id == user_key(user) and session_version == (user.session_version or 0)
+
+    def revoke(self, token):
+        # the token leaves with the cookie
+        pass
+
+    def list_sessions(self, user):
+        raise NotImplementedError('Signed cookie sessions are not stored, so they cannot be listed')
+
+    def revoke_all(self, user):
+        user.session_version = (user.session_version or 0) + 1
+
+
+class MemorySessionStore(SessionStore):
+
+    def __init__(self, ttl_seconds, purge_interval_seconds=None):
+        self.ttl_seconds = ttl_seconds
+        self.purge_schedule = PurgeSchedule(purge_interval_seconds)
+        self.sessions = {}
+        self.user_tokens = {}
+        self.lock = threading.Lock()
+
+    def create(self, user):
+        if self.purge_schedule.is_due():
+            self.purge_expired()
+        token = secrets.token_urlsafe(32)
+        user_id = user_key(user)
+        now = time.time()
+        with self.lock:
+            self.sessions[token] = {'user_id': user_id, 'created_at': now, 'expires_at': now + self.ttl_seconds}
+            self.user_tokens.setdefault(user_id, set()).add(token)
+        return token
+
+    def is_valid(self, token, user):
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return False
+            if session['expires_at'] < time.time():
+                self.remove(token)
+                return False
+            return session['user_id'] == user_key(user)
+
+    def remove(self, token):
+        session = self.sessions.pop(token, None)
+        if session is not None:
+            tokens = self.user_tokens.get(session['user_id'], set())
+            tokens.discard(token)
+            if not tokens:
+                self.user_tokens.pop(session['user_id'], None)
+
+    def revoke(self, token):
+        with self.lock:
+            self.remove(token)
+
+    def list_sessions(self, user):
+        now = time.time()
+        with self.lock:
+            return [
+                {'created_at': self.sessions[token]['created_at'], 'expires_at': self.sessions[token]['expires_at']}
+                for token in self.user_tokens.get(user_key(user), ())
+                if self.sessions[token]['expires_at'] >= now
+            ]
+
+    def revoke_all(self, user):
+        with self.lock:
+            for token in list(self.user_tokens.get(user_key(user), ())):
+                self.remove(token)
+
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [token for token, session in self.sessions.items() if session['expires_at'] < now]
+            for token in expired:
+                self.remove(token)
+        return len(expired)
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.sessions), 'users': len(self.user_tokens)}
+
+
+class SQLiteSessionStore(SessionStore):
+
+    def __init__(self, path, ttl_seconds, purge_interval_seconds=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.purge_schedule = PurgeSchedule(purge_interval_seconds)
+        self.local = threading.local()
+
+        connection = self.connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'token TEXT PRIMARY KEY, user_id INTEGER NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS sessions_user_id ON sessions (user_id)')
+        connection.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+
+    def connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    def create(self, user):
+        if self.purge_schedule.is_due():
+            self.purge_expired()
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        self.connection().execute(
+            'INSERT INTO sessions (token, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)',
+            (token, user_key(user), now, now + self.ttl_seconds)
+        )
+        return token
+
+    def is_valid(self, token, user):
+        row = self.connection().execute(
+            'SELECT user_id FROM sessions WHERE token = ? AND expires_at >= ?',
+            (token, time.time())
+        ).fetchone()
+        return row is not None and row[0] == user_key(user)
+
+    def revoke(self, token):
+        self.connection().execute('DELETE FROM sessions WHERE token = ?', (token,))
+
+    def list_sessions(self, user):
+        rows = self.connection().execute(
+            'SELECT created_at, expires_at FROM sessions WHERE user_id = ? AND expires_at >= ? ORDER BY created_at',
+            (user_key(user), time.time())
+        ).fetchall()
+        return [{'created_at': created_at, 'expires_at': expires_at} for created_at, expires_at in rows]
+
+    def revoke_all(self, user):
+        self.connection().execute('DELETE FROM sessions WHERE user_id = ?', (user_key(user),))
+
+    def purge_expired(self):
+        return self.connection().execute('DELETE FROM sessions WHERE expires_at < ?', (time.time(),)).rowcount
+
+    def stats(self):
+        sessions, users = self.connection().execute(
+            'SELECT COUNT(*), COUNT(DISTINCT user_id) FROM sessions'
+        ).fetchone()
+        return {'sessions': sessions, 'users': users}
+
+
+def create_session_store(backend, ttl_seconds, secret_key=None, sqlite_path=None, purge_interval_seconds=None):
+    if backend == 'signed_cookie':
+        return SignedCookieSessionStore(secret_key, ttl_seconds)
+    if backend == 'memory':
+        return MemorySessionStore(ttl_seconds, purge_interval_seconds)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(sqlite_path, ttl_seconds, purge_interval_seconds)
+    raise ValueError('Unknown session store backend: {}'.format(backend))
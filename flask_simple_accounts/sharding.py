@@ -0,0 +1,188 @@
+"""
+    Spreads the User and EmailVerification tables over several
+    Flask-SQLAlchemy binds, by a stable hash of the email:
+
+        SQLALCHEMY_BINDS = {'users-0': 'postgresql://.../users0', 'users-1': 'postgresql://.../users1'}
+        CUSTOM_SHARDING = {'enabled': True, 'binds': ['users-0', 'users-1']}
+
+    db.session becomes a ShardedScopedSession. Inside use_shard(index) it is
+    a session that writes those two tables to that shard; outside of one it
+    is the usual Flask-SQLAlchemy session. Other tables, such as OutboxEmail,
+    and apps without sharding are not affected. Each account operation runs
+    in one shard, picked by the sharded decorator.
+
+    A user lives in the shard of their email, so the unique email columns
+    stay unique across shards. When a new email hashes to another shard, the
+    user is moved there once it is verified. The copy commits in the new
+    shard before the old row is deleted, so a failure in between leaves the
+    user in both shards. Ids are only unique within a shard; see user_key.
+    Changing the list of binds moves most emails to another shard, and
+    nothing migrates the users for you.
+"""
+import zlib
+import functools
+import threading
+import contextlib
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy.orm import sessionmaker, scoped_session, object_session
+
+
+SHARD_KEY = 'simple_accounts_shard'
+
+
+def current_shard():
+    """
+        (router, index) inside use_shard, otherwise None.
+    """
+    if not has_app_context():
+        return None
+    return getattr(g, SHARD_KEY, None)
+
+
+def get_object_shard(db_object):
+    # the index of the shard whose session the object belongs to
+    session = object_session(db_object)
+    if session is None:
+        return None
+    return session.info.get(SHARD_KEY)
+
+
+def user_key(user):
+    # what session stores key a user by, as users in different shards can share an id
+    shard = get_object_shard(user)
+    if shard is None:
+        return user.id
+    return '{}:{}'.format(shard, user.id)
+
+
+class ShardedScopedSession(scoped_session):
+    """
+        One session per app context and shard. remove() closes all of them.
+    """
+
+    def __init__(self, unsharded_session):
+        self.unsharded_session_factory = unsharded_session.session_factory
+        scopefunc = unsharded_session.registry.scopefunc
+        scoped_session.__init__(self, self.create_session, scopefunc=lambda: (scopefunc(), current_shard()))
+
+    def create_session(self):
+        shard = current_shard()
+        if shard is None:
+            return self.unsharded_session_factory()
+        router, index = shard
+        return router.create_session(index)
+
+    def remove(self):
+        scope = self.registry.scopefunc()[0]
+        sessions = self.registry.registry
+        for key in [key for key in list(sessions) if key[0] == scope]:
+            session = sessions.pop(key, None)
+            if session is not None:
+                session.close()
+
+
+class ShardRouter:
+
+    def __init__(self, db, app, bind_keys, sharded_models):
+        if not bind_keys:
+            raise ValueError('SHARDING needs at least one bind')
+
+        self.db = db
+        self.bind_keys = list(bind_keys)
+        self.engines = [db.get_engine(app, bind=bind_key) for bind_key in self.bind_keys]
+        self.sharded_tables = [model.__table__ for model in sharded_models]
+
+        binds = db.get_binds(app)
+        self.session_factories = []
+        for index, engine in enumerate(self.engines):
+            shard_binds = dict(binds)
+            shard_binds.update((table, engine) for table in self.sharded_tables)
+            self.session_factories.append(sessionmaker(
+                class_=SignallingSession,
+                db=db,
+                bind=engine,
+                binds=shard_binds,
+                info={SHARD_KEY: index}
+            ))
+
+        if not isinstance(db.session, ShardedScopedSession):
+            db.session = ShardedScopedSession(db.session)
+
+        self.lock = threading.Lock()
+        self.sessions_created = [0] * len(self.engines)
+
+    def shard_for_email(self, email):
+        # crc32, unlike hash(), is the same in every process
+        return zlib.crc32(email.lower().encode('utf-8')) % len(self.engines)
+
+    def create_session(self, index):
+        with self.lock:
+            self.sessions_created[index] += 1
+        return self.session_factories[index]()
+
+    @contextlib.contextmanager
+    def use_shard(self, index):
+        previous_shard = getattr(g, SHARD_KEY, None)
+        setattr(g, SHARD_KEY, (self, index))
+        try:
+            yield
+        finally:
+            setattr(g, SHARD_KEY, previous_shard)
+
+    def get_sessions(self):
+        sessions = []
+        for index in range(len(self.engines)):
+            with self.use_shard(index):
+                sessions.append(self.db.session())
+        return sessions
+
+    def group_by_shard(self, items, key):
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_for_email(key(item)), []).append(item)
+        return groups
+
+    def code_prefix(self, index):
+        return '{}.'.format(index)
+
+    def shard_for_code(self, code):
+        prefix, separator, _ = code.partition('.')
+        if not separator or not prefix.isdigit() or int(prefix) >= len(self.engines):
+            return None
+        return int(prefix)
+
+    def create_tables(self):
+        # db.create_all() only creates tables in the bind their bind_key names
+        for engine in self.engines:
+            self.db.Model.metadata.create_all(engine, tables=self.sharded_tables)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'shards': len(self.engines),
+                'binds': list(self.bind_keys),
+                'sessions_created': list(self.sessions_created),
+            }
+
+
+def sharded(kind):
+    """
+        Runs an account operation in the shard of the request's email
+        (kind 'email'), of the logged in user ('user') or of the verification
+        code ('verification_code'). Without one, it runs outside any shard.
+    """
+    def decorator(operation):
+        @functools.wraps(operation)
+        def run_operation(accounts, request, *args, **kwargs):
+            router = accounts.shard_router
+            index = None
+            if router is not None:
+                index = accounts.get_request_shard(request, kind)
+            if index is None:
+                return operation(accounts, request, *args, **kwargs)
+            with router.use_shard(index):
+                return operation(accounts, request, *args, **kwargs)
+        return run_operation
+    return decorator
@@ -0,0 +1,128 @@
+import functools
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+UNIT_OF_WORK_KEY = 'simple_accounts_unit_of_work'
+AFTER_COMMIT_KEY = 'simple_accounts_after_commit'
+
+
+class QueryCounter:
+    """
+        Counts statements and commits per thread, and per account operation.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def counts(self):
+        return getattr(self.local, 'queries', 0), getattr(self.local, 'commits', 0)
+
+    def record_query(self):
+        self.local.queries = getattr(self.local, 'queries', 0) + 1
+
+    def record_commit(self):
+        self.local.commits = getattr(self.local, 'commits', 0) + 1
+
+    def record_operation(self, name, queries, commits):
+        self.local.last_operation = {'operation': name, 'queries': queries, 'commits': commits}
+        with self.lock:
+            stats = self.operations.setdefault(name, {'calls': 0, 'queries': 0, 'commits': 0})
+            stats['calls'] += 1
+            stats['queries'] += queries
+            stats['commits'] += commits
+
+    def last_operation(self):
+        return getattr(self.local, 'last_operation', None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: dict(
+                    stats,
+                    queries_per_call=stats['queries'] / stats['calls'],
+                    commits_per_call=stats['commits'] / stats['calls']
+                )
+                for name, stats in self.operations.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+
+query_counter = QueryCounter()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    query_counter.record_query()
+
+
+@event.listens_for(Engine, 'commit')
+def count_commit(connection):
+    query_counter.record_commit()
+
+
+def in_unit_of_work(session):
+    return session.info.get(UNIT_OF_WORK_KEY, False)
+
+
+def after_commit(session, callback):
+    """
+        Runs callback once the current unit of work has committed,
+        or right away when there is no unit of work.
+    """
+    if in_unit_of_work(session):
+        session.info[AFTER_COMMIT_KEY].append(callback)
+    else:
+        callback()
+
+
+def unit_of_work(operation):
+    """
+        Runs an account operation in one transaction. save_db() does not commit
+        inside it; the session is committed once at the end, or rolled back when
+        the operation raises or returns a response without success.
+    """
+    @functools.wraps(operation)
+    def run_operation(self, *args, **kwargs):
+        session = self.db.session
+        if in_unit_of_work(session):
+            return operation(self, *args, **kwargs)
+
+        queries_before, commits_before = query_counter.counts()
+        session.info[UNIT_OF_WORK_KEY] = True
+        session.info[AFTER_COMMIT_KEY] = []
+        committed = False
+        try:
+            result = operation(self, *args, **kwargs)
+            if isinstance(result, dict) and not result.get('success'):
+                session.rollback()
+            else:
+                session.commit()
+                committed = True
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.info[UNIT_OF_WORK_KEY] = False
+            callbacks = session.info.pop(AFTER_COMMIT_KEY)
+
+        if committed:
+            for callback in callbacks:
+                callback()
+
+        queries_after, commits_after = query_counter.counts()
+        query_counter.record_operation(
+            operation.__name__,
+            queries_after - queries_before,
+            commits_after - commits_before
+        )
+        return result
+
+    return run_operation
@@ -0,0 +1,92 @@
+import time
+import threading
+import collections
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class UserCache:
+    """
+        Process-wide LRU cache of user column values keyed by email.
+        Entries expire after ttl_seconds, which bounds how long another
+        process's writes can go unseen.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.records = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, email):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.records.get(email)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self.records[email]
+                self.misses += 1
+                return None
+
+            self.records.move_to_end(email)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, email, record):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            self.records[email] = (expires_at, record)
+            self.records.move_to_end(email)
+            while len(self.records) > self.max_size:
+                self.records.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email):
+        with self.lock:
+            if self.records.pop(email, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.records),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def user_to_record(user):
+    # only columns that are already loaded, so recording never triggers a query
+    mapper = inspect(user).mapper
+    return {
+        attribute.key: user.__dict__[attribute.key]
+        for attribute in mapper.column_attrs
+        if attribute.key in user.__dict__
+    }
+
+
+def user_from_record(user_model, record, session):
+    """
+        Rebuilds a persistent User from cached column values without a query.
+        Columns missing from the record are expired and load on first access.
+    """
+    user = inspect(user_model).class_manager.new_instance()
+    for key, value in record.items():
+        setattr(user, key, value)
+    make_transient_to_detached(user)
+    return session.merge(user, load=False)
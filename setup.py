@@ -2,6 +2,7 @@ from distutils.core import setup
 setup(
   name = 'flask_simple_accounts',
   packages = ['flask_simple_accounts'],
+  package_data = {'flask_simple_accounts': ['templates/email/*/*.html', 'templates/email/*/*.txt']},
   version = '1.13',
   description = 'This library allows Flask developers to use the an api to handle the mundane tasks of user account management',
   author = 'Herbert Dawkins',
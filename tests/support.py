@@ -0,0 +1,63 @@
+import os
+import sys
+import copy
+import time
+
+from flask import Flask
+
+from flask_simple_accounts import FlaskSimpleAccounts, models
+from flask_simple_accounts.config import Config
+
+
+PASSWORD = 'Test-Password-1234!!abcdEFGH'
+
+# the stand-in SMTP server lives with the benchmarks
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def wait_until(condition, timeout=10):
+    """
+        For work done by background threads; fails the test when condition
+        is still false after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting for the background work')
+        time.sleep(0.01)
+
+
+def mail_config(smtp_sink):
+    return {
+        'MAIL_SUPPRESS_SEND': False,
+        'MAIL_SERVER': smtp_sink.host,
+        'MAIL_PORT': smtp_sink.port,
+        'MAIL_DEFAULT_SENDER': 'accounts@example.com',
+    }
+
+
+def create_accounts(**config):
+    """
+        A FlaskSimpleAccounts on an in-memory database, with the cheapest
+        bcrypt cost, no email verification and the tables created.
+    """
+    app = Flask(__name__)
+    for key in dir(Config):
+        if key.isupper():
+            app.config[key] = copy.deepcopy(getattr(Config, key))
+    app.config.update(
+        SECRET_KEY='test-secret-key',
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        MAIL_SUPPRESS_SEND=True,
+        SITE_ADDRESS='http://localhost',
+        CUSTOM_PASSWORD_HASHING={'bcrypt_cost': 4},
+        CUSTOM_EMAIL_VERIFICATION={'enabled': False},
+    )
+    app.config.update(config)
+
+    accounts = FlaskSimpleAccounts(models, app)
+    with accounts.app.app_context():
+        models.db.create_all()
+    return accounts
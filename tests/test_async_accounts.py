@@ -0,0 +1,71 @@
+import json
+import asyncio
+import unittest
+
+import flask_login
+from flask import request, jsonify
+
+from flask_simple_accounts import AsyncSimpleAccounts
+
+from support import create_accounts, PASSWORD
+
+
+class AsyncSimpleAccountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts()
+        self.async_accounts = AsyncSimpleAccounts(self.accounts, max_workers=2)
+        self.loop = asyncio.new_event_loop()
+        app = self.accounts.app
+
+        def run(operation):
+            return jsonify(self.loop.run_until_complete(operation(request)))
+
+        app.add_url_rule('/sign-up', 'sign_up', lambda: run(self.async_accounts.sign_up), methods=['POST'])
+        app.add_url_rule('/log-in', 'log_in', lambda: run(self.async_accounts.log_in), methods=['POST'])
+        app.add_url_rule('/log-out', 'log_out', lambda: run(self.async_accounts.log_out), methods=['POST'])
+        app.add_url_rule('/me', 'me', lambda: jsonify({
+            'authenticated': flask_login.current_user.is_authenticated,
+            'user': self.accounts.get_current_user() is not None,
+        }))
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.async_accounts.shutdown()
+        self.loop.close()
+
+    def post(self, path, **data):
+        return json.loads(self.client.post(path, data=data).get_data(as_text=True))
+
+    def get(self, path):
+        return json.loads(self.client.get(path).get_data(as_text=True))
+
+    def test_log_in_is_kept_by_the_next_request(self):
+        self.assertTrue(self.post('/sign-up', email='async@example.com', password=PASSWORD)['success'])
+        self.assertTrue(self.post('/log-in', email='async@example.com', password=PASSWORD)['success'])
+        self.assertEqual(self.get('/me'), {'authenticated': True, 'user': True})
+
+    def test_log_out_is_kept_by_the_next_request(self):
+        self.post('/sign-up', email='async@example.com', password=PASSWORD)
+        self.post('/log-in', email='async@example.com', password=PASSWORD)
+        self.assertTrue(self.post('/log-out')['success'])
+        self.assertEqual(self.get('/me'), {'authenticated': False, 'user': False})
+
+    def test_current_user_is_set_for_the_rest_of_the_request(self):
+        self.post('/sign-up', email='async@example.com', password=PASSWORD)
+        self.accounts.app.add_url_rule('/log-in-and-check', 'log_in_and_check', lambda: jsonify(
+            success=self.loop.run_until_complete(self.async_accounts.log_in(request))['success'],
+            authenticated=flask_login.current_user.is_authenticated
+        ), methods=['POST'])
+
+        response = self.post('/log-in-and-check', email='async@example.com', password=PASSWORD)
+        self.assertEqual(response, {'success': True, 'authenticated': True})
+
+    def test_needs_a_request_context(self):
+        with self.accounts.app.app_context():
+            with self.assertRaises(RuntimeError):
+                self.loop.run_until_complete(self.async_accounts.log_in(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
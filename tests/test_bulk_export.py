@@ -0,0 +1,59 @@
+import io
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import bulk_import
+
+from support import create_accounts, PASSWORD
+
+
+EMAILS = ['active@example.com', 'inactive@example.com', 'reset@example.com']
+
+
+class ExportImportRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = create_accounts()
+        self.source.app.add_url_rule('/sign_up', 'sign_up', lambda: jsonify(self.source.sign_up(request)), methods=['POST'])
+        client = self.source.app.test_client()
+        for email in EMAILS:
+            client.post('/sign_up', data={'email': email, 'password': PASSWORD})
+
+        with self.source.app.app_context():
+            self.source.deactivate_users(self.source.get_user_cohort(emails=['inactive@example.com']))
+            self.source.require_password_reset(self.source.get_user_cohort(emails=['reset@example.com']))
+
+    def accounts_of(self, accounts):
+        User = accounts.models.User
+        with accounts.app.app_context():
+            return {
+                email: (registered_on, is_active, password_reset_required, password_hash)
+                for email, registered_on, is_active, password_reset_required, password_hash in accounts.db.session.query(
+                    User.email, User.registered_on, User.is_active, User.password_reset_required, User.password_hash
+                )
+            }
+
+    def round_trip(self, output_format, include_password_hashes=True):
+        exported = io.StringIO()
+        with self.source.app.app_context():
+            self.source.export_users(exported, output_format, include_password_hashes=include_password_hashes)
+
+        target = create_accounts()
+        with target.app.app_context():
+            report = target.import_users(bulk_import.read_records(io.StringIO(exported.getvalue()), output_format), workers=1)
+        return target, report
+
+    def test_export_with_hashes_imports_the_same_accounts(self):
+        for output_format in ('csv', 'jsonl'):
+            target, report = self.round_trip(output_format)
+            self.assertEqual(report.imported, len(EMAILS))
+            self.assertEqual(self.accounts_of(target), self.accounts_of(self.source))
+
+    def test_export_without_hashes_is_rejected(self):
+        target, report = self.round_trip('jsonl', include_password_hashes=False)
+        self.assertEqual((report.imported, report.rejected), (0, len(EMAILS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
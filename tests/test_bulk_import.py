@@ -0,0 +1,89 @@
+import os
+import io
+import json
+import shutil
+import tempfile
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import bulk_import, hashers
+
+from support import create_accounts, PASSWORD
+
+
+class BulkImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts()
+        app = self.accounts.app
+        app.add_url_rule('/log_in', 'log_in', lambda: jsonify(self.accounts.log_in(request)), methods=['POST'])
+        self.client = app.test_client()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def import_users(self, records, **options):
+        rejections = []
+        options.setdefault('workers', 1)
+        with self.accounts.app.app_context():
+            report = self.accounts.import_users(
+                records,
+                rejection_callback=lambda line_number, email, reason: rejections.append((line_number, reason)),
+                **options
+            )
+        return report, rejections
+
+    def emails(self):
+        User = self.accounts.models.User
+        with self.accounts.app.app_context():
+            return sorted(email for email, in self.accounts.db.session.query(User.email))
+
+    def log_in(self, email, password):
+        response = self.client.post('/log_in', data={'email': email, 'password': password})
+        return json.loads(response.get_data(as_text=True))['success']
+
+    def test_imports_passwords_and_hashes_and_rejects_the_rest(self):
+        password_hash = hashers.get_hasher(hashers.BcryptHasher.algorithm).encode(PASSWORD)
+        records = bulk_import.read_records(io.StringIO('\n'.join([
+            'email,password,password_hash',
+            'plain@example.com,{},'.format(PASSWORD),
+            'hashed@example.com,,{}'.format(password_hash),
+            'plain@example.com,{},'.format(PASSWORD),
+            'weak@example.com,password,',
+            'not-an-email,{},'.format(PASSWORD),
+            'unreadable@example.com,,$unknown$hash',
+            'missing@example.com,,',
+        ])), 'csv')
+
+        report, rejections = self.import_users(records, chunk_size=3)
+
+        self.assertEqual((report.imported, report.rejected, report.records_done), (2, 5, 7))
+        self.assertEqual(rejections, [
+            (3, 'User email is not unique'),
+            (4, 'Password is not valid'),
+            (5, 'Email is not valid'),
+            (6, 'Password hash format is not supported'),
+            (7, 'Password is missing'),
+        ])
+        self.assertEqual(self.emails(), ['hashed@example.com', 'plain@example.com'])
+        self.assertTrue(self.log_in('plain@example.com', PASSWORD))
+        self.assertTrue(self.log_in('hashed@example.com', PASSWORD))
+
+    def test_resumes_after_the_last_checkpointed_chunk(self):
+        checkpoint_path = os.path.join(self.directory, 'import.checkpoint')
+        records = [{'email': 'user-{}@example.com'.format(number), 'password': PASSWORD} for number in range(1, 6)]
+
+        with open(checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'records_done': 3}, checkpoint_file)
+        report, _ = self.import_users(iter(records), chunk_size=2, checkpoint_path=checkpoint_path)
+
+        self.assertEqual((report.imported, report.records_done), (2, 5))
+        self.assertEqual(self.emails(), ['user-4@example.com', 'user-5@example.com'])
+        with open(checkpoint_path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file), {'records_done': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import models
+
+from support import create_accounts, PASSWORD
+
+
+class EmailFilterTest(unittest.TestCase):
+
+    def create_accounts(self, **email_filter):
+        email_filter['enabled'] = True
+        self.accounts = create_accounts(
+            CUSTOM_EMAIL_FILTER=email_filter,
+            CUSTOM_EMAIL_VERIFICATION={'enabled': True},
+        )
+        self.accounts.send_email = lambda *args, **kwargs: None
+        app = self.accounts.app
+        app.add_url_rule('/sign_up', 'sign_up', lambda: jsonify(self.accounts.sign_up(request)), methods=['POST'])
+        self.client = app.test_client()
+        with app.app_context():
+            self.accounts.rebuild_email_filter()
+        return self.accounts
+
+    def sign_up(self, email):
+        return json.loads(self.client.post('/sign_up', data={'email': email, 'password': PASSWORD}).get_data(as_text=True))
+
+    def filter_stats(self):
+        return self.accounts.get_email_filter_stats()
+
+    def insert_user_unseen_by_the_filter(self, email):
+        # as another process would, without this process's flush listeners
+        with self.accounts.app.app_context():
+            models.db.session.execute(models.User.__table__.insert().values(email=email, password_hash='unused'))
+            models.db.session.commit()
+
+    def test_imported_emails_are_not_unique(self):
+        for trust_misses in (False, True):
+            self.create_accounts(trust_misses=trust_misses)
+            with self.accounts.app.app_context():
+                self.accounts.import_users([{'email': 'imported@example.com', 'password': PASSWORD}], workers=1)
+
+            self.assertEqual(self.sign_up('imported@example.com')['errors'], ['User email is not unique'])
+            self.assertEqual(self.filter_stats()['stale_misses'], 0)
+
+    def test_emails_written_elsewhere_are_checked_in_the_database(self):
+        self.create_accounts()
+        self.insert_user_unseen_by_the_filter('elsewhere@example.com')
+
+        self.assertEqual(self.sign_up('elsewhere@example.com')['errors'], ['User email is not unique'])
+        self.assertEqual(self.filter_stats()['stale_misses'], 1)
+        # added to the filter once found
+        self.assertEqual(self.sign_up('elsewhere@example.com')['errors'], ['User email is not unique'])
+        self.assertEqual(self.filter_stats()['stale_misses'], 1)
+
+    def test_trusted_misses_skip_the_database(self):
+        self.create_accounts(trust_misses=True)
+        self.insert_user_unseen_by_the_filter('elsewhere@example.com')
+
+        with self.accounts.app.app_context():
+            self.assertTrue(self.accounts.user_email_is_unique('elsewhere@example.com'))
+        self.assertEqual(self.filter_stats()['definitely_absent'], 1)
+
+    def test_signed_up_emails_are_added_to_the_filter(self):
+        self.create_accounts(trust_misses=True)
+        self.assertTrue(self.sign_up('new@example.com')['success'])
+        self.assertEqual(self.sign_up('new@example.com')['errors'], ['User email is not unique'])
+
+
+if __name__ == '__main__':
+    unittest.main()
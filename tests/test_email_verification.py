@@ -0,0 +1,113 @@
+import re
+import time
+import unittest
+from unittest import mock
+
+from flask import request, jsonify
+
+from flask_simple_accounts import models
+
+from support import create_accounts, PASSWORD
+
+
+class VerifyEmailCodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts(CUSTOM_EMAIL_VERIFICATION={'enabled': True})
+        app = self.accounts.app
+        app.add_url_rule('/verify-email', 'verify_email', lambda: self.accounts.verify_email(request))
+        self.client = app.test_client()
+
+    def verification_page(self, email_is_verified):
+        with self.accounts.app.app_context():
+            return self.accounts.get_verification_page(email_is_verified)[0]
+
+    def add_pending_user(self, code, unverified_email):
+        user = models.User(password_hash='unused')
+        models.db.session.add(user)
+        models.db.session.add(models.EmailVerification(code, user, unverified_email))
+        return user
+
+    def test_verifies_the_email(self):
+        with self.accounts.app.app_context():
+            self.add_pending_user('a' * 32, 'pending@example.com')
+            models.db.session.commit()
+
+        response = self.client.get('/verify-email?verification_code=' + 'a' * 32)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.verification_page(True))
+        with self.accounts.app.app_context():
+            user = models.User.query.filter_by(email='pending@example.com').one()
+            self.assertTrue(user.is_active)
+            self.assertEqual(models.EmailVerification.query.count(), 0)
+
+    def test_email_verified_by_someone_else_meanwhile_fails_the_verification(self):
+        with self.accounts.app.app_context():
+            self.add_pending_user('b' * 32, 'taken@example.com')
+            models.db.session.flush()
+            # another account verified the same email after this code was sent
+            other_user = models.User(password_hash='unused')
+            other_user.email = 'taken@example.com'
+            models.db.session.add(other_user)
+            models.db.session.commit()
+
+        response = self.client.get('/verify-email?verification_code=' + 'b' * 32)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.verification_page(False))
+        with self.accounts.app.app_context():
+            self.assertEqual(models.User.query.filter_by(email='taken@example.com').count(), 1)
+            self.assertEqual(models.EmailVerification.query.count(), 1)
+
+
+class StatelessTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts(CUSTOM_EMAIL_VERIFICATION={'enabled': True, 'stateless_tokens': True})
+        app = self.accounts.app
+        app.add_url_rule('/sign-up', 'sign_up', lambda: jsonify(self.accounts.sign_up(request)), methods=['POST'])
+        app.add_url_rule('/verify-email', 'verify_email', lambda: self.accounts.verify_email(request))
+        self.client = app.test_client()
+
+        self.sent_emails = []
+        self.accounts.send_email = lambda subject, sender, recipients, html=None, body=None: self.sent_emails.append(html)
+
+    def sign_up(self, email, password=PASSWORD):
+        self.client.post('/sign-up', data={'email': email, 'password': password})
+        return re.search(r'verification_code=([\w.-]+)', self.sent_emails[-1]).group(1)
+
+    def verify(self, token):
+        with self.accounts.app.app_context():
+            verified_page = self.accounts.get_verification_page(True)[0]
+        return self.client.get('/verify-email?verification_code=' + token).get_data() == verified_page
+
+    def user_email(self):
+        with self.accounts.app.app_context():
+            return models.db.session.query(models.User.email).scalar()
+
+    def test_token_verifies_once(self):
+        token = self.sign_up('user@example.com')
+        with self.accounts.app.app_context():
+            self.assertEqual(models.EmailVerification.query.count(), 0)
+
+        self.assertTrue(self.verify(token))
+        self.assertEqual(self.user_email(), 'user@example.com')
+        self.assertFalse(self.verify(token))
+
+    def test_tampered_token_is_rejected(self):
+        token = self.sign_up('user@example.com')
+        self.assertFalse(self.verify(token[:-2] + ('AA' if not token.endswith('AA') else 'BB')))
+        self.assertIsNone(self.user_email())
+
+    def test_expired_token_is_rejected(self):
+        hours_valid = self.accounts.app.config['EMAIL_VERIFICATION']['hours_verification_is_valid']
+        with mock.patch('time.time', return_value=time.time() - (hours_valid + 1) * 3600):
+            token = self.sign_up('user@example.com')
+
+        self.assertFalse(self.verify(token))
+        self.assertIsNone(self.user_email())
+
+
+if __name__ == '__main__':
+    unittest.main()
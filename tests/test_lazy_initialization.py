@@ -0,0 +1,34 @@
+import unittest
+
+from support import create_accounts
+
+
+class LazyInitializationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts(CUSTOM_LAZY_INITIALIZATION={'enabled': True})
+        self.accounts.app.add_url_rule('/ping', 'ping', lambda: 'pong')
+        self.client = self.accounts.app.test_client()
+
+    def test_static_folders_are_set_up_by_the_first_request(self):
+        initializations = []
+        initialize_static_folders = self.accounts.initialize_static_folders
+        self.accounts.initialize_static_folders = lambda: initializations.append(initialize_static_folders())
+
+        self.assertFalse(self.accounts.static_folders_initialized)
+        for _ in range(3):
+            self.assertEqual(self.client.get('/ping').get_data(as_text=True), 'pong')
+
+        self.assertEqual(len(initializations), 1)
+        self.assertTrue(self.accounts.static_folders_initialized)
+
+    def test_mail_and_templates_are_set_up_when_first_used(self):
+        self.assertIsNone(self.accounts.mail)
+        self.assertIsNone(self.accounts.email_templates)
+
+        self.assertIs(self.accounts.get_mail(), self.accounts.get_mail())
+        self.assertIs(self.accounts.get_email_templates(), self.accounts.get_email_templates())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import os
+import shutil
+import smtplib
+import datetime
+import tempfile
+import unittest
+
+from flask_simple_accounts import models
+from flask_simple_accounts.mail_dispatcher import MailDispatcher
+from flask_simple_accounts.unit_of_work import unit_of_work
+
+from support import create_accounts, mail_config, wait_until, SMTPSink
+
+
+class FlakyMail:
+    """
+        Wraps flask_mail.Mail so the first `failures` sends raise.
+    """
+
+    def __init__(self, mail, failures):
+        self.mail = mail
+        self.failures = failures
+
+    def connect(self):
+        connection = self.mail.connect()
+        send = connection.send
+
+        def send_or_fail(message, *args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise smtplib.SMTPServerDisconnected('Connection dropped')
+            return send(message, *args, **kwargs)
+
+        connection.send = send_or_fail
+        return connection
+
+
+@unit_of_work
+def send_and_fail(accounts):
+    accounts.send_email('Welcome', 'accounts@example.com', ['rolled-back@example.com'], body='Hello')
+    return {'success': False, 'errors': ['Something went wrong']}
+
+
+@unit_of_work
+def send_and_succeed(accounts):
+    accounts.send_email('Welcome', 'accounts@example.com', ['committed@example.com'], body='Hello')
+    return {'success': True, 'errors': []}
+
+
+class MailDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.smtp_sink = SMTPSink('127.0.0.1').start()
+        # a database file, as an in-memory sqlite database is private to the thread that opened it
+        self.directory = tempfile.mkdtemp()
+        self.accounts = create_accounts(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'accounts.sqlite3'),
+            **mail_config(self.smtp_sink)
+        )
+        self.app = self.accounts.app
+        self.dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.stop(timeout=5)
+        self.smtp_sink.stop()
+        shutil.rmtree(self.directory)
+
+    def create_dispatcher(self, mail=None, **options):
+        options.setdefault('workers', 1)
+        options.setdefault('idle_seconds', 0.05)
+        dispatcher = MailDispatcher(self.app, mail or self.accounts.get_mail(), **options)
+        self.dispatchers.append(dispatcher)
+        return dispatcher
+
+    def payload(self, dispatcher, recipient):
+        return dispatcher.create_payload('Welcome', 'accounts@example.com', [recipient], body='Hello')
+
+    def test_sends_queued_messages_in_batches_over_one_connection(self):
+        dispatcher = self.create_dispatcher(batch_size=5)
+        for number in range(10):
+            dispatcher.enqueue(self.payload(dispatcher, 'user-{}@example.com'.format(number)))
+        dispatcher.start()
+
+        wait_until(lambda: dispatcher.stats()['sent'] == 10)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(len(self.smtp_sink.messages), 10)
+
+    def test_retries_a_failed_send_after_a_backoff(self):
+        dispatcher = self.create_dispatcher(mail=FlakyMail(self.accounts.get_mail(), failures=1), retry_backoff_seconds=0.01)
+        dispatcher.start()
+        dispatcher.enqueue(self.payload(dispatcher, 'retried@example.com'))
+
+        self.assertIsNotNone(self.smtp_sink.wait_for_message('retried@example.com', timeout=10))
+        wait_until(lambda: dispatcher.stats()['sent'] == 1)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(stats['failed'], 0)
+
+    def test_gives_up_after_max_retries(self):
+        dispatcher = self.create_dispatcher(mail=FlakyMail(self.accounts.get_mail(), failures=10), max_retries=2,
+                                            retry_backoff_seconds=0.01)
+        dispatcher.start()
+        dispatcher.enqueue(self.payload(dispatcher, 'lost@example.com'))
+
+        wait_until(lambda: dispatcher.stats()['failed'] == 1)
+        self.assertEqual(dispatcher.stats()['retried'], 2)
+        self.assertEqual(self.smtp_sink.messages, [])
+
+    def test_sends_outbox_rows_left_unsent_by_a_previous_process(self):
+        with self.app.app_context():
+            outbox_email = models.OutboxEmail('Welcome', 'accounts@example.com', ['stranded@example.com'], body='Hello')
+            outbox_email.time_created = datetime.datetime.now() - datetime.timedelta(hours=1)
+            models.db.session.add(outbox_email)
+            models.db.session.commit()
+            outbox_id = outbox_email.id
+
+        # a fresh dispatcher, as after a restart
+        dispatcher = self.create_dispatcher(db=models.db, outbox_model=models.OutboxEmail)
+        dispatcher.start()
+
+        self.assertIsNotNone(self.smtp_sink.wait_for_message('stranded@example.com', timeout=10))
+        wait_until(lambda: dispatcher.stats()['sent'] == 1)
+
+        def time_sent():
+            with self.app.app_context():
+                return models.OutboxEmail.query.get(outbox_id).time_sent
+
+        wait_until(lambda: time_sent() is not None)
+
+    def test_recent_outbox_rows_are_left_to_the_process_that_queued_them(self):
+        with self.app.app_context():
+            models.db.session.add(models.OutboxEmail('Welcome', 'accounts@example.com', ['queued@example.com'], body='Hello'))
+            models.db.session.commit()
+
+        dispatcher = self.create_dispatcher(db=models.db, outbox_model=models.OutboxEmail)
+        dispatcher.start()
+
+        self.assertEqual(dispatcher.stats()['enqueued'], 0)
+
+    def test_update_outbox_survives_a_database_error(self):
+        dispatcher = self.create_dispatcher(db=models.db, outbox_model=models.OutboxEmail)
+        with self.app.app_context():
+            models.OutboxEmail.__table__.drop(models.db.engine)
+            with self.assertLogs(self.app.logger, 'ERROR'):
+                dispatcher.update_outbox([1], {'time_sent': datetime.datetime.now()})
+
+        dispatcher.start()
+        dispatcher.enqueue(self.payload(dispatcher, 'after-error@example.com'))
+        self.assertIsNotNone(self.smtp_sink.wait_for_message('after-error@example.com', timeout=10))
+
+
+class QueuedSendEmailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.smtp_sink = SMTPSink('127.0.0.1').start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.accounts.mail_dispatcher.stop(timeout=5)
+        self.smtp_sink.stop()
+        shutil.rmtree(self.directory)
+
+    def create_accounts(self, **mail_queue):
+        mail_queue.update(enabled=True, workers=1, idle_seconds=0.05)
+        self.accounts = create_accounts(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'accounts.sqlite3'),
+            CUSTOM_MAIL_QUEUE=mail_queue,
+            **mail_config(self.smtp_sink)
+        )
+        return self.accounts
+
+    def test_rolled_back_operation_sends_nothing(self):
+        accounts = self.create_accounts()
+        with accounts.app.app_context():
+            send_and_fail(accounts)
+            send_and_succeed(accounts)
+
+        self.assertIsNotNone(self.smtp_sink.wait_for_message('committed@example.com', timeout=10))
+        recipients = [recipient.strip('<>') for message in self.smtp_sink.messages for recipient in message['recipients']]
+        self.assertEqual(recipients, ['committed@example.com'])
+        self.assertEqual(accounts.mail_dispatcher.stats()['enqueued'], 1)
+
+    def test_rolled_back_operation_leaves_no_outbox_row(self):
+        accounts = self.create_accounts(persistent_outbox=True)
+        with accounts.app.app_context():
+            send_and_fail(accounts)
+            send_and_succeed(accounts)
+
+        self.assertIsNotNone(self.smtp_sink.wait_for_message('committed@example.com', timeout=10))
+        with accounts.app.app_context():
+            self.assertEqual(models.OutboxEmail.query.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import copy
+import unittest
+
+from flask_simple_accounts.config import Config
+from flask_simple_accounts.password_policy import PasswordPolicy, PolicyFailure, PREFIX_LENGTH
+
+from support import create_accounts, PASSWORD
+
+
+class PasswordPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = PasswordPolicy(copy.deepcopy(Config.PASSWORD_REQUIREMENTS))
+
+    def test_valid_password(self):
+        self.assertTrue(self.policy.is_valid(PASSWORD))
+        self.assertEqual(self.policy.get_failures(PASSWORD), [])
+
+    def test_reports_every_unmet_rule(self):
+        password = 'a' * 20
+        self.assertFalse(self.policy.is_valid(password))
+        self.assertEqual(self.policy.get_failures(password), [
+            PolicyFailure('has_number', 4, 0),
+            PolicyFailure('has_upper_case', 4, 0),
+            PolicyFailure('has_special_character', 2, 0),
+        ])
+
+    def test_counts_characters_past_the_prefix(self):
+        password = 'aaaaBBBB1234' * PREFIX_LENGTH + '!!'
+        self.assertTrue(self.policy.is_valid(password))
+        self.assertFalse(self.policy.is_valid(password[:-1]))
+
+    def test_classifies_non_ascii_characters(self):
+        password = 'ÄÖÜäöüßéÉx٣٤٥٦!!'
+        self.assertTrue(self.policy.is_valid(password))
+        self.assertEqual(self.policy.get_failures(password[:-1] + 'x'), [PolicyFailure('has_special_character', 2, 1)])
+
+
+class StringHasMinimumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts()
+
+    def test_single_rule_checks(self):
+        self.assertTrue(self.accounts.string_has_minimum_length('abcd', 4))
+        self.assertTrue(self.accounts.string_has_minimum_letters('ab12', 2))
+        self.assertFalse(self.accounts.string_has_minimum_numbers('ab1', 2))
+        self.assertTrue(self.accounts.string_has_minimum_upper_case_characters('aBC', 2))
+        self.assertFalse(self.accounts.string_has_minimum_lower_case_characters('aBC', 2))
+        self.assertTrue(self.accounts.string_has_minimum_special_characters('a!?', 2, '!?'))
+        self.assertTrue(self.accounts.string_has_minimum('aaa', 3, lambda character: character == 'a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
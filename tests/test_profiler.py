@@ -0,0 +1,101 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import models, profiler
+from flask_simple_accounts.profiler import Profiler
+
+from support import create_accounts, PASSWORD
+
+
+class ProfiledOperationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.accounts = create_accounts(CUSTOM_PROFILING={
+            'enabled': True,
+            'sample_rate': 1.0,
+            'dump_dir': os.path.join(self.directory, 'profiles'),
+        })
+        app = self.accounts.app
+        app.add_url_rule('/sign_up', 'sign_up', lambda: jsonify(self.accounts.sign_up(request)), methods=['POST'])
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sampled_operation_is_reported_and_dumped(self):
+        self.client.post('/sign_up', data={'email': 'user@example.com', 'password': PASSWORD})
+
+        report, = self.accounts.profiler.get_reports('sign_up')
+        self.assertTrue(report['success'])
+        self.assertGreater(report['queries']['count'], 0)
+        self.assertTrue(report['functions'])
+        self.assertEqual(sorted(name.rsplit('.', 1)[1] for name in os.listdir(os.path.join(self.directory, 'profiles'))),
+                         ['json', 'pstats'])
+        self.assertEqual(self.accounts.get_profiling_stats()['dumped'], 1)
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.accounts = create_accounts()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def count_users(self):
+        with self.accounts.app.app_context():
+            return models.User.query.count()
+
+    def test_dump_failure_is_counted_and_keeps_the_report(self):
+        dump_dir = os.path.join(self.directory, 'profiles')
+        sampling_profiler = Profiler(sample_rate=1.0, trace_allocations=False, dump_dir=dump_dir)
+        # a file where the directory was, so writing the dump fails
+        os.rmdir(dump_dir)
+        open(dump_dir, 'w').close()
+
+        self.assertEqual(sampling_profiler.run_operation('count_users', self.count_users), 0)
+
+        stats = sampling_profiler.stats()
+        self.assertEqual((stats['reports'], stats['dumped'], stats['dump_failures']), (1, 0, 1))
+
+    def test_dump_failure_does_not_hide_the_operation_error(self):
+        dump_dir = os.path.join(self.directory, 'profiles')
+        sampling_profiler = Profiler(sample_rate=1.0, trace_allocations=False, dump_dir=dump_dir)
+        os.rmdir(dump_dir)
+        open(dump_dir, 'w').close()
+
+        def fail():
+            raise KeyError('missing')
+
+        with self.assertRaises(KeyError):
+            sampling_profiler.run_operation('fail', fail)
+        self.assertEqual(sampling_profiler.stats()['dump_failures'], 1)
+
+    def test_call_sampled_while_another_is_profiled_is_skipped(self):
+        sampling_profiler = Profiler(sample_rate=1.0, trace_allocations=False)
+
+        with profiler.profiling_lock:
+            self.assertEqual(sampling_profiler.run_operation('count_users', self.count_users), 0)
+
+        stats = sampling_profiler.stats()
+        self.assertEqual((stats['sampled'], stats['skipped']), (0, 1))
+        self.assertEqual(sampling_profiler.run_operation('count_users', self.count_users), 0)
+        self.assertEqual(sampling_profiler.stats()['sampled'], 1)
+
+    def test_traces_allocations(self):
+        sampling_profiler = Profiler(sample_rate=1.0, trace_allocations=True)
+        sampling_profiler.run_operation('allocate', lambda: [bytes(1000) for _ in range(100)])
+
+        report, = sampling_profiler.get_reports()
+        self.assertTrue(report['allocations'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts.rate_limiter import MemoryRateLimiter, SQLiteRateLimiter
+
+from support import create_accounts, PASSWORD
+
+
+class RateLimiterTests:
+    """
+        Run against each backend by the TestCase subclasses below.
+    """
+
+    def create_rate_limiter(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rate_limiter = self.create_rate_limiter()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_admits_a_burst_then_waits_for_the_refill(self):
+        for _ in range(3):
+            self.assertEqual(self.rate_limiter.take('email:user', 3, 0.5), 0.0)
+
+        wait_seconds = self.rate_limiter.take('email:user', 3, 0.5)
+        self.assertGreater(wait_seconds, 0)
+        self.assertLessEqual(wait_seconds, 2.0)
+        # other keys have buckets of their own
+        self.assertEqual(self.rate_limiter.take('email:other', 3, 0.5), 0.0)
+
+    def test_refills_over_time(self):
+        self.assertEqual(self.rate_limiter.take('ip:1', 1, 1000), 0.0)
+        time.sleep(0.01)
+        self.assertEqual(self.rate_limiter.take('ip:1', 1, 1000), 0.0)
+
+    def test_refund_gives_a_token_back(self):
+        for _ in range(3):
+            self.rate_limiter.take('email:user', 3, 0)
+        self.assertEqual(self.rate_limiter.take('email:user', 3, 0), float('inf'))
+
+        self.rate_limiter.refund('email:user', 3)
+        self.assertEqual(self.rate_limiter.take('email:user', 3, 0), 0.0)
+
+    def test_refund_never_goes_past_capacity(self):
+        self.rate_limiter.take('email:user', 2, 0)
+        for _ in range(5):
+            self.rate_limiter.refund('email:user', 2)
+
+        self.assertEqual([self.rate_limiter.take('email:user', 2, 0) for _ in range(3)], [0.0, 0.0, float('inf')])
+
+
+class MemoryRateLimiterTest(RateLimiterTests, unittest.TestCase):
+
+    def create_rate_limiter(self):
+        return MemoryRateLimiter(max_keys=100)
+
+    def test_drops_the_least_recently_used_buckets(self):
+        rate_limiter = MemoryRateLimiter(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            rate_limiter.take(key, 1, 0)
+        self.assertEqual(rate_limiter.stats()['keys'], 2)
+        self.assertEqual(rate_limiter.take('a', 1, 0), 0.0)
+
+
+class SQLiteRateLimiterTest(RateLimiterTests, unittest.TestCase):
+
+    def create_rate_limiter(self):
+        return SQLiteRateLimiter(os.path.join(self.directory, 'rate_limits.sqlite3'), idle_seconds=60)
+
+    def test_buckets_are_shared_between_instances(self):
+        path = os.path.join(self.directory, 'rate_limits.sqlite3')
+        self.rate_limiter.take('email:user', 1, 0)
+        self.assertEqual(SQLiteRateLimiter(path).take('email:user', 1, 0), float('inf'))
+
+    def test_purges_idle_buckets(self):
+        self.rate_limiter.take('email:user', 1, 0)
+        self.assertEqual(self.rate_limiter.purge_idle(), 0)
+
+        self.rate_limiter.idle_seconds = -1
+        self.assertEqual(self.rate_limiter.purge_idle(), 1)
+        self.assertEqual(self.rate_limiter.stats()['keys'], 0)
+
+
+class LogInThrottlingTests:
+    """
+        Password attempts through log_in, for each backend.
+    """
+
+    backend = None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.accounts = create_accounts(CUSTOM_RATE_LIMITING={
+            'enabled': True,
+            'backend': self.backend,
+            'sqlite_path': os.path.join(self.directory, 'rate_limits.sqlite3'),
+            'per_ip': {'capacity': 100, 'refill_per_second': 0},
+            'per_email': {'capacity': 3, 'refill_per_second': 1 / 3600},
+        })
+        app = self.accounts.app
+        for name in ('sign_up', 'log_in', 'log_out'):
+            operation = getattr(self.accounts, name)
+            app.add_url_rule('/' + name, name, (lambda operation: lambda: jsonify(operation(request)))(operation), methods=['POST'])
+        self.client = app.test_client()
+        self.post('/sign_up', email='user@example.com', password=PASSWORD)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def post(self, path, **data):
+        return json.loads(self.client.post(path, data=data).get_data(as_text=True))
+
+    def log_in(self, password, email='user@example.com'):
+        response = self.post('/log_in', email=email, password=password)
+        if response['success']:
+            self.post('/log_out')
+        return response
+
+    def test_wrong_passwords_run_out_of_attempts(self):
+        for _ in range(3):
+            self.assertEqual(self.log_in('wrong')['errors'], ['Invalid log in'])
+
+        response = self.log_in(PASSWORD)
+        self.assertFalse(response['success'])
+        self.assertEqual(response['status_code'], 429)
+        self.assertIn('retry_after', response)
+        # the email is throttled, not the client
+        self.assertEqual(self.log_in('wrong', email='other@example.com')['errors'], ['Invalid log in'])
+
+    def test_correct_passwords_refund_their_attempt(self):
+        for _ in range(10):
+            self.assertTrue(self.log_in(PASSWORD)['success'])
+
+        stats = self.accounts.get_rate_limit_stats()['attempts']
+        self.assertEqual(stats['rejected'], {})
+
+    def test_bucket_that_never_refills_has_no_retry_after(self):
+        self.accounts.app.config['RATE_LIMITING']['per_email']['refill_per_second'] = 0
+        for _ in range(3):
+            self.log_in('wrong')
+
+        response = self.log_in(PASSWORD)
+        self.assertEqual(response['status_code'], 429)
+        self.assertNotIn('retry_after', response)
+
+
+class MemoryLogInThrottlingTest(LogInThrottlingTests, unittest.TestCase):
+    backend = 'memory'
+
+
+class SQLiteLogInThrottlingTest(LogInThrottlingTests, unittest.TestCase):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
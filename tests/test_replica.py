@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import hashers
+
+from support import create_accounts, PASSWORD
+
+
+REPLICA_PASSWORD = PASSWORD + 'Replica'
+
+
+class ReadReplicaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary_path = os.path.join(self.directory, 'primary.sqlite3')
+        self.replica_path = os.path.join(self.directory, 'replica.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_accounts(self, **read_replica):
+        read_replica.update(enabled=True, database_uri='sqlite:///' + self.replica_path)
+        self.accounts = create_accounts(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + self.primary_path,
+            CUSTOM_READ_REPLICA=read_replica,
+        )
+        app = self.accounts.app
+        for name in ('sign_up', 'log_in', 'log_out'):
+            operation = getattr(self.accounts, name)
+            app.add_url_rule('/' + name, name, (lambda operation: lambda: jsonify(operation(request)))(operation), methods=['POST'])
+        return self.accounts
+
+    def post(self, client, path, **data):
+        return json.loads(client.post(path, data=data).get_data(as_text=True))
+
+    def sign_up(self, email):
+        self.assertTrue(self.post(self.accounts.app.test_client(), '/sign_up', email=email, password=PASSWORD)['success'])
+
+    def replicate(self):
+        shutil.copyfile(self.primary_path, self.replica_path)
+
+    def change_replica_password(self, email, password):
+        # only the replica has the new password, so a log in with it shows where the lookup went
+        connection = sqlite3.connect(self.replica_path)
+        with connection:
+            connection.execute(
+                'UPDATE user SET password_hash = ? WHERE email = ?',
+                (hashers.get_hasher(hashers.BcryptHasher.algorithm).encode(password), email)
+            )
+        connection.close()
+
+    def log_in(self, email, password, client=None):
+        return self.post(client or self.accounts.app.test_client(), '/log_in', email=email, password=password)['success']
+
+    def replica_stats(self):
+        with self.accounts.app.app_context():
+            return self.accounts.get_replica_stats()
+
+    def test_log_in_reads_the_replica(self):
+        self.create_accounts(sticky_seconds=0)
+        self.sign_up('user@example.com')
+        self.replicate()
+        self.change_replica_password('user@example.com', REPLICA_PASSWORD)
+
+        self.assertTrue(self.log_in('user@example.com', REPLICA_PASSWORD))
+        self.assertFalse(self.log_in('user@example.com', PASSWORD))
+        self.assertGreaterEqual(self.replica_stats()['replica_reads'], 2)
+
+    def test_recently_written_users_are_read_from_the_primary(self):
+        self.create_accounts(sticky_seconds=60)
+        self.replicate()
+        client = self.accounts.app.test_client()
+        self.assertTrue(self.post(client, '/sign_up', email='user@example.com', password=PASSWORD)['success'])
+
+        self.assertTrue(self.log_in('user@example.com', PASSWORD, client))
+        self.assertEqual(self.replica_stats()['replica_reads'], 0)
+        self.assertGreater(self.replica_stats()['sticky_reads'], 0)
+
+    def test_users_missing_from_the_replica_fall_back_to_the_primary(self):
+        self.create_accounts(sticky_seconds=0)
+        self.replicate()
+        self.sign_up('user@example.com')
+
+        self.assertTrue(self.log_in('user@example.com', PASSWORD))
+        self.assertGreater(self.replica_stats()['replica_misses'], 0)
+
+    def test_without_fallback_a_lagging_replica_fails_the_log_in(self):
+        self.create_accounts(sticky_seconds=0, fallback_to_primary=False)
+        self.replicate()
+        self.sign_up('user@example.com')
+
+        self.assertFalse(self.log_in('user@example.com', PASSWORD))
+
+
+if __name__ == '__main__':
+    unittest.main()
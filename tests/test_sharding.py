@@ -0,0 +1,67 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from flask import request, jsonify
+
+from support import create_accounts, PASSWORD
+
+
+BINDS = ['users-0', 'users-1']
+
+
+class ShardedChangeEmailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.accounts = create_accounts(
+            SQLALCHEMY_BINDS={
+                bind: 'sqlite:///' + os.path.join(self.directory, bind + '.sqlite3') for bind in BINDS
+            },
+            CUSTOM_SHARDING={'enabled': True, 'binds': BINDS},
+        )
+        app = self.accounts.app
+        with app.app_context():
+            self.accounts.create_shard_tables()
+
+        for name in ('sign_up', 'log_in', 'log_out', 'change_email'):
+            operation = getattr(self.accounts, name)
+            app.add_url_rule('/' + name, name, (lambda operation: lambda: jsonify(operation(request)))(operation), methods=['POST'])
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def post(self, path, **data):
+        return json.loads(self.client.post(path, data=data).get_data(as_text=True))
+
+    def email_in_shard(self, shard, prefix):
+        router = self.accounts.shard_router
+        return next(
+            email for email in ('{}{}@example.com'.format(prefix, number) for number in range(100))
+            if router.shard_for_email(email) == shard
+        )
+
+    def shard_emails(self, shard):
+        User = self.accounts.models.User
+        with self.accounts.app.app_context(), self.accounts.use_shard(shard):
+            return [email for email, in self.accounts.db.session.query(User.email)]
+
+    def test_change_email_without_verification_moves_the_user_to_the_new_shard(self):
+        old_email = self.email_in_shard(0, 'old')
+        new_email = self.email_in_shard(1, 'new')
+
+        self.assertTrue(self.post('/sign_up', email=old_email, password=PASSWORD)['success'])
+        self.assertTrue(self.post('/log_in', email=old_email, password=PASSWORD)['success'])
+        self.assertTrue(self.post('/change_email', new_email=new_email)['success'])
+
+        self.assertEqual(self.shard_emails(0), [])
+        self.assertEqual(self.shard_emails(1), [new_email])
+        self.assertTrue(self.post('/log_in', email=new_email, password=PASSWORD)['success'])
+        self.assertFalse(self.post('/log_in', email=old_email, password=PASSWORD)['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
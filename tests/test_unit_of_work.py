@@ -0,0 +1,84 @@
+import json
+import smtplib
+import unittest
+
+from flask import request, jsonify
+
+from flask_simple_accounts import models
+from flask_simple_accounts.unit_of_work import query_counter
+
+from support import create_accounts, PASSWORD
+
+
+OPERATIONS = ('sign_up', 'log_in', 'log_out', 'change_email', 'change_password', 'delete_account')
+NEW_PASSWORD = PASSWORD + 'Zz'
+
+
+class UnitOfWorkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = create_accounts()
+        app = self.accounts.app
+        for name in OPERATIONS:
+            operation = getattr(self.accounts, name)
+            app.add_url_rule('/' + name, name, (lambda operation: lambda: jsonify(operation(request)))(operation), methods=['POST'])
+        self.client = app.test_client()
+
+    def post(self, path, **data):
+        response = json.loads(self.client.post(path, data=data).get_data(as_text=True))
+        return response, query_counter.last_operation()
+
+    def user_emails(self):
+        with self.accounts.app.app_context():
+            return [email for email, in models.db.session.query(models.User.email)]
+
+    def test_each_operation_commits_once(self):
+        steps = [
+            ('/sign_up', {'email': 'deleted@example.com', 'password': PASSWORD}),
+            ('/log_in', {'email': 'deleted@example.com', 'password': PASSWORD}),
+            ('/log_out', {}),
+            ('/log_in', {'email': 'deleted@example.com', 'password': PASSWORD}),
+            ('/delete_account', {'email': 'deleted@example.com', 'password': PASSWORD}),
+            ('/sign_up', {'email': 'user@example.com', 'password': PASSWORD}),
+            ('/log_in', {'email': 'user@example.com', 'password': PASSWORD}),
+            ('/change_password', {'current_password': PASSWORD, 'new_password': NEW_PASSWORD}),
+            ('/change_email', {'new_email': 'changed@example.com'}),
+        ]
+        for path, data in steps:
+            response, operation = self.post(path, **data)
+            self.assertTrue(response['success'], (path, response))
+            self.assertEqual(operation['operation'], path[1:])
+            self.assertEqual(operation['commits'], 1, path)
+
+        self.assertEqual(self.user_emails(), ['changed@example.com'])
+
+    def test_failed_operation_writes_nothing(self):
+        self.post('/sign_up', email='user@example.com', password=PASSWORD)
+        self.post('/log_in', email='user@example.com', password=PASSWORD)
+
+        response, operation = self.post('/change_password', current_password=PASSWORD, new_password='too short')
+
+        self.assertFalse(response['success'])
+        self.assertEqual(operation['commits'], 0)
+        self.post('/log_out')
+        self.assertTrue(self.post('/log_in', email='user@example.com', password=PASSWORD)[0]['success'])
+
+    def test_operation_that_raises_is_rolled_back(self):
+        self.accounts.app.config['EMAIL_VERIFICATION']['enabled'] = True
+        # the error reaches the test instead of becoming a 500
+        self.accounts.app.testing = True
+
+        def send_email(*args, **kwargs):
+            raise smtplib.SMTPServerDisconnected('Connection dropped')
+
+        self.accounts.send_email = send_email
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.client.post('/sign_up', data={'email': 'user@example.com', 'password': PASSWORD})
+
+        with self.accounts.app.app_context():
+            self.assertEqual(models.User.query.count(), 0)
+            self.assertEqual(models.EmailVerification.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()